@@ -0,0 +1,167 @@
+"""
+NetBox simulado para os benchmarks
+
+Guarda os objetos em memória e atende o subconjunto da API REST usado por
+scripts/awx_to_netbox_sync.py: listagens paginadas com filtros exatos (e
+`?tag=` pelo slug), `?fields=` e `?brief=`, e criação, atualização e remoção em lote (lista no
+corpo). Chaves estrangeiras voltam aninhadas ({'id': ...}) e `status` como
+escolha ({'value', 'label'}), como no NetBox real.
+"""
+
+import itertools
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List
+from urllib.parse import urlencode
+
+from stub_server import StubApplication
+
+FOREIGN_KEYS = ('site', 'cluster', 'type', 'virtual_machine', 'primary_ip4', 'primary_ip6', 'tenant', 'role', 'platform')
+CHOICE_FIELDS = ('status',)
+# Referências validadas na gravação, como o NetBox faz com IDs de objetos relacionados
+RELATED = {'site': 'dcim/sites/', 'cluster': 'virtualization/clusters/'}
+# Nomes únicos por tipo, como as restrições do NetBox em que o sync se apoia
+UNIQUE_NAMES = ('dcim/sites/', 'virtualization/cluster-types/', 'virtualization/clusters/')
+DEFAULTS = {
+    'virtualization/virtual-machines/': {'custom_fields': {}, 'primary_ip4': None, 'primary_ip6': None, 'comments': ''},
+    'ipam/ip-addresses/': {'assigned_object_type': None, 'assigned_object_id': None},
+}
+CONTROL_PARAMS = ('limit', 'offset', 'fields', 'brief', 'ordering')
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+
+_PATH = re.compile(r'^/api/([a-z-]+/[a-z-]+/)(?:(\d+)/)?$')
+
+
+def _render(obj: Dict[str, Any]) -> Dict[str, Any]:
+    rendered = dict(obj)
+    for field in FOREIGN_KEYS:
+        if isinstance(rendered.get(field), int):
+            rendered[field] = {'id': rendered[field]}
+    for field in CHOICE_FIELDS:
+        if isinstance(rendered.get(field), str):
+            rendered[field] = {'value': rendered[field], 'label': rendered[field].capitalize()}
+    return rendered
+
+
+def _matches(obj: Dict[str, Any], field: str, values: List[str]) -> bool:
+    if field.startswith('cf_'):
+        value = (obj.get('custom_fields') or {}).get(field[3:])
+    else:
+        value = obj.get(field[:-3] if field.endswith('_id') and field[:-3] in obj else field)
+    return str(value) in values
+
+
+class FakeNetBox(StubApplication):
+    """Objetos do NetBox em memória, por endpoint"""
+
+    def __init__(self):
+        self.objects: Dict[str, Dict[int, Dict[str, Any]]] = defaultdict(dict)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.objects.clear()
+
+    def count(self, path: str) -> int:
+        return len(self.objects.get(path, {}))
+
+    def handle(self, method, path, query, body, headers, base_url):
+        if path == '/api/status/':
+            return 'status/', 200, {'netbox-version': '4.0-bench'}
+        match = _PATH.match(path)
+        if not match:
+            return 'other', 404, {'detail': 'Not found.'}
+        endpoint, object_id = match.group(1), match.group(2)
+        route = f"{endpoint}{{id}}/" if object_id else endpoint
+        with self._lock:
+            objects = self.objects[endpoint]
+            if method == 'GET':
+                if object_id:
+                    obj = objects.get(int(object_id))
+                    return (route, 200, _render(obj)) if obj else (route, 404, {'detail': 'Not found.'})
+                return route, 200, self._list(endpoint, objects, query, base_url)
+            if method == 'POST':
+                return (route,) + self._create(endpoint, objects, body)
+            if method in ('PATCH', 'PUT'):
+                items = [dict(body or {}, id=int(object_id))] if object_id else body
+                return (route,) + self._update(objects, items, single=bool(object_id))
+            if method == 'DELETE':
+                items = [{'id': int(object_id)}] if object_id else body or []
+                missing = [item.get('id') for item in items if item.get('id') not in objects]
+                if missing:
+                    return route, 404, {'detail': f"Objetos inexistentes: {missing}"}
+                for item in items:
+                    del objects[item['id']]
+                return route, 204, None
+        return route, 405, {'detail': f"Method \"{method}\" not allowed."}
+
+    def _list(self, endpoint, objects, query, base_url):
+        results = list(objects.values())
+        for field, values in query.items():
+            if field == 'tag':
+                # Filtro pelo slug da tag; as VMs guardam as tags como referências ({'id': ...})
+                tag_ids = {tag['id'] for tag in self.objects['extras/tags/'].values() if tag.get('slug') in values}
+                results = [obj for obj in results if any(tag.get('id') in tag_ids for tag in obj.get('tags') or [])]
+            elif field not in CONTROL_PARAMS:
+                results = [obj for obj in results if _matches(obj, field, values)]
+        limit = min(int((query.get('limit') or [DEFAULT_LIMIT])[0]) or MAX_LIMIT, MAX_LIMIT)
+        offset = int((query.get('offset') or [0])[0])
+        page = results[offset:offset + limit]
+
+        if query.get('brief', [''])[0] in ('1', 'true', 'True'):
+            page = [{'id': obj['id'], 'name': obj.get('name')} for obj in page]
+        elif query.get('fields'):
+            fields = query['fields'][0].split(',')
+            page = [{field: obj.get(field) for field in fields} for obj in page]
+        page = [_render(obj) for obj in page]
+
+        next_url = None
+        if offset + limit < len(results):
+            next_query = dict(query, offset=[str(offset + limit)], limit=[str(limit)])
+            next_url = f"{base_url}/api/{endpoint}?{urlencode(next_query, doseq=True)}"
+        return {'count': len(results), 'next': next_url, 'previous': None, 'results': page}
+
+    def _reference_errors(self, items):
+        """Erros por objeto (como no NetBox) quando um site/cluster informado por ID não existe"""
+        errors = [
+            {field: [f"Related object not found using the provided numeric ID: {item[field]}"]
+             for field, endpoint in RELATED.items()
+             if isinstance(item.get(field), int) and item[field] not in self.objects[endpoint]}
+            for item in items
+        ]
+        return errors if any(errors) else None
+
+    def _create(self, endpoint, objects, body):
+        items = body if isinstance(body, list) else [body]
+        if not all(isinstance(item, dict) for item in items):
+            return 400, {'detail': 'Corpo inválido'}
+        errors = self._reference_errors(items)
+        if errors:
+            return 400, errors if isinstance(body, list) else errors[0]
+        if endpoint in UNIQUE_NAMES:
+            existing = {obj.get('name') for obj in objects.values()}
+            names = [item.get('name') for item in items]
+            duplicated = [name for name in names if name in existing or names.count(name) > 1]
+            if duplicated:
+                return 400, [{'name': [f"{endpoint} with this name already exists."]} for _ in items]
+        created = []
+        for item in items:
+            obj = dict(DEFAULTS.get(endpoint, {}), **item, id=next(self._ids))
+            objects[obj['id']] = obj
+            created.append(_render(obj))
+        return 201, created if isinstance(body, list) else created[0]
+
+    def _update(self, objects, items, single):
+        if not isinstance(items, list) or any(item.get('id') not in objects for item in items):
+            return 400, {'detail': 'Objetos inexistentes ou sem id'}
+        errors = self._reference_errors(items)
+        if errors:
+            return 400, errors[0] if single else errors
+        updated = []
+        for item in items:
+            objects[item['id']].update(item)
+            updated.append(_render(objects[item['id']]))
+        return 200, updated[0] if single else updated
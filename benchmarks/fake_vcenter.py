@@ -0,0 +1,254 @@
+"""
+vCenter simulado para os benchmarks
+
+Duas partes, cobrindo o que o vmware_dynamic usa do vCenter:
+
+- FakeVCenterStub substitui o SoapStubAdapter do pyVmomi. Os objetos são os
+  tipos reais do pyVmomi (vim.VirtualMachine, PropertyCollector...), então o
+  plugin roda sem alterações; as chamadas SOAP (RetrieveServiceContent,
+  CreateContainerView, RetrievePropertiesEx/ContinueRetrievePropertiesEx...)
+  são atendidas em memória a partir da frota sintética, com latência por
+  chamada. Atende o modo de coleta property_collector (padrão); os modos
+  legacy e incremental não são simulados.
+- VCenterTaggingApp é a API REST de tags (/rest/com/vmware/cis/...), servida
+  por um StubServer com TLS: sessão, categorias, tags e as ações de
+  tag-association em lote e por VM.
+"""
+
+import collections
+import itertools
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from pyVmomi import vim, vmodl
+
+from fleet import DATACENTER, DATACENTER_ID, ROOT_FOLDER, VM_FOLDER, Fleet
+from stub_server import StubApplication
+
+SESSION_ID = 'bench-session'
+DEFAULT_MAX_OBJECTS = 100
+
+_PropertyCollector = vmodl.query.PropertyCollector
+
+
+class FakeVCenterStub:
+    """Atende as chamadas SOAP do pyVmomi em memória, contando cada método"""
+
+    def __init__(self, fleet: Fleet, latency: float = 0.0):
+        self.fleet = fleet
+        self.latency = latency
+        self.calls: collections.Counter = collections.Counter()
+        self.cookie = 'vmware_soap_session="bench"'
+        self.version = 'vim.version.v8_0_2_0'
+        self._lock = threading.Lock()
+        self._views: Dict[str, str] = {}  # moref da ContainerView -> tipo de conteúdo
+        self._results: Dict[str, Tuple[str, List[str], int, int]] = {}
+        self._sequence = itertools.count(1)
+        self._entities = fleet.entities()
+        self._entity_types = {moref: kind for moref, kind, _, _ in self._entities}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _ref(self, moref: Optional[str]):
+        if moref is None:
+            return None
+        if moref.startswith('vm-'):
+            return vim.VirtualMachine(moref, self)
+        return getattr(vim, self._entity_types.get(moref, 'ManagedEntity'))(moref, self)
+
+    # Métodos (pelo nome WSDL)
+
+    def InvokeMethod(self, mo, info, args):
+        self._count(info.wsdlName)
+        handler = getattr(self, f"_method_{info.wsdlName}", None)
+        if handler is None:
+            raise NotImplementedError(f"{info.wsdlName} não é simulado pelo vCenter de benchmark")
+        return handler(mo, *args)
+
+    def _method_RetrieveServiceContent(self, mo):
+        return vim.ServiceInstanceContent(
+            about=vim.AboutInfo(version='8.0.2', build='22617221', apiVersion='8.0.2.0', fullName='vCenter (benchmark)'),
+            rootFolder=vim.Folder(ROOT_FOLDER, self),
+            propertyCollector=_PropertyCollector('propertyCollector', self),
+            viewManager=vim.view.ViewManager('ViewManager', self),
+        )
+
+    def _method_CreateContainerView(self, mo, container, types, recursive):
+        if vim.VirtualMachine in types:
+            kind = 'vms'
+        elif list(types) == [vim.Datacenter]:
+            kind = 'datacenters'
+        else:
+            kind = 'entities'
+        moref = f"session[bench]view-{next(self._sequence)}"
+        with self._lock:
+            self._views[moref] = kind
+        return vim.view.ContainerView(moref, self)
+
+    def _method_DestroyView(self, mo):
+        with self._lock:
+            self._views.pop(mo._moId, None)
+
+    def _method_RetrievePropertiesEx(self, mo, spec_set, options):
+        spec = spec_set[0]
+        kind = self._views[spec.objectSet[0].obj._moId]
+        page_size = (options.maxObjects if options else None) or DEFAULT_MAX_OBJECTS
+        return self._page(kind, list(spec.propSet[0].pathSet), 0, page_size)
+
+    def _method_ContinueRetrievePropertiesEx(self, mo, token):
+        with self._lock:
+            kind, path_set, offset, page_size = self._results.pop(token)
+        return self._page(kind, path_set, offset, page_size)
+
+    def _method_CancelRetrievePropertiesEx(self, mo, token):
+        with self._lock:
+            self._results.pop(token, None)
+
+    def _page(self, kind: str, path_set: List[str], offset: int, page_size: int):
+        total = self.fleet.vms if kind == 'vms' else len(self._entities)
+        end = min(offset + page_size, total)
+        if kind == 'vms':
+            objects = [self._vm_content(index, path_set) for index in range(offset, end)]
+        else:
+            objects = [self._entity_content(entity, path_set) for entity in self._entities[offset:end]]
+        token = None
+        if end < total:
+            token = f"token-{next(self._sequence)}"
+            with self._lock:
+                self._results[token] = (kind, path_set, end, page_size)
+        return _PropertyCollector.RetrieveResult(objects=objects, token=token)
+
+    def _entity_content(self, entity, path_set):
+        moref, kind, name, parent = entity
+        values = {'name': name, 'parent': self._ref(parent)}
+        return _PropertyCollector.ObjectContent(obj=self._ref(moref), propSet=[
+            vmodl.DynamicProperty(name=path, val=values[path]) for path in path_set if values.get(path) is not None
+        ])
+
+    def _vm_content(self, index: int, path_set: List[str]):
+        vm = self.fleet.vm(index)
+        values = {
+            'name': vm['name'],
+            'parent': self._ref(vm['parent']),
+            'config.template': vm['template'],
+            'config.uuid': vm['uuid'],
+            'config.guestFullName': vm['guest_full_name'],
+            'config.hardware.device': vim.vm.device.VirtualDevice.Array([
+                vim.vm.device.VirtualDisk(key=2000, capacityInKB=vm['disk_kb'])
+            ]),
+            'summary.config.numCpu': vm['num_cpu'],
+            'summary.config.memorySizeMB': vm['memory_mb'],
+            'runtime.powerState': vm['power_state'],
+            'runtime.host': self._ref(vm['host']),
+            'guest.guestFamily': vm['guest_family'],
+            'guest.hostName': vm['host_name'],
+            'guest.toolsStatus': vm['tools_status'],
+            'guest.net': vim.vm.GuestInfo.NicInfo.Array([
+                vim.vm.GuestInfo.NicInfo(ipAddress=vm['ip_addresses'])
+            ]) if vm['ip_addresses'] else None,
+        }
+        return _PropertyCollector.ObjectContent(obj=vim.VirtualMachine(self.fleet.vm_moref(index), self), propSet=[
+            vmodl.DynamicProperty(name=path, val=values[path]) for path in path_set if values.get(path) is not None
+        ])
+
+    # Propriedades lidas diretamente (atributos dos objetos gerenciados)
+
+    def InvokeAccessor(self, mo, info):
+        self._count(f"{type(mo).__name__.split('.')[-1]}.{info.name}")
+        if isinstance(mo, vim.view.ContainerView) and info.name == 'view':
+            kind = self._views[mo._moId]
+            if kind == 'datacenters':
+                return [vim.Datacenter(DATACENTER_ID, self)]
+            if kind == 'vms':
+                return [vim.VirtualMachine(self.fleet.vm_moref(index), self) for index in range(self.fleet.vms)]
+            return [self._ref(moref) for moref, _, _, _ in self._entities]
+        if mo._moId == DATACENTER_ID and info.name == 'name':
+            return DATACENTER
+        if mo._moId == DATACENTER_ID and info.name == 'vmFolder':
+            return vim.Folder(VM_FOLDER, self)
+        raise NotImplementedError(f"{type(mo).__name__}.{info.name} não é simulado pelo vCenter de benchmark")
+
+
+def install(plugin_module, fleet: Fleet, latency: float = 0.0) -> FakeVCenterStub:
+    """Substitui SmartConnect/Disconnect do módulo do plugin por conexões ao vCenter simulado"""
+    stub = FakeVCenterStub(fleet, latency)
+
+    def smart_connect(**kwargs):
+        return vim.ServiceInstance('ServiceInstance', stub)
+
+    plugin_module.SmartConnect = smart_connect
+    plugin_module.Disconnect = lambda si: None
+    return stub
+
+
+_TAG_ID = re.compile(r'bench-(\d+)')
+_ACTION = re.compile(r'^/rest/com/vmware/cis/tagging/tag-association$')
+_DETAIL = re.compile(r'^/rest/com/vmware/cis/tagging/(tag|category)/id:(.+)$')
+
+
+class VCenterTaggingApp(StubApplication):
+    """API REST de tags do vCenter (formato /rest, respostas em 'value')"""
+
+    def __init__(self, fleet: Fleet):
+        self.fleet = fleet
+        self._objects_on_tag: Dict[int, List[str]] = collections.defaultdict(list)
+        for index in range(fleet.vms):
+            for tag_index in fleet.vm_tag_indexes(index):
+                self._objects_on_tag[tag_index].append(fleet.vm_moref(index))
+
+    def _vm_tags(self, moref: str) -> List[str]:
+        index = int(moref.split('-', 1)[1]) - 1000
+        if not 0 <= index < self.fleet.vms:
+            return []
+        return [self.fleet.tag_id(tag_index) for tag_index in self.fleet.vm_tag_indexes(index)]
+
+    def handle(self, method, path, query, body, headers, base_url):
+        if path == '/rest/com/vmware/cis/session':
+            return 'session', 200, {'value': SESSION_ID} if method == 'POST' else None
+        if not path.startswith('/rest/'):
+            return 'other', 404, {'type': 'com.vmware.vapi.std.errors.not_found'}
+        if headers.get('vmware-api-session-id') != SESSION_ID:
+            return 'unauthenticated', 401, {'type': 'com.vmware.vapi.std.errors.unauthenticated'}
+
+        if method == 'GET' and path == '/rest/com/vmware/cis/tagging/category':
+            return 'category list', 200, {'value': [self.fleet.category_id(i) for i in range(self.fleet.categories)]}
+        if method == 'GET' and path == '/rest/com/vmware/cis/tagging/tag':
+            return 'tag list', 200, {'value': [self.fleet.tag_id(i) for i in range(self.fleet.tags)]}
+
+        detail = _DETAIL.match(path)
+        if method == 'GET' and detail:
+            kind, object_id = detail.groups()
+            match = _TAG_ID.search(object_id)
+            index = int(match.group(1)) if match else -1
+            limit = self.fleet.tags if kind == 'tag' else self.fleet.categories
+            if not 0 <= index < limit:
+                return f"{kind} detail", 404, {'type': 'com.vmware.vapi.std.errors.not_found'}
+            return f"{kind} detail", 200, {'value': self.fleet.tag(index) if kind == 'tag' else self.fleet.category(index)}
+
+        if method == 'POST' and _ACTION.match(path):
+            action = (query.get('~action') or [''])[0]
+            body = body or {}
+            if action == 'list-attached-objects-on-tags':
+                result = []
+                for tag_id in body.get('tag_ids', []):
+                    match = _TAG_ID.search(tag_id)
+                    morefs = self._objects_on_tag.get(int(match.group(1)), []) if match else []
+                    result.append({'tag_id': tag_id, 'object_ids': [
+                        {'type': 'VirtualMachine', 'id': moref} for moref in morefs
+                    ]})
+                return action, 200, {'value': result}
+            if action == 'list-attached-tags-on-objects':
+                return action, 200, {'value': [
+                    {'object_id': object_id, 'tag_ids': self._vm_tags(object_id.get('id', ''))}
+                    for object_id in body.get('object_ids', [])
+                ]}
+            if action == 'list-attached-tags':
+                return action, 200, {'value': self._vm_tags(body.get('object_id', {}).get('id', ''))}
+
+        return 'other', 404, {'type': 'com.vmware.vapi.std.errors.not_found'}
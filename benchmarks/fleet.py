@@ -0,0 +1,121 @@
+"""
+Frota sintética de VMs para os benchmarks
+
+Tudo é derivado do índice da VM e dos parâmetros da frota, sem estado: o
+vCenter simulado (processo da fase medida) e o servidor de tags (processo
+principal) calculam os mesmos dados sem compartilhar memória, e a frota não
+ocupa memória no processo medido além do que o próprio plugin guarda.
+"""
+
+import uuid
+from typing import Dict, List, Tuple
+
+DATACENTER = 'DC-BENCH'
+ROOT_FOLDER = 'group-d1'
+DATACENTER_ID = 'datacenter-1'
+HOST_FOLDER = 'group-h1'
+VM_FOLDER = 'group-v1'
+
+_GUESTS = (
+    ('Red Hat Enterprise Linux 8 (64-bit)', 'linuxGuest'),
+    ('Ubuntu Linux (64-bit)', 'linuxGuest'),
+    ('Microsoft Windows Server 2019 (64-bit)', 'windowsGuest'),
+)
+_POWER_STATES = ('poweredOn', 'poweredOn', 'poweredOn', 'poweredOff', 'suspended')
+
+
+class Fleet:
+    """Parâmetros da frota: quantidade de VMs, de tags e topologia do datacenter"""
+
+    def __init__(self, vms: int, tags: int = 50, tags_per_vm: int = 3, categories: int = 5,
+                 clusters: int = 8, hosts_per_cluster: int = 4, folders: int = 20):
+        self.vms = vms
+        self.tags = tags
+        self.tags_per_vm = min(tags_per_vm, tags)
+        self.categories = max(categories, 1)
+        self.clusters = clusters
+        self.hosts_per_cluster = hosts_per_cluster
+        self.folders = folders
+
+    def to_dict(self) -> Dict[str, int]:
+        return dict(vars(self))
+
+    # Tags e categorias (mesmos IDs no formato do vCenter)
+
+    def category_id(self, index: int) -> str:
+        return f"urn:vmomi:InventoryServiceCategory:bench-{index}:GLOBAL"
+
+    def tag_id(self, index: int) -> str:
+        return f"urn:vmomi:InventoryServiceTag:bench-{index}:GLOBAL"
+
+    def tag(self, index: int) -> Dict[str, str]:
+        return {
+            'id': self.tag_id(index),
+            'name': f"Tag {index:04d}",
+            'category_id': self.category_id(index % self.categories),
+            'description': f"Tag sintética {index}",
+        }
+
+    def category(self, index: int) -> Dict[str, str]:
+        return {'id': self.category_id(index), 'name': f"Categoria {index}", 'cardinality': 'MULTIPLE'}
+
+    def vm_tag_indexes(self, index: int) -> List[int]:
+        """Tags da VM: `tags_per_vm` tags distintas, espalhadas pela frota"""
+        if not self.tags:
+            return []
+        return sorted({(index * 7 + offset * 13) % self.tags for offset in range(self.tags_per_vm)})
+
+    # Topologia: pasta raiz → datacenter → pasta de hosts → clusters → hosts; pasta de VMs → subpastas
+
+    def vm_moref(self, index: int) -> str:
+        return f"vm-{index + 1000}"
+
+    def host_moref(self, index: int) -> str:
+        return f"host-{index + 100}"
+
+    def cluster_moref(self, index: int) -> str:
+        return f"domain-c{index + 10}"
+
+    def folder_moref(self, index: int) -> str:
+        return f"group-v{index + 10}"
+
+    def entities(self) -> List[Tuple[str, str, str, str]]:
+        """(moref, tipo vim, nome, moref do pai) de pastas, datacenter, clusters e hosts"""
+        entities = [
+            (ROOT_FOLDER, 'Folder', 'Datacenters', None),
+            (DATACENTER_ID, 'Datacenter', DATACENTER, ROOT_FOLDER),
+            (HOST_FOLDER, 'Folder', 'host', DATACENTER_ID),
+            (VM_FOLDER, 'Folder', 'vm', DATACENTER_ID),
+        ]
+        for cluster in range(self.clusters):
+            entities.append((self.cluster_moref(cluster), 'ClusterComputeResource', f"cluster-{cluster:02d}", HOST_FOLDER))
+            for host in range(self.hosts_per_cluster):
+                host_index = cluster * self.hosts_per_cluster + host
+                entities.append((self.host_moref(host_index), 'HostSystem', f"esx-{host_index:03d}.bench.local",
+                                 self.cluster_moref(cluster)))
+        for folder in range(self.folders):
+            entities.append((self.folder_moref(folder), 'Folder', f"app-{folder:02d}", VM_FOLDER))
+        return entities
+
+    def vm(self, index: int) -> Dict[str, object]:
+        """Propriedades da VM `index` (caminhos do vSphere já resolvidos em valores simples)"""
+        guest_full_name, guest_family = _GUESTS[index % len(_GUESTS)]
+        power_state = _POWER_STATES[index % len(_POWER_STATES)]
+        hosts = max(self.clusters * self.hosts_per_cluster, 1)
+        return {
+            'name': f"bench-vm-{index:06d}",
+            'parent': self.folder_moref(index % max(self.folders, 1)),
+            'template': False,
+            'uuid': str(uuid.UUID(int=index + 1)),
+            'guest_full_name': guest_full_name,
+            'disk_kb': (40 + index % 5 * 20) * 1024 * 1024,
+            'num_cpu': 2 ** (index % 4),
+            'memory_mb': 1024 * (1 + index % 16),
+            'power_state': power_state,
+            'host': self.host_moref(index % hosts),
+            'guest_family': guest_family if power_state == 'poweredOn' else None,
+            'host_name': f"bench-vm-{index:06d}.bench.local" if power_state == 'poweredOn' else None,
+            'tools_status': 'toolsOk' if power_state == 'poweredOn' else 'toolsNotRunning',
+            'ip_addresses': [f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}"]
+            if power_state == 'poweredOn' else [],
+        }
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Benchmarks offline do vmware_dynamic e da sincronização com o NetBox
+
+Roda o plugin e os scripts sem sistemas de produção: o vCenter é simulado no
+nível do pyVmomi (fake_vcenter.FakeVCenterStub) e a API REST de tags e o
+NetBox são servidores HTTP locais, todos com latência configurável, servindo
+frotas sintéticas (fleet.Fleet).
+
+Fases (cada uma em um processo novo, para medir o pico de memória isolado):
+    parse        InventoryModule.parse completo (coleta, tags, filtro, inventário)
+    sync         awx_to_netbox_sync.py com o inventário gerado pelo parse, NetBox vazio
+    sync_steady  a mesma sincronização repetida, sem nada a alterar (VMs puladas pelo estado local)
+    sync_verify  a mesma sincronização com --full-verify (todas as VMs comparadas com o NetBox)
+    pipeline     vcenter_to_netbox_pipeline.py direto do vCenter, NetBox vazio
+
+Para cada frota e fase são reportados o tempo total, o pico de RSS e as
+requisições por rota (SOAP, REST do vCenter e NetBox). Com --baseline, o
+resultado é comparado com um relatório anterior e o script sai com código 1
+se alguma fase piorar além da tolerância.
+
+Uso:
+    python3 benchmarks/run_benchmarks.py [--vms 1000 10000 50000] [--tags 50] [--tags-per-vm 3]
+                                         [--vcenter-latency-ms 0] [--rest-latency-ms 0] [--netbox-latency-ms 0]
+                                         [--tag-mode bulk|per_vm] [--phases parse sync ...]
+                                         [--output relatorio.json] [--baseline anterior.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+import yaml
+
+from fake_netbox import FakeNetBox
+from fake_vcenter import VCenterTaggingApp
+from fleet import DATACENTER, Fleet
+from stub_server import StubServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+PLUGIN_DIR = os.path.join(REPO_DIR, 'inventory_plugins')
+SCRIPTS_DIR = os.path.join(REPO_DIR, 'scripts')
+CONFIG_FILE = os.path.join(REPO_DIR, 'config', 'awx_netbox_sync.json')
+
+PHASES = ('parse', 'sync', 'sync_steady', 'sync_verify', 'pipeline')
+DEFAULT_FLEETS = (1000, 10000, 50000)
+DEFAULT_TOLERANCE = 0.25
+REPORT_FILE_PATTERN = '/tmp/vmware_benchmark_{timestamp}.json'
+
+
+class _Measure:
+    """Tempo e pico de RSS de um bloco (o pico de antes do bloco fica em rss_start_mb)"""
+
+    def __enter__(self):
+        self.rss_start_mb = _peak_rss_mb()
+        self._started = time.monotonic()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wall_seconds = round(time.monotonic() - self._started, 3)
+        self.peak_rss_mb = _peak_rss_mb()
+        return False
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KB no Linux, bytes no macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _load_plugin():
+    from ansible.plugins.loader import inventory_loader
+    inventory_loader.add_directory(PLUGIN_DIR)
+    plugin = inventory_loader.get('vmware_dynamic')
+    return plugin, sys.modules[type(plugin).__module__]
+
+
+def _sync_config(params: Dict[str, Any]) -> Dict[str, Any]:
+    import awx_to_netbox_sync
+    config = awx_to_netbox_sync.load_config(CONFIG_FILE)
+    config.update(netbox_url=params['netbox_url'], netbox_token='bench', default_site=DATACENTER)
+    # Sem cache de referências: toda fase parte do mesmo estado. O estado local (hashes) acompanha
+    # o NetBox simulado e é apagado junto com ele
+    config['sync_options'].update(reference_cache_file='', state_file=params['state_file'])
+    awx_to_netbox_sync.setup_logging('WARNING', params['log_file'])
+    return config
+
+
+def _phase_parse(params: Dict[str, Any]) -> Tuple[_Measure, Dict[str, Any]]:
+    from ansible.inventory.data import InventoryData
+    from ansible.parsing.dataloader import DataLoader
+    import fake_vcenter
+
+    plugin, module = _load_plugin()
+    stub = fake_vcenter.install(module, Fleet(**params['fleet']), params['vcenter_latency'])
+    inventory = InventoryData()
+    with _Measure() as measure:
+        plugin.parse(inventory, DataLoader(), params['inventory_file'], cache=False)
+
+    # Mesmo formato de `ansible-inventory --list`, entrada das fases de sincronização
+    hostvars = {name: host.vars for name, host in inventory.hosts.items()}
+    with open(params['hostvars_file'], 'w') as f:
+        json.dump({'_meta': {'hostvars': hostvars}}, f)
+    return measure, {'hosts': len(hostvars), 'soap_calls': dict(stub.calls),
+                     'timings': plugin._stats.report(len(hostvars))['phases']}
+
+
+def _phase_sync(params: Dict[str, Any], full_verify: bool = False) -> Tuple[_Measure, Dict[str, Any]]:
+    import awx_to_netbox_sync
+
+    if not os.path.exists(params['hostvars_file']):
+        raise RuntimeError("a fase parse precisa rodar antes das fases de sincronização")
+    config = _sync_config(params)
+    with _Measure() as measure:
+        sync = awx_to_netbox_sync.AWXToNetBoxSync(
+            config,
+            awx_to_netbox_sync.InventoryFileSource(params['hostvars_file']),
+            awx_to_netbox_sync.NetBoxClient(config['netbox_url'], 'bench'),
+            full_verify=full_verify
+        )
+        stats = sync.run()
+    return measure, {'hosts': stats['hosts_total'], 'stats': _sync_summary(stats),
+                     'timings': sync.metrics.report()['phases']}
+
+
+def _phase_pipeline(params: Dict[str, Any]) -> Tuple[_Measure, Dict[str, Any]]:
+    import awx_to_netbox_sync
+    import fake_vcenter
+    import vcenter_to_netbox_pipeline
+
+    config = _sync_config(params)
+    collector = vcenter_to_netbox_pipeline.load_collector(params['inventory_file'])
+    stub = fake_vcenter.install(sys.modules[type(collector).__module__], Fleet(**params['fleet']),
+                                params['vcenter_latency'])
+    with _Measure() as measure:
+        netbox = awx_to_netbox_sync.NetBoxClient(config['netbox_url'], 'bench')
+        sync = awx_to_netbox_sync.AWXToNetBoxSync(
+            config, None, netbox,
+            reference_client=awx_to_netbox_sync.NetBoxClient(config['netbox_url'], 'bench', metrics=netbox.metrics)
+        )
+        stats = vcenter_to_netbox_pipeline.StreamingPipeline(
+            collector, collector._get_targets(), sync, sync.batch_size * 4
+        ).run()
+    return measure, {'hosts': stats['hosts_total'], 'stats': _sync_summary(stats), 'soap_calls': dict(stub.calls),
+                     'timings': dict(sync.metrics.report()['phases'], **{
+                         f"vcenter_{name}": phase for name, phase in collector._stats.report(stats['hosts_total'])['phases'].items()
+                     })}
+
+
+def _phase_sync_verify(params: Dict[str, Any]) -> Tuple[_Measure, Dict[str, Any]]:
+    return _phase_sync(params, full_verify=True)
+
+
+def _sync_summary(stats: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: stats[key] for key in ('created', 'updated', 'unchanged', 'hash_matches', 'failed', 'invalid')
+            if key in stats}
+
+
+PHASE_RUNNERS = {
+    'parse': _phase_parse,
+    'sync': _phase_sync,
+    'sync_steady': _phase_sync,
+    'sync_verify': _phase_sync_verify,
+    'pipeline': _phase_pipeline,
+}
+
+
+def _run_phase(phase: str, params: Dict[str, Any], results) -> None:
+    """Ponto de entrada do processo de cada fase"""
+    sys.path.insert(0, SCRIPTS_DIR)
+    # O requests aplica estes bundles mesmo com session.verify = False, e o certificado local é autoassinado
+    for variable in ('REQUESTS_CA_BUNDLE', 'CURL_CA_BUNDLE'):
+        os.environ.pop(variable, None)
+    os.environ.update(params['env'])
+    os.environ['VCENTER_CACHE_DIR'] = os.path.join(params['workdir'], f"vcenter_cache_{phase}")
+    try:
+        measure, extra = PHASE_RUNNERS[phase](params)
+        results.put(dict(extra, wall_seconds=measure.wall_seconds, rss_start_mb=measure.rss_start_mb,
+                         peak_rss_mb=measure.peak_rss_mb))
+    except Exception as e:
+        results.put({'error': f"{type(e).__name__}: {e}"})
+
+
+def _spawn(phase: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=_run_phase, args=(phase, params, results), name=f"bench-{phase}")
+    process.start()
+    try:
+        while True:
+            try:
+                return results.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    return {'error': f"processo da fase terminou com código {process.exitcode}"}
+    finally:
+        process.join()
+
+
+def _write_inventory(path: str, tagging: StubServer) -> None:
+    with open(path, 'w') as f:
+        yaml.safe_dump({
+            'plugin': 'vmware_dynamic',
+            'cache': False,
+            'targets': [{'host': tagging.host, 'datacenters': [DATACENTER], 'user': 'bench', 'password': 'bench'}],
+        }, f)
+
+
+def run_fleet(fleet: Fleet, args, workdir: str) -> List[Dict[str, Any]]:
+    tagging = StubServer(VCenterTaggingApp(fleet), args.rest_latency_ms / 1000.0, tls=True).start()
+    netbox_app = FakeNetBox()
+    netbox = StubServer(netbox_app, args.netbox_latency_ms / 1000.0).start()
+    try:
+        params = {
+            'fleet': fleet.to_dict(),
+            'workdir': workdir,
+            'inventory_file': os.path.join(workdir, f"vmware_inventory_{fleet.vms}.yml"),
+            'hostvars_file': os.path.join(workdir, f"hostvars_{fleet.vms}.json"),
+            'log_file': os.path.join(workdir, 'awx_netbox_sync.log'),
+            'state_file': os.path.join(workdir, f"sync_state_{fleet.vms}.db"),
+            'netbox_url': netbox.url,
+            'vcenter_latency': args.vcenter_latency_ms / 1000.0,
+            'env': {
+                'VCENTER_TAG_MODE': args.tag_mode,
+                'VCENTER_TAG_WORKERS': str(args.tag_workers),
+                'VCENTER_COLLECTION_MODE': 'property_collector',
+            },
+        }
+        _write_inventory(params['inventory_file'], tagging)
+
+        results = []
+        for phase in args.phases:
+            if phase in ('sync', 'pipeline'):
+                netbox_app.reset()
+                if os.path.exists(params['state_file']):
+                    os.remove(params['state_file'])
+            tagging.reset_counts()
+            netbox.reset_counts()
+            result = _spawn(phase, params)
+            result = dict({'vms': fleet.vms, 'phase': phase}, **result)
+            result['requests'] = {
+                'vcenter_soap': result.pop('soap_calls', {}),
+                'vcenter_rest': tagging.counts(),
+                'netbox': netbox.counts(),
+            }
+            _print_result(result)
+            results.append(result)
+        return results
+    finally:
+        tagging.stop()
+        netbox.stop()
+
+
+def _total(counts: Dict[str, int]) -> int:
+    return sum(counts.values())
+
+
+def _print_header() -> None:
+    print(f"{'VMs':>7}  {'fase':<12} {'tempo (s)':>10} {'RSS pico (MB)':>14} {'SOAP':>7} {'REST vCenter':>13} {'NetBox':>8}  hosts")
+
+
+def _print_result(result: Dict[str, Any]) -> None:
+    if 'error' in result:
+        print(f"{result['vms']:>7}  {result['phase']:<12} ❌ {result['error']}")
+        return
+    requests = result['requests']
+    print(
+        f"{result['vms']:>7}  {result['phase']:<12} {result['wall_seconds']:>10.2f} {result['peak_rss_mb']:>14.1f} "
+        f"{_total(requests['vcenter_soap']):>7} {_total(requests['vcenter_rest']):>13} {_total(requests['netbox']):>8}  "
+        f"{result.get('hosts', '-')}"
+    )
+
+
+def compare_with_baseline(results: List[Dict[str, Any]], baseline_file: str, tolerance: float) -> List[str]:
+    """Fases que ficaram mais lentas, usaram mais memória ou fizeram mais requisições que a referência"""
+    with open(baseline_file) as f:
+        baseline = {(item['vms'], item['phase']): item for item in json.load(f).get('results', []) if 'error' not in item}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get((result['vms'], result['phase']))
+        if not previous or 'error' in result:
+            continue
+        label = f"{result['vms']} VMs / {result['phase']}"
+        for metric in ('wall_seconds', 'peak_rss_mb'):
+            if result[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{label}: {metric} {previous[metric]} → {result[metric]}")
+        for service, counts in result['requests'].items():
+            before = _total(previous['requests'].get(service, {}))
+            if _total(counts) > before:
+                regressions.append(f"{label}: requisições {service} {before} → {_total(counts)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks offline do vmware_dynamic e da sincronização com o NetBox')
+    parser.add_argument('--vms', type=int, nargs='+', default=list(DEFAULT_FLEETS), help='Tamanhos de frota')
+    parser.add_argument('--tags', type=int, default=50, help='Tags no vCenter')
+    parser.add_argument('--tags-per-vm', type=int, default=3, help='Tags atribuídas a cada VM')
+    parser.add_argument('--categories', type=int, default=5, help='Categorias de tags')
+    parser.add_argument('--vcenter-latency-ms', type=float, default=0.0, help='Latência por chamada SOAP')
+    parser.add_argument('--rest-latency-ms', type=float, default=0.0, help='Latência por requisição REST do vCenter')
+    parser.add_argument('--netbox-latency-ms', type=float, default=0.0, help='Latência por requisição ao NetBox')
+    parser.add_argument('--tag-mode', choices=('bulk', 'per_vm'), default='bulk',
+                        help='VCENTER_TAG_MODE do plugin (índice em lote ou chamadas por VM)')
+    parser.add_argument('--tag-workers', type=int, default=1, help='VCENTER_TAG_WORKERS do plugin')
+    parser.add_argument('--phases', nargs='+', choices=PHASES, default=list(PHASES), help='Fases a executar')
+    parser.add_argument('--output', help='Relatório JSON (padrão: /tmp/vmware_benchmark_<timestamp>.json)')
+    parser.add_argument('--baseline', help='Relatório anterior para detectar regressões')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Piora relativa aceita em tempo e memória (padrão: 0.25)')
+    args = parser.parse_args()
+
+    started_at = datetime.now(timezone.utc)
+    results = []
+    with tempfile.TemporaryDirectory(prefix='vmware_benchmark_') as workdir:
+        _print_header()
+        for vms in args.vms:
+            fleet = Fleet(vms, tags=args.tags, tags_per_vm=args.tags_per_vm, categories=args.categories)
+            results.extend(run_fleet(fleet, args, workdir))
+
+    output = args.output or REPORT_FILE_PATTERN.format(timestamp=started_at.strftime('%Y%m%d%H%M%S'))
+    report = {
+        'generated_at': started_at.isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'results': results,
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"📄 Relatório: {output}")
+
+    failed = any('error' in result for result in results)
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"⚠️  Regressão: {regression}")
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
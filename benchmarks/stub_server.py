@@ -0,0 +1,145 @@
+"""
+Servidor HTTP local para os serviços simulados dos benchmarks
+
+Encaminha cada requisição para uma aplicação em memória (`handle`), aplica a
+latência configurada e conta as requisições por rota. Com `tls=True` gera um
+certificado autoassinado temporário (via openssl), para os clientes que só
+falam HTTPS, como as chamadas REST do vmware_dynamic.
+"""
+
+import collections
+import json
+import os
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+
+class StubApplication:
+    """Interface das aplicações simuladas"""
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]], body: Any,
+               headers: Dict[str, str], base_url: str) -> Tuple[str, int, Any]:
+        """Retorna (rota para contagem, status HTTP, corpo JSON ou None); cabeçalhos em minúsculas"""
+        raise NotImplementedError
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Cabeçalhos e corpo saem em escritas separadas; sem isso cada resposta espera o ACK atrasado (~40 ms)
+    disable_nagle_algorithm = True
+    stub: 'StubServer' = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _dispatch(self, method: str) -> None:
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        try:
+            body = json.loads(raw) if raw else None
+        except ValueError:
+            body = None
+        headers = {name.lower(): value for name, value in self.headers.items()}
+        status, payload = self.stub.dispatch(method, self.path, body, headers)
+        data = json.dumps(payload).encode() if payload is not None else b''
+        self.send_response(status)
+        if payload is not None:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PATCH(self):
+        self._dispatch('PATCH')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+
+def _self_signed_context(directory: str) -> ssl.SSLContext:
+    if not shutil.which('openssl'):
+        raise RuntimeError("openssl não encontrado: necessário para o servidor HTTPS simulado")
+    cert_file = os.path.join(directory, 'cert.pem')
+    key_file = os.path.join(directory, 'key.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+         '-subj', '/CN=localhost', '-keyout', key_file, '-out', cert_file],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_file, key_file)
+    return context
+
+
+class StubServer:
+    """Servidor em thread para uma StubApplication, com latência por requisição"""
+
+    def __init__(self, app: StubApplication, latency: float = 0.0, tls: bool = False):
+        self.app = app
+        self.latency = latency
+        self.tls = tls
+        self.requests: collections.Counter = collections.Counter()
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._cert_dir: Optional[str] = None
+
+    def start(self) -> 'StubServer':
+        handler = type('StubHandler', (_Handler,), {'stub': self})
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._server.daemon_threads = True
+        if self.tls:
+            self._cert_dir = tempfile.mkdtemp(prefix='bench_tls_')
+            self._server.socket = _self_signed_context(self._cert_dir).wrap_socket(self._server.socket, server_side=True)
+        threading.Thread(target=self._server.serve_forever, name='stub-server', daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        if self._cert_dir:
+            shutil.rmtree(self._cert_dir, ignore_errors=True)
+
+    @property
+    def host(self) -> str:
+        return f"127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def url(self) -> str:
+        return f"{'https' if self.tls else 'http'}://{self.host}"
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.requests.clear()
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(sorted(self.requests.items()))
+
+    def dispatch(self, method: str, target: str, body: Any, headers: Dict[str, str]) -> Tuple[int, Any]:
+        if self.latency:
+            time.sleep(self.latency)
+        parsed = urlsplit(target)
+        route, status, payload = self.app.handle(
+            method, parsed.path, parse_qs(parsed.query, keep_blank_values=True), body, headers, self.url
+        )
+        with self._lock:
+            self.requests[f"{method} {route}"] += 1
+        return status, payload
@@ -1,14 +1,127 @@
 from __future__ import (absolute_import, division, print_function)
 __metaclass__ = type
 
+DOCUMENTATION = r'''
+    name: vmware_dynamic
+    short_description: Inventário dinâmico de VMs do vCenter com suporte a tags
+    description:
+        - Coleta as VMs de um datacenter do vCenter, com tags, e cria grupos por estado, sistema operacional e tag.
+        - As credenciais do vCenter são lidas das variáveis de ambiente VCENTER_HOST, VCENTER_USER,
+          VCENTER_PASSWORD, VCENTER_PORT e DATACENTER_NAME (injetadas pelo AWX).
+        - Com o cache habilitado, o resultado é guardado por vCenter + datacenter e as execuções seguintes
+          dentro do cache_timeout não se conectam ao vCenter. O cache guarda uma linha de valores por VM;
+          um cache gravado em formato anterior é ignorado e a coleta é refeita.
+    extends_documentation_fragment:
+        - inventory_cache
+    options:
+        plugin:
+            description: Nome do plugin.
+            required: true
+            choices: ['vmware_dynamic']
+        refresh_cache:
+            description:
+                - Ignora o conteúdo do cache e força uma coleta completa no vCenter.
+                - O resultado da coleta atualiza o cache.
+            type: bool
+            default: false
+            env:
+                - name: VCENTER_REFRESH_CACHE
+        targets:
+            description:
+                - Lista de vCenters e datacenters coletados em paralelo e unidos em um único inventário.
+                - Cada item aceita C(host), C(datacenter) ou C(datacenters), e opcionalmente C(port), C(user)
+                  e C(password); os valores ausentes vêm de VCENTER_PORT, VCENTER_USER e VCENTER_PASSWORD.
+                - Sem esta opção é usado VCENTER_HOST com DATACENTER_NAME (aceita lista separada por vírgula).
+                - Com mais de um alvo, cada host ganha os grupos vcenter_<host> e datacenter_<nome>, e nomes
+                  repetidos entre origens recebem o datacenter (ou vCenter e datacenter) como sufixo.
+                - Um alvo com falha na coleta gera um aviso e o inventário mantém os hosts dos demais; a
+                  execução só falha quando nenhum alvo foi coletado.
+                - Num inventário parcial, todos os hosts (e o grupo all) recebem C(vmware_dynamic_targets_failed),
+                  a lista C(vcenter/datacenter) dos alvos com falha, para que os consumidores não tratem as VMs
+                  desses alvos como removidas.
+            type: list
+            elements: dict
+            default: []
+        target_workers:
+            description: Número de alvos coletados em paralelo (uma conexão SmartConnect por alvo).
+            type: int
+            default: 4
+            env:
+                - name: VCENTER_TARGET_WORKERS
+        incremental:
+            description:
+                - Atualização incremental via PropertyCollector WaitForUpdatesEx.
+                - A sessão SOAP, o PropertyCollector e a versão das atualizações são guardados em
+                  VCENTER_CACHE_DIR; a execução seguinte busca apenas as VMs criadas, alteradas ou removidas.
+                - Se a sessão tiver expirado no vCenter ou a versão não for mais válida, é feita uma carga completa.
+                - A sessão só sobrevive entre execuções mais próximas que o timeout de sessão do vCenter (30 min por padrão).
+            type: bool
+            default: false
+            env:
+                - name: VCENTER_INCREMENTAL
+        metrics_report:
+            description:
+                - Arquivo JSON gravado ao final da execução com as métricas da coleta, para anexar aos artefatos
+                  do job no AWX.
+                - Inclui o tempo acumulado por fase (conexão, coleta das VMs, tags, fallback pyVmomi,
+                  filtro e encerramento), a contagem e o histograma de latência das requisições por endpoint
+                  e as VMs mais lentas.
+            type: str
+            env:
+                - name: VCENTER_METRICS_REPORT
+        metrics_textfile:
+            description:
+                - As mesmas métricas no formato texto do Prometheus (ex. diretório do textfile collector do
+                  node_exporter, arquivo .prom).
+            type: str
+            env:
+                - name: VCENTER_METRICS_TEXTFILE
+'''
+
+EXAMPLES = r'''
+# inventory.yml - cache em arquivo JSON
+plugin: vmware_dynamic
+cache: true
+cache_plugin: jsonfile
+cache_connection: /tmp/vmware_inventory_cache
+cache_timeout: 3600
+
+# Vários vCenters e datacenters em um só inventário
+# plugin: vmware_dynamic
+# targets:
+#   - host: vcsa04.ati.pi.gov.br
+#     datacenters: [ATI-SLC-HCI, ATI-DR]
+#   - host: vcsa05.ati.pi.gov.br
+#     datacenter: ATI-SEDE
+
+# Cache compartilhado entre nós de execução do AWX (Redis)
+# plugin: vmware_dynamic
+# cache: true
+# cache_plugin: community.general.redis
+# cache_connection: redis-host:6379:0
+'''
+
 import os
 import ssl
+import sys
 import re
 import json
+import bisect
+import contextlib
+import functools
+import heapq
+import itertools
+import queue
+import threading
+import time
 import requests
-from ansible.plugins.inventory import BaseInventoryPlugin
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from ansible.plugins.inventory import BaseInventoryPlugin, Cacheable
+from ansible.utils.display import Display
 from pyVim.connect import SmartConnect, Disconnect
-from pyVmomi import vim
+from pyVmomi import vim, vmodl, SoapStubAdapter
 
 """
 VMware Dynamic Inventory Plugin com Suporte a Tags
@@ -25,9 +138,1123 @@ Se você estiver recebendo erro 403 ao buscar tags, verifique:
 3. Adicione as permissões: Global > System > View e Read
 4. Em vSphere Tagging, marque "Assign or Unassign vSphere Tag"
 5. Aplique o role ao usuário no nível do vCenter (root)
+
+Modos de coleta (variável de ambiente VCENTER_COLLECTION_MODE):
+- property_collector (padrão): busca em lote, via PropertyCollector, apenas as
+  propriedades usadas pelo plugin para todas as VMs (RetrievePropertiesEx
+  paginado com ContinueRetrievePropertiesEx). O tamanho da página é definido
+  por VCENTER_PAGE_SIZE (padrão 1000).
+- legacy: percorre container.view lendo os atributos de cada VM (uma chamada
+  SOAP por atributo). Mantido apenas para diagnóstico.
+
+Modos de coleta de tags (variável de ambiente VCENTER_TAG_MODE):
+- bulk (padrão): carrega todas as tags e categorias uma vez por execução e
+  resolve as associações VM -> tag em lote (list-attached-objects-on-tags ou
+  list-attached-tags-on-objects). A consulta por VM vira um acesso a dicionário.
+- per_vm: consulta as tags de cada VM individualmente (comportamento original).
+
+VCENTER_TAG_WORKERS (padrão 1): número de threads usadas nas chamadas REST de
+tags. Com valor maior que 1, as consultas por VM (modo per_vm) e o carregamento
+dos detalhes de tags/categorias (modo bulk) rodam em paralelo, com o pool de
+conexões HTTP dimensionado para o mesmo número de workers. Respostas 429/503
+são repetidas com backoff exponencial.
+
+Coleta em fluxo: cada página de propriedades é classificada, filtrada e
+adicionada ao inventário assim que chega, e liberada antes da página seguinte;
+a ContainerView é destruída quando a última página chega. Fora o próprio
+inventário do Ansible, a memória da coleta depende de VCENTER_PAGE_SIZE, não do
+tamanho da frota; o que cresce com a frota é o índice de tags do modo bulk e,
+com o cache de inventário habilitado, as linhas gravadas no cache (uma lista de
+valores por VM). Com vários alvos, os hosts entram na ordem dos alvos: o alvo
+da vez é repassado à medida que chega e os demais, coletados em paralelo,
+aguardam em fila.
+
+Cache de endpoints: a variante de cada endpoint REST que funcionou (e as que
+retornaram 403/404) é gravada em disco por vCenter e versão, em
+VCENTER_CACHE_DIR (padrão /tmp/vmware_inventory_cache), por
+VCENTER_ENDPOINT_CACHE_TTL segundos (padrão 86400). Chamadas seguintes vão
+direto ao endpoint conhecido e nunca repetem variantes reprovadas dentro do TTL.
+
+Saída: o plugin usa o Display do Ansible. Uma execução normal imprime apenas
+avisos e uma linha de resumo (VMs, tags, variáveis bloqueadas, tempo); os
+detalhes por fase, por VM e por endpoint aparecem com -v, -vvv e -vvvv.
 """
 
-class InventoryModule(BaseInventoryPlugin):
+display = Display()
+
+
+def _moref_id(value):
+    """Converte uma referência de objeto gerenciado no seu identificador (ex: vm-123)"""
+    return value._moId if value is not None else None
+
+
+def _disk_total_gb(devices):
+    """Soma a capacidade dos discos virtuais de uma VM, em GB"""
+    disk_total_gb = 0
+    for device in devices or []:
+        if hasattr(device, 'capacityInKB') and device.capacityInKB:
+            disk_total_gb += round((device.capacityInKB / 1024 / 1024), 1)
+    return disk_total_gb
+
+
+def _nic_ip_addresses(nics):
+    """Extrai os endereços IP (exceto link-local IPv6) das placas de rede da VM"""
+    ip_addresses = []
+    for nic in nics or []:
+        if nic.ipAddress:
+            ip_addresses.extend([ip for ip in nic.ipAddress if ip and not ip.startswith('fe80')])
+    return ip_addresses
+
+
+# Sanitização de strings (ver _sanitize_text)
+_CONTROL_CHARS = re.compile(r'[\x00-\x1f\x7f-\x9f]')
+_PROBLEMATIC_PATTERNS = [re.compile(pattern) for pattern in (
+    r'"[^"]*"[^"]*"[^"]*"',  # Múltiplas aspas duplas
+    r"'[^']*'[^']*'[^']*'",  # Múltiplas aspas simples
+    r'\{[^}]*\}[^}]*\}',      # Múltiplas chaves
+    r'}}}}',                  # Sequência de chaves problemática
+    r'""',                    # Aspas duplas vazias
+    r"''",                    # Aspas simples vazias
+)]
+_WHITESPACE_RUN = re.compile(r'\s+')
+# Aspas, chaves e quebras de linha; a barra invertida vira barra normal
+_QUOTES_AND_BRACES = str.maketrans({'"': None, "'": None, '\n': ' ', '\r': ' ', '\\': '/', '{': None, '}': None})
+# Removidos só depois de juntar os espaços, como na versão original
+_PUNCTUATION = str.maketrans('', '', ':,[]')
+# Qualquer caractere que exija algum passo da sanitização; ausente, a string já está limpa
+_NEEDS_SANITIZING = re.compile(r'[\x00-\x1f\x7f-\x9f"\'{}\\:,\[\]]|[^\S ]|  |^ | $')
+
+
+@functools.lru_cache(maxsize=4096)
+def _sanitize_text(value):
+    """Remove caracteres de controle, aspas, chaves e pontuação que quebram JSON/YAML.
+
+    Strings já limpas (o caso comum) retornam sem nenhuma transformação; valores
+    repetidos como cluster, pasta e tags são memorizados. A saída é idêntica à
+    sequência original de re.sub/str.replace.
+    """
+    if not _NEEDS_SANITIZING.search(value):
+        return value
+
+    # Remove caracteres de controle, que são invisíveis e quebram o JSON
+    value = _CONTROL_CHARS.sub('', value)
+
+    # Remove sequências problemáticas que podem quebrar JSON/YAML (a ordem importa)
+    for pattern in _PROBLEMATIC_PATTERNS:
+        value = pattern.sub('', value)
+
+    value = value.translate(_QUOTES_AND_BRACES)
+
+    # Remove espaços múltiplos
+    value = _WHITESPACE_RUN.sub(' ', value)
+
+    value = value.translate(_PUNCTUATION)
+
+    return value.strip()
+
+
+# Regras de variáveis de host, aplicadas uma vez por variável (ver _filter_host_vars).
+# Só entram variáveis VMware; nada que o AWX/Tower possa injetar ou interpretar.
+ALLOWED_VAR_PREFIXES = ('vm_', 'ansible_host')
+BLOCKED_VAR_NAMES = frozenset([
+    'remote_host_enabled', 'remote_host_id', 'remote_tower_enabled', 'remote_tower_id',
+    'tower_enabled', 'tower_id', 'awx_enabled', 'awx_id', 'ansible_host_key_checking',
+    'ansible_ssh_common_args', 'ansible_ssh_extra_args', 'ansible_connection_timeout'
+])
+_BLOCKED_VAR_NAME_PATTERN = re.compile(r'remote_|tower_|awx_|ansible_host_key|ansible_ssh', re.IGNORECASE)
+_SUSPICIOUS_VALUE_PATTERN = re.compile('|'.join(re.escape(content) for content in (
+    '564dba5b-c886-5576-5ce2-8e7f4889d270', '564d8ad9-0b54-c1b0-7658-8a0fd40a73f1',
+    '"remote_host_enabled"', '"remote_tower_enabled"', 'No closing quotation',
+    '"}', "'}", '{{', '}}'
+)))
+SUSPICIOUS_VAR_IDS = frozenset(['1063', '1064'])
+
+
+# Propriedades das VMs coletadas via PropertyCollector:
+# (caminho no vSphere, chave normalizada, função de normalização)
+VM_PROPERTIES = (
+    ('name', 'name', None),
+    ('parent', 'parent', _moref_id),
+    ('config.template', 'template', None),
+    ('config.uuid', 'uuid', None),
+    ('config.guestFullName', 'guest_full_name', None),
+    ('config.hardware.device', 'disk_total_gb', _disk_total_gb),
+    ('summary.config.numCpu', 'num_cpu', None),
+    ('summary.config.memorySizeMB', 'memory_mb', None),
+    ('runtime.powerState', 'power_state', None),
+    ('runtime.host', 'host', _moref_id),
+    ('guest.guestFamily', 'guest_family', None),
+    ('guest.hostName', 'host_name', None),
+    ('guest.toolsStatus', 'tools_status', None),
+    ('guest.net', 'ip_addresses', _nic_ip_addresses),
+)
+
+VM_PROPERTY_MAP = {path: (key, normalize) for path, key, normalize in VM_PROPERTIES}
+
+
+def _normalize_vm_properties(raw_props):
+    """Converte {caminho vSphere: valor} em propriedades normalizadas e serializáveis"""
+    props = {}
+    for path, value in raw_props.items():
+        if path in VM_PROPERTY_MAP:
+            key, normalize = VM_PROPERTY_MAP[path]
+            props[key] = normalize(value) if normalize else value
+    return props
+
+
+# Variáveis de host de cada VM, na ordem em que entram no inventário (ver VMRecord)
+HOST_VARS = (
+    'ansible_host', 'vm_name', 'vm_uuid', 'vm_power_state', 'vm_guest_os', 'vm_guest_family',
+    'vm_cpu_count', 'vm_memory_mb', 'vm_memory_gb', 'vm_datacenter', 'vm_cluster', 'vm_folder',
+    'vm_ip_addresses', 'vm_hostname', 'vm_tools_status', 'vm_tools_running', 'vm_environment',
+    'vm_criticality', 'vm_is_windows', 'vm_is_linux', 'vm_cpu_category', 'vm_memory_category',
+    'vm_disk_total_gb', 'vm_disk_category', 'vm_tags',
+)
+_HOST_VAR_NAMES = frozenset(HOST_VARS)
+# Valores que se repetem entre VMs: uma única cópia de cada string na memória
+INTERNED_VARS = frozenset([
+    'vm_power_state', 'vm_guest_os', 'vm_guest_family', 'vm_datacenter', 'vm_cluster', 'vm_folder', 'vm_tools_status',
+])
+_POWER_STATE_GROUPS = {'poweredOn': 'powered_on', 'poweredOff': 'powered_off', 'suspended': 'suspended'}
+_LINUX_MARKERS = ('linux', 'ubuntu', 'centos', 'red hat', 'suse', 'debian')
+# Formato dos registros no cache de inventário (VMRecord.to_cache); outro formato é tratado como cache vazio
+RECORD_CACHE_FORMAT = 'vmrecord-1'
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class TagRef:
+    """Tag do vCenter (nome, categoria e descrição já sanitizados): uma instância por tag, compartilhada pelas VMs"""
+
+    __slots__ = ('name', 'category', 'description', 'group', 'category_group', '_vars')
+
+    def __init__(self, name, category=None, description=None):
+        self.name = _intern(name)
+        self.category = _intern(category)
+        self.description = _intern(description)
+        # Grupos do inventário derivados da tag: tag_<nome> e category_<categoria>
+        self.group = _intern(f"tag_{name.lower().replace(' ', '_')}") if name else None
+        self.category_group = _intern(f"category_{category.lower().replace(' ', '_')}") if category else None
+        self._vars = None
+
+    def as_vars(self):
+        """A tag como aparece em vm_tags; o mesmo dicionário serve a todas as VMs com a tag"""
+        if self._vars is None:
+            self._vars = {'name': self.name, 'category': self.category, 'description': self.description}
+        return self._vars
+
+    def to_cache(self):
+        return [self.name, self.category, self.description]
+
+
+class VMRecord:
+    """Uma VM coletada, com as variáveis de host em slots em vez de um dicionário por VM.
+
+    É o modelo comum da coleta (_iter_hosts), da classificação (from_properties e groups),
+    do cache de inventário (to_cache/from_cache) e do pipeline vCenter → NetBox, que entrega
+    o registro direto ao sync: `get`, `[]` e `in` respondem pelos nomes das variáveis
+    (vm_name, vm_uuid...), como os hostvars do AWX. Strings repetidas são internadas, IPs
+    ficam em tupla e as tags são TagRef compartilhadas. Variável ausente ou bloqueada pelo
+    filtro fica None.
+    """
+
+    __slots__ = ('inventory_hostname', 'source_groups') + HOST_VARS
+
+    def __init__(self, inventory_hostname=None, source_groups=(), **host_vars):
+        self.inventory_hostname = inventory_hostname
+        self.source_groups = source_groups
+        for var in HOST_VARS:
+            value = host_vars.get(var)
+            setattr(self, var, _intern(value) if var in INTERNED_VARS else value)
+
+    @classmethod
+    def from_properties(cls, props, tags, sanitize):
+        """Registro a partir das propriedades normalizadas da VM, com as classificações derivadas"""
+        name = props['name']
+        name_lower = name.lower()
+        guest_full_name = props.get('guest_full_name')
+        num_cpu = props.get('num_cpu')
+        memory_mb = props.get('memory_mb')
+        tools_status = props.get('tools_status')
+        ip_addresses = tuple(props.get('ip_addresses') or ())
+        disk_total_gb = props.get('disk_total_gb') or 0
+
+        num_cpu = num_cpu if num_cpu is not None else 0
+        memory_gb = round((memory_mb / 1024), 1) if memory_mb is not None else 0
+        guest_os_lower = guest_full_name.lower() if guest_full_name else ''
+
+        return cls(
+            ansible_host=ip_addresses[0] if ip_addresses else None,
+            vm_name=sanitize(name),
+            vm_uuid=sanitize(props.get('uuid')),
+            vm_power_state=sanitize(props.get('power_state')),
+            vm_guest_os=sanitize(guest_full_name),
+            vm_guest_family=sanitize(props.get('guest_family')),
+            vm_cpu_count=num_cpu,
+            vm_memory_mb=memory_mb if memory_mb is not None else 0,
+            vm_memory_gb=memory_gb,
+            vm_datacenter=sanitize(props.get('datacenter')),
+            vm_cluster=sanitize(props.get('cluster')),
+            vm_folder=sanitize(props.get('folder')),
+            vm_ip_addresses=ip_addresses,
+            vm_hostname=sanitize(props.get('host_name')),
+            vm_tools_status=sanitize(tools_status),
+            vm_tools_running=tools_status == 'toolsOk',
+            vm_environment='production' if 'prod' in name_lower else 'development' if 'dev' in name_lower else 'testing' if 'test' in name_lower else 'staging' if 'stg' in name_lower else 'unknown',
+            vm_criticality='high' if 'prod' in name_lower else 'medium' if 'test' in name_lower or 'stg' in name_lower else 'low',
+            vm_is_windows='windows' in guest_os_lower,
+            vm_is_linux=any(marker in guest_os_lower for marker in _LINUX_MARKERS),
+            vm_cpu_category='high' if num_cpu >= 8 else 'medium' if num_cpu >= 4 else 'low',
+            vm_memory_category='high' if memory_gb >= 16 else 'medium' if memory_gb >= 8 else 'low' if memory_gb >= 4 else 'minimal',
+            vm_disk_total_gb=disk_total_gb,
+            vm_disk_category='high' if disk_total_gb >= 1000 else 'medium' if disk_total_gb >= 500 else 'low' if disk_total_gb >= 100 else 'minimal',
+            vm_tags=tuple(tags or ()),
+        )
+
+    def host_vars(self):
+        """Variáveis de host no formato do inventário (listas e dicionários), sem as ausentes"""
+        host_vars = {}
+        for var in HOST_VARS:
+            value = getattr(self, var)
+            if value is None:
+                continue
+            if var == 'vm_tags':
+                value = [tag.as_vars() for tag in value]
+            elif var == 'vm_ip_addresses':
+                value = list(value)
+            host_vars[var] = value
+        return host_vars
+
+    def restrict(self, accepted):
+        """Mantém apenas as variáveis aceitas pelo filtro, com os valores já sanitizados"""
+        for var in HOST_VARS:
+            if var not in accepted:
+                setattr(self, var, None)
+            elif isinstance(accepted[var], str):
+                setattr(self, var, _intern(accepted[var]) if var in INTERNED_VARS else accepted[var])
+
+    def groups(self):
+        """Grupos do host: estado de energia, sistema operacional, tags/categorias e origem"""
+        groups = []
+        if self.vm_power_state in _POWER_STATE_GROUPS:
+            groups.append(_POWER_STATE_GROUPS[self.vm_power_state])
+        if self.vm_is_windows:
+            groups.append('windows')
+        elif self.vm_is_linux:
+            groups.append('linux')
+        for tag in self.vm_tags or ():
+            if tag.group:
+                groups.append(tag.group)
+                if tag.category_group:
+                    groups.append(tag.category_group)
+        groups.extend(self.source_groups)
+        return groups
+
+    # Interface de mapeamento (somente leitura), pelos nomes das variáveis
+
+    def get(self, var, default=None):
+        value = getattr(self, var) if var in _HOST_VAR_NAMES else None
+        return default if value is None else value
+
+    def __getitem__(self, var):
+        value = self.get(var)
+        if value is None:
+            raise KeyError(var)
+        return value
+
+    def __contains__(self, var):
+        return self.get(var) is not None
+
+    # Cache de inventário: uma lista de valores por VM, sem repetir os nomes das variáveis
+
+    def to_cache(self):
+        row = [self.inventory_hostname, list(self.source_groups)]
+        for var in HOST_VARS:
+            value = getattr(self, var)
+            if var == 'vm_tags' and value is not None:
+                value = [tag.to_cache() for tag in value]
+            elif var == 'vm_ip_addresses' and value is not None:
+                value = list(value)
+            row.append(value)
+        return row
+
+    @classmethod
+    def from_cache(cls, row, tag_refs):
+        """Registro a partir de to_cache(); `tag_refs` ((nome, categoria, descrição) -> TagRef) é compartilhado"""
+        inventory_hostname, source_groups, values = row[0], row[1], row[2:]
+        host_vars = dict(zip(HOST_VARS, values))
+        if host_vars.get('vm_tags') is not None:
+            tags = []
+            for tag in host_vars['vm_tags']:
+                key = tuple(tag)
+                if key not in tag_refs:
+                    tag_refs[key] = TagRef(*key)
+                tags.append(tag_refs[key])
+            host_vars['vm_tags'] = tuple(tags)
+        if host_vars.get('vm_ip_addresses') is not None:
+            host_vars['vm_ip_addresses'] = tuple(host_vars['vm_ip_addresses'])
+        return cls(inventory_hostname, tuple(_intern(group) for group in source_groups), **host_vars)
+
+
+def _records_to_cache(rows):
+    """Valor do cache de inventário de um alvo, a partir das linhas de VMRecord.to_cache()"""
+    return {'format': RECORD_CACHE_FORMAT, 'vars': list(HOST_VARS), 'hosts': rows}
+
+
+def _records_from_cache(payload):
+    """Gera os registros gravados por _records_to_cache; None se o cache for de outro formato"""
+    if not isinstance(payload, dict) or payload.get('format') != RECORD_CACHE_FORMAT or payload.get('vars') != list(HOST_VARS):
+        return None
+    tag_refs = {}
+    return (VMRecord.from_cache(row, tag_refs) for row in payload['hosts'])
+
+
+def _container_object_spec(container):
+    """ObjectSpec que percorre todos os objetos de uma ContainerView"""
+    traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(
+        name='traverseContainerView',
+        path='view',
+        skip=False,
+        type=vim.view.ContainerView
+    )
+    return vmodl.query.PropertyCollector.ObjectSpec(
+        obj=container,
+        skip=True,
+        selectSet=[traversal_spec]
+    )
+
+
+# Tipos usados para resolver nomes de datacenter, cluster e pasta sem
+# percorrer runtime.host.parent... objeto a objeto
+ENTITY_TYPES = [vim.Folder, vim.Datacenter, vim.ComputeResource, vim.HostSystem, vim.ResourcePool]
+
+DEFAULT_PAGE_SIZE = 1000
+
+# Quantidade de IDs enviados por chamada nas ações em lote de tag-association
+TAG_BATCH_SIZE = 500
+
+# Repetição das chamadas REST quando o vCenter sinaliza sobrecarga
+REST_RETRY_TOTAL = 5
+REST_RETRY_BACKOFF = 0.5
+REST_RETRY_STATUS = (429, 503)
+REST_RETRY_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+# As ações POST de tagging (list-attached-...) são consultas e podem ser repetidas
+REST_TAGGING_PREFIXES = ('/rest/com/vmware/cis/tagging/', '/api/cis/tagging/')
+
+
+def _configure_rest_pool(session, vcenter_host, workers):
+    """Dimensiona o pool de conexões da sessão e habilita retry com backoff em 429/503.
+
+    Só consultas são repetidas: GET em qualquer URL e POST apenas nas URLs de tagging.
+    O POST que cria a sessão e o DELETE que a encerra não são repetidos; um POST de
+    autenticação repetido pode abrir uma sessão a mais no vCenter.
+    """
+    def adapter(methods):
+        retry = Retry(
+            total=REST_RETRY_TOTAL,
+            backoff_factor=REST_RETRY_BACKOFF,
+            status_forcelist=REST_RETRY_STATUS,
+            allowed_methods=methods,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        return HTTPAdapter(pool_connections=1, pool_maxsize=max(workers, 1), max_retries=retry)
+
+    session.mount('https://', adapter(REST_RETRY_METHODS))
+    tagging = adapter(REST_RETRY_METHODS | {'POST'})
+    for prefix in REST_TAGGING_PREFIXES:
+        session.mount(f"https://{vcenter_host}{prefix}", tagging)
+    return session
+
+
+DEFAULT_CACHE_DIR = '/tmp/vmware_inventory_cache'
+DEFAULT_ENDPOINT_CACHE_TTL = 86400
+
+
+def _concurrent_map(func, items, workers):
+    """Aplica func a cada item com até `workers` threads, preservando a ordem dos resultados"""
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as executor:
+        return list(executor.map(func, items))
+
+
+def _ordered_streams(factories, workers):
+    """Gera, na ordem de `factories`, um iterador para os itens de cada fábrica (função que retorna um gerador).
+
+    Com `workers` > 1 até `workers` geradores rodam em paralelo: o iterador da vez repassa os itens
+    à medida que chegam e os geradores seguintes acumulam os seus em fila até serem consumidos.
+    Erros de um gerador são relançados no consumidor ao percorrer o iterador dele, sem interromper
+    os demais; ao fechar este gerador, os demais são interrompidos e fechados.
+    """
+    if workers <= 1 or len(factories) <= 1:
+        for factory in factories:
+            yield factory()
+        return
+
+    stop = threading.Event()
+
+    def produce(factory, output):
+        try:
+            items = factory()
+            try:
+                for item in items:
+                    if stop.is_set():
+                        break
+                    output.put((item, None))
+            finally:
+                items.close()
+        except Exception as e:
+            output.put((_EXHAUSTED, e))
+        finally:
+            output.put((_EXHAUSTED, None))
+
+    def drain(output):
+        while True:
+            item, error = output.get()
+            if error is not None:
+                raise error
+            if item is _EXHAUSTED:
+                return
+            yield item
+
+    outputs = [queue.Queue() for _ in factories]
+    executor = ThreadPoolExecutor(max_workers=min(workers, len(factories)))
+    try:
+        for factory, output in zip(factories, outputs):
+            executor.submit(produce, factory, output)
+        for output in outputs:
+            yield drain(output)
+    finally:
+        stop.set()
+        executor.shutdown(wait=True)
+
+
+# Limites (segundos) dos buckets do histograma de latência por endpoint
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOWEST_VMS = 10
+_EXHAUSTED = object()
+
+# IDs nas URLs REST (id:urn:..., urn:..., vm-123) viram {id} no rótulo do endpoint
+_REST_OBJECT_ID = re.compile(r'(?<=/)(?:id:)?(?:urn:[^/?]+|vm-\d+)')
+_REST_ACTION = re.compile(r'[?&]~?action=([\w-]+)')
+
+
+def _rest_endpoint(method, path_url):
+    """Rótulo de um endpoint REST para as métricas: método, caminho sem IDs e a ação, se houver"""
+    path, _, query = path_url.partition('?')
+    label = f"{method} {_REST_OBJECT_ID.sub('{id}', path)}"
+    action = _REST_ACTION.search(f"?{query}")
+    return f"{label}?action={action.group(1)}" if action else label
+
+
+def _prometheus_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _write_atomic(path, text):
+    """Grava via arquivo temporário + rename: o node_exporter nunca lê um arquivo pela metade"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class VCenterRunStats:
+    """Contadores, tempos por fase, latência por endpoint e VMs mais lentas da execução.
+
+    Compartilhado entre threads e alvos; o tempo de uma fase é a soma do tempo gasto
+    nela em todas as threads, então fases paralelas podem somar mais que a duração total.
+    """
+
+    # (fase, [(contador, rótulo), ...]) na ordem da linha de resumo
+    PHASES = [
+        ('coleta', [('vms_seen', 'VMs vistas'), ('vms_skipped', 'ignoradas'), ('vm_errors', 'erros')]),
+        ('tags', [('tag_calls', 'chamadas'), ('tag_failures', 'falhas')]),
+        ('filtro', [('vars_blocked', 'variáveis bloqueadas'), ('hosts_dropped', 'hosts descartados')]),
+        ('alvos', [('targets', 'coletados'), ('targets_cached', 'do cache'), ('targets_failed', 'com falha')]),
+    ]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self.counters = {}
+        self.phases = {}     # fase -> [segundos, execuções]
+        self.requests = {}   # endpoint -> {'count', 'errors', 'sum', 'buckets'}
+        self._slowest = []   # heap (segundos, VM) limitado a SLOWEST_VMS
+
+    def incr(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                totals = self.phases.setdefault(name, [0.0, 0])
+                totals[0] += elapsed
+                totals[1] += 1
+
+    def observe_request(self, endpoint, seconds, error=False):
+        with self._lock:
+            entry = self.requests.get(endpoint)
+            if entry is None:
+                entry = self.requests[endpoint] = {
+                    'count': 0, 'errors': 0, 'sum': 0.0, 'buckets': [0] * len(LATENCY_BUCKETS)
+                }
+            entry['count'] += 1
+            entry['errors'] += 1 if error else 0
+            entry['sum'] += seconds
+            bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+            if bucket < len(LATENCY_BUCKETS):
+                entry['buckets'][bucket] += 1
+
+    def response_hook(self, response, *args, **kwargs):
+        """Hook de resposta do requests: uma observação por requisição REST ao vCenter"""
+        self.observe_request(
+            _rest_endpoint(response.request.method, response.request.path_url),
+            response.elapsed.total_seconds(),
+            response.status_code >= 400
+        )
+
+    def timed_call(self, endpoint, func, *args, **kwargs):
+        """Executa uma chamada SOAP registrando a latência no endpoint informado"""
+        started = time.monotonic()
+        error = True
+        try:
+            result = func(*args, **kwargs)
+            error = False
+            return result
+        finally:
+            self.observe_request(endpoint, time.monotonic() - started, error)
+
+    def observe_vm(self, name, seconds):
+        with self._lock:
+            if len(self._slowest) < SLOWEST_VMS:
+                heapq.heappush(self._slowest, (seconds, name))
+            elif seconds > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, (seconds, name))
+
+    def report(self, hosts):
+        """Métricas da execução em formato serializável (relatório JSON)"""
+        with self._lock:
+            return {
+                'hosts': hosts,
+                'duration_seconds': round(time.monotonic() - self._started, 3),
+                'counters': dict(self.counters),
+                'phases': {
+                    name: {'seconds': round(seconds, 3), 'count': count}
+                    for name, (seconds, count) in sorted(self.phases.items())
+                },
+                'requests': {
+                    endpoint: {
+                        'count': entry['count'],
+                        'errors': entry['errors'],
+                        'seconds': round(entry['sum'], 3),
+                        'buckets': dict(zip(
+                            [str(bound) for bound in LATENCY_BUCKETS], itertools.accumulate(entry['buckets'])
+                        )),
+                    }
+                    for endpoint, entry in sorted(self.requests.items())
+                },
+                'slowest_vms': [
+                    {'name': name, 'seconds': round(seconds, 4)} for seconds, name in sorted(self._slowest, reverse=True)
+                ],
+            }
+
+    def prometheus(self, hosts):
+        """Métricas no formato texto do Prometheus (textfile collector do node_exporter)"""
+        report = self.report(hosts)
+        lines = [
+            '# HELP vmware_dynamic_last_run_timestamp_seconds Fim da última coleta do vmware_dynamic.',
+            '# TYPE vmware_dynamic_last_run_timestamp_seconds gauge',
+            f"vmware_dynamic_last_run_timestamp_seconds {time.time():.0f}",
+            '# HELP vmware_dynamic_duration_seconds Duração da coleta.',
+            '# TYPE vmware_dynamic_duration_seconds gauge',
+            f"vmware_dynamic_duration_seconds {report['duration_seconds']}",
+            '# HELP vmware_dynamic_hosts Hosts no inventário gerado.',
+            '# TYPE vmware_dynamic_hosts gauge',
+            f"vmware_dynamic_hosts {hosts}",
+            '# HELP vmware_dynamic_events Contadores da coleta (VMs, chamadas de tags, variáveis bloqueadas...).',
+            '# TYPE vmware_dynamic_events gauge',
+        ]
+        lines += [f'vmware_dynamic_events{{counter="{name}"}} {value}' for name, value in sorted(report['counters'].items())]
+        lines += [
+            '# HELP vmware_dynamic_phase_seconds Tempo acumulado por fase (soma entre threads).',
+            '# TYPE vmware_dynamic_phase_seconds gauge',
+        ]
+        lines += [f'vmware_dynamic_phase_seconds{{phase="{name}"}} {phase["seconds"]}' for name, phase in report['phases'].items()]
+        lines += [
+            '# HELP vmware_dynamic_request_duration_seconds Latência das requisições ao vCenter por endpoint.',
+            '# TYPE vmware_dynamic_request_duration_seconds histogram',
+        ]
+        for endpoint, entry in report['requests'].items():
+            label = f'endpoint="{_prometheus_label(endpoint)}"'
+            lines += [f'vmware_dynamic_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}'
+                      for bound, count in entry['buckets'].items()]
+            lines += [
+                f'vmware_dynamic_request_duration_seconds_bucket{{{label},le="+Inf"}} {entry["count"]}',
+                f'vmware_dynamic_request_duration_seconds_sum{{{label}}} {entry["seconds"]}',
+                f'vmware_dynamic_request_duration_seconds_count{{{label}}} {entry["count"]}',
+            ]
+        lines += [
+            '# HELP vmware_dynamic_request_errors Requisições ao vCenter com erro por endpoint.',
+            '# TYPE vmware_dynamic_request_errors gauge',
+        ]
+        lines += [f'vmware_dynamic_request_errors{{endpoint="{_prometheus_label(endpoint)}"}} {entry["errors"]}'
+                  for endpoint, entry in report['requests'].items()]
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, hosts):
+        phases = ' | '.join(
+            f"{phase}: " + ', '.join(f"{self.counters.get(counter, 0)} {label}" for counter, label in counters)
+            for phase, counters in self.PHASES
+        )
+        return f"vmware_dynamic: {hosts} hosts em {time.monotonic() - self._started:.1f}s | {phases}"
+
+
+class VCenterEndpointCache:
+    """Capacidades de endpoints REST de um vCenter, persistidas em disco por host e versão.
+
+    Para cada tipo de chamada (autenticação, tags da VM, detalhes de tag...) guarda
+    a variante de URL que respondeu 200 e, para os tipos de ENDPOINT_KINDS, as
+    variantes que retornaram 403/404.
+    """
+
+    NEGATIVE_STATUS = (403, 404)
+    # Tipos em que 403/404 diz respeito ao endpoint. Nos detalhes de um objeto (tag_detail,
+    # category_detail) o 404 pode ser do objeto removido, então não há cache negativo
+    ENDPOINT_KINDS = ('auth', 'vm_tags', 'category_list', 'tag_list', 'objects_on_tags', 'tags_on_objects')
+
+    def __init__(self, vcenter_host, version, cache_dir=DEFAULT_CACHE_DIR, ttl=DEFAULT_ENDPOINT_CACHE_TTL):
+        safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', f"{vcenter_host}_{version}")
+        self.path = os.path.join(cache_dir, f"endpoints_{safe_id}.json")
+        self.ttl = ttl
+        self.working = {}  # tipo -> [variante, timestamp]
+        self.failed = {}   # tipo -> {variante: timestamp}
+        self._pending = {}  # tipo -> variantes com 403/404 ainda não confirmadas
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        self.working = {
+            kind: entry for kind, entry in data.get('working', {}).items()
+            if now - entry[1] < self.ttl
+        }
+        self.failed = {
+            kind: {variant: ts for variant, ts in variants.items() if now - ts < self.ttl}
+            for kind, variants in data.get('failed', {}).items() if kind in self.ENDPOINT_KINDS
+        }
+
+    def save(self):
+        if not self._dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with self._lock, open(tmp_path, 'w') as f:
+                json.dump({'working': self.working, 'failed': self.failed}, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            display.warning(f"Não foi possível gravar o cache de endpoints em {self.path}: {str(e)}")
+
+    def ordered(self, kind, candidates, key=lambda candidate: candidate):
+        """Retorna os candidatos na ordem de tentativa: o que já funcionou primeiro, sem os reprovados"""
+        with self._lock:
+            working = self.working.get(kind, [None])[0]
+            failed = self.failed.get(kind, {})
+        usable = [candidate for candidate in candidates if key(candidate) not in failed]
+        return sorted(usable, key=lambda candidate: key(candidate) != working)
+
+    def mark_working(self, kind, variant):
+        """Registra a variante que funcionou e confirma o cache negativo das que falharam antes dela"""
+        with self._lock:
+            now = time.time()
+            if self.working.get(kind, [None])[0] != variant:
+                self.working[kind] = [variant, now]
+                self._dirty = True
+            for failed_variant in self._pending.pop(kind, set()) - {variant}:
+                self.failed.setdefault(kind, {})[failed_variant] = now
+                self._dirty = True
+
+    def mark_failed(self, kind, variant, status_code):
+        """403/404 de uma variante que nunca funcionou neste vCenter.
+
+        Só entra no cache negativo quando outra variante do mesmo tipo funcionar;
+        assim um 404 de um objeto removido não reprova todas as variantes. Tipos
+        fora de ENDPOINT_KINDS (detalhes de um objeto) nunca entram.
+        """
+        if status_code not in self.NEGATIVE_STATUS or kind not in self.ENDPOINT_KINDS:
+            return
+        with self._lock:
+            if self.working.get(kind, [None])[0] != variant:
+                self._pending.setdefault(kind, set()).add(variant)
+
+
+class VCenterIncrementalState:
+    """Estado do modo incremental de um vCenter/datacenter, persistido entre execuções.
+
+    Guarda o cookie da sessão SOAP, o PropertyCollector privado com seu filtro,
+    a última versão retornada por WaitForUpdatesEx e as propriedades normalizadas
+    de VMs e entidades. Cada execução aplica apenas enter/modify/leave desde a
+    versão anterior.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.session = {}   # cookie, versão do stub, morefs do coletor e das views
+        self.version = None
+        self.vms = {}       # moref -> propriedades normalizadas
+        self.entities = {}  # moref -> [nome, moref do pai]
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.session = data.get('session', {})
+        self.version = data.get('version')
+        self.vms = data.get('vms', {})
+        self.entities = data.get('entities', {})
+
+    def save(self, si):
+        self.session['cookie'] = si._stub.cookie
+        self.session['stub_version'] = getattr(si._stub, 'version', None)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            # O arquivo contém o cookie da sessão do vCenter: somente o dono pode ler
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({
+                    'session': self.session,
+                    'version': self.version,
+                    'vms': self.vms,
+                    'entities': self.entities
+                }, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            display.warning(f"Não foi possível gravar o estado incremental em {self.path}: {str(e)}")
+
+    def resume(self, host, port, context):
+        """Reabre a sessão SOAP da execução anterior; retorna None se ela expirou"""
+        if not self.session.get('cookie'):
+            return None
+        try:
+            stub_args = {'host': host, 'port': port, 'sslContext': context}
+            if self.session.get('stub_version'):
+                stub_args['version'] = self.session['stub_version']
+            stub = SoapStubAdapter(**stub_args)
+            stub.cookie = self.session['cookie']
+            si = vim.ServiceInstance('ServiceInstance', stub)
+            if si.content.sessionManager.currentSession is None:
+                return None
+            return si
+        except Exception as e:
+            display.v(f"Sessão anterior indisponível ({str(e)}), reconectando")
+            return None
+
+    def _apply_vm_update(self, object_update, refetch):
+        moref = object_update.obj._moId
+        if object_update.kind == 'leave':
+            self.vms.pop(moref, None)
+            return
+        props = self.vms.setdefault(moref, {})
+        for change in object_update.changeSet or []:
+            if change.name not in VM_PROPERTY_MAP:
+                # Alteração em parte de uma propriedade (ex: config.hardware.device[2000]):
+                # a VM é relida por completo
+                refetch.add(moref)
+                continue
+            key, normalize = VM_PROPERTY_MAP[change.name]
+            if change.op in ('remove', 'indirectRemove') or change.val is None:
+                props.pop(key, None)
+            else:
+                props[key] = normalize(change.val) if normalize else change.val
+
+    def _apply_entity_update(self, object_update):
+        moref = object_update.obj._moId
+        if object_update.kind == 'leave':
+            self.entities.pop(moref, None)
+            return
+        entity = self.entities.setdefault(moref, [None, None])
+        for change in object_update.changeSet or []:
+            value = None if change.op in ('remove', 'indirectRemove') else change.val
+            if change.name == 'name':
+                entity[0] = value
+            elif change.name == 'parent':
+                entity[1] = _moref_id(value)
+
+    def _refetch_vms(self, collector, stub, morefs):
+        object_specs = [
+            vmodl.query.PropertyCollector.ObjectSpec(obj=vim.VirtualMachine(moref, stub), skip=False)
+            for moref in morefs
+        ]
+        property_spec = vmodl.query.PropertyCollector.PropertySpec(
+            type=vim.VirtualMachine, pathSet=list(VM_PROPERTY_MAP), all=False
+        )
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=object_specs, propSet=[property_spec])
+        result = collector.RetrievePropertiesEx(specSet=[filter_spec], options=vmodl.query.PropertyCollector.RetrieveOptions())
+        while result:
+            for object_content in result.objects:
+                self.vms[object_content.obj._moId] = _normalize_vm_properties(
+                    {prop.name: prop.val for prop in object_content.propSet or []}
+                )
+            result = collector.ContinueRetrievePropertiesEx(token=result.token) if result.token else None
+
+    def _wait_for_updates(self, collector, stub, page_size):
+        """Consome as atualizações pendentes a partir de self.version, sem bloquear"""
+        options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=0, maxObjectUpdates=page_size)
+        counts = {'enter': 0, 'modify': 0, 'leave': 0}
+        refetch = set()
+        while True:
+            update_set = collector.WaitForUpdatesEx(version=self.version, options=options)
+            if update_set is None:
+                break
+            for filter_update in update_set.filterSet or []:
+                for object_update in filter_update.objectSet or []:
+                    counts[object_update.kind] = counts.get(object_update.kind, 0) + 1
+                    if isinstance(object_update.obj, vim.VirtualMachine):
+                        self._apply_vm_update(object_update, refetch)
+                    else:
+                        self._apply_entity_update(object_update)
+            self.version = update_set.version
+            if not update_set.truncated:
+                break
+
+        refetch &= set(self.vms)
+        if refetch:
+            self._refetch_vms(collector, stub, refetch)
+        display.v(f"Atualizações aplicadas: {counts['enter']} novas, {counts['modify']} alteradas, "
+                  f"{counts['leave']} removidas ({len(refetch)} VMs relidas)")
+
+    def _destroy_previous(self, si):
+        """Remove o coletor e as views da carga anterior, se a sessão ainda existir"""
+        for moref in self.session.get('views', []):
+            try:
+                vim.view.ContainerView(moref, si._stub).Destroy()
+            except Exception:
+                pass
+        if self.session.get('collector'):
+            try:
+                vmodl.query.PropertyCollector(self.session['collector'], si._stub).Destroy()
+            except Exception:
+                pass
+
+    def full_sync(self, si, content, datacenter, page_size):
+        """Cria um PropertyCollector privado com filtro sobre VMs e entidades e carrega tudo"""
+        self._destroy_previous(si)
+        self.version = ''
+        self.vms = {}
+        self.entities = {}
+
+        collector = content.propertyCollector.CreatePropertyCollector()
+        vm_view = content.viewManager.CreateContainerView(datacenter.vmFolder, [vim.VirtualMachine], True)
+        entity_view = content.viewManager.CreateContainerView(content.rootFolder, ENTITY_TYPES, True)
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=[_container_object_spec(vm_view), _container_object_spec(entity_view)],
+            propSet=[
+                vmodl.query.PropertyCollector.PropertySpec(
+                    type=vim.VirtualMachine, pathSet=list(VM_PROPERTY_MAP), all=False
+                ),
+                vmodl.query.PropertyCollector.PropertySpec(
+                    type=vim.ManagedEntity, pathSet=['name', 'parent'], all=False
+                ),
+            ]
+        )
+        collector.CreateFilter(filter_spec, partialUpdates=True)
+        self.session['collector'] = collector._moId
+        self.session['views'] = [vm_view._moId, entity_view._moId]
+
+        self._wait_for_updates(collector, si._stub, page_size)
+
+    def update(self, si, page_size):
+        """Aplica as alterações desde a última execução. Retorna False se for preciso recarregar tudo."""
+        if not self.session.get('collector') or not self.version:
+            return False
+        collector = vmodl.query.PropertyCollector(self.session['collector'], si._stub)
+        try:
+            self._wait_for_updates(collector, si._stub, page_size)
+            return True
+        except vmodl.MethodFault as e:
+            # InvalidCollectorVersion, ManagedObjectNotFound (coletor destruído)...
+            display.v(f"Versão incremental expirada ({type(e).__name__}), refazendo carga completa")
+            return False
+
+
+class VCenterTagIndex:
+    """Índice em memória de tags do vCenter: moref -> lista de tags (com categoria).
+
+    Tags e categorias são carregadas uma única vez por execução; as associações
+    com VMs são resolvidas em lote pelas ações da API tag-association.
+    """
+
+    def __init__(self, session, vcenter_host, sanitize, endpoints, workers=1, stats=None):
+        self.session = session
+        self.vcenter_host = vcenter_host
+        self.sanitize = sanitize
+        self.endpoints = endpoints
+        self.workers = workers
+        self.stats = stats or VCenterRunStats()
+        self.categories = {}  # category_id -> nome
+        self.tags = {}        # tag_id -> {'name', 'category', 'description'}
+        self.index = {}       # moref -> [tag, ...]
+        self.loaded = False
+
+    def _request(self, kind, method, urls, payload=None, object_id=None):
+        """Executa a requisição no primeiro formato de URL que responder 200 e retorna o conteúdo.
+
+        `urls` são modelos com {id}; a variante que funcionar é lembrada no cache de endpoints.
+        """
+        headers = {
+            'vmware-api-session-id': self.session.headers.get('vmware-api-session-id'),
+            'Accept': 'application/json'
+        }
+        if payload is not None:
+            headers['content-type'] = 'application/json'
+
+        for url in self.endpoints.ordered(kind, urls):
+            self.stats.incr('tag_calls')
+            try:
+                response = self.session.request(
+                    method,
+                    f"https://{self.vcenter_host}{url.format(id=object_id)}",
+                    headers=headers,
+                    data=json.dumps(payload) if payload is not None else None,
+                    timeout=30
+                )
+                if response.status_code == 200:
+                    self.endpoints.mark_working(kind, url)
+                    data = response.json()
+                    # /rest encapsula a resposta em 'value'; /api retorna o conteúdo direto
+                    return data.get('value') if isinstance(data, dict) and 'value' in data else data
+                self.endpoints.mark_failed(kind, url, response.status_code)
+                display.vvvv(f"{method} {url}: Status {response.status_code}")
+            except Exception as e:
+                display.vvvv(f"{method} {url} falhou: {str(e)}")
+        self.stats.incr('tag_failures')
+        return None
+
+    def _load_categories(self):
+        category_ids = self._request('category_list', 'GET', [
+            "/rest/com/vmware/cis/tagging/category",
+            "/api/cis/tagging/category",
+        ]) or []
+        categories = _concurrent_map(lambda category_id: self._request('category_detail', 'GET', [
+            "/rest/com/vmware/cis/tagging/category/id:{id}",
+            "/api/cis/tagging/category/{id}",
+        ], object_id=category_id), category_ids, self.workers)
+        for category_id, category in zip(category_ids, categories):
+            if category:
+                self.categories[category_id] = category.get('name')
+
+    def _load_tags(self):
+        tag_ids = self._request('tag_list', 'GET', [
+            "/rest/com/vmware/cis/tagging/tag",
+            "/api/cis/tagging/tag",
+        ])
+        if tag_ids is None:
+            return False
+        tags = _concurrent_map(lambda tag_id: self._request('tag_detail', 'GET', [
+            "/rest/com/vmware/cis/tagging/tag/id:{id}",
+            "/api/cis/tagging/tag/{id}",
+        ], object_id=tag_id), tag_ids, self.workers)
+        for tag_id, tag in zip(tag_ids, tags):
+            if not tag:
+                continue
+            tag_info = TagRef(
+                self.sanitize(tag.get('name')),
+                self.sanitize(self.categories.get(tag.get('category_id'))),
+                self.sanitize(tag.get('description')),
+            )
+            if tag_info.name:
+                self.tags[tag_id] = tag_info
+        return True
+
+    def _attach(self, moref, tag_id):
+        tag = self.tags.get(tag_id)
+        if tag:
+            self.index.setdefault(moref, []).append(tag)
+
+    def _index_objects_on_tags(self):
+        """Uma chamada por lote de tags: list-attached-objects-on-tags"""
+        tag_ids = list(self.tags)
+        for start in range(0, len(tag_ids), TAG_BATCH_SIZE):
+            associations = self._request('objects_on_tags', 'POST', [
+                "/rest/com/vmware/cis/tagging/tag-association?~action=list-attached-objects-on-tags",
+                "/api/cis/tagging/tag-association?action=list-attached-objects-on-tags",
+            ], {'tag_ids': tag_ids[start:start + TAG_BATCH_SIZE]})
+            if associations is None:
+                return False
+            for association in associations:
+                for object_id in association.get('object_ids', []):
+                    if object_id.get('type') == 'VirtualMachine':
+                        self._attach(object_id.get('id'), association.get('tag_id'))
+        return True
+
+    def _index_tags_on_objects(self, vm_ids):
+        """Uma chamada por lote de VMs: list-attached-tags-on-objects"""
+        for start in range(0, len(vm_ids), TAG_BATCH_SIZE):
+            object_ids = [{'type': 'VirtualMachine', 'id': vm_id} for vm_id in vm_ids[start:start + TAG_BATCH_SIZE]]
+            associations = self._request('tags_on_objects', 'POST', [
+                "/rest/com/vmware/cis/tagging/tag-association?~action=list-attached-tags-on-objects",
+                "/api/cis/tagging/tag-association?action=list-attached-tags-on-objects",
+            ], {'object_ids': object_ids})
+            if associations is None:
+                return False
+            for association in associations:
+                moref = association.get('object_id', {}).get('id')
+                for tag_id in association.get('tag_ids', []):
+                    self._attach(moref, tag_id)
+        return True
+
+    def load(self, vm_ids_provider):
+        """Carrega tags, categorias e associações. Retorna False se a API em lote não estiver disponível."""
+        display.v(f"Carregando tags e categorias do vCenter {self.vcenter_host}")
+        self._load_categories()
+        if not self._load_tags():
+            return False
+
+        if not self._index_objects_on_tags():
+            # Descartar associações parciais antes de usar o método alternativo
+            self.index = {}
+            display.v("list-attached-objects-on-tags indisponível, usando list-attached-tags-on-objects")
+            if not self._index_tags_on_objects(vm_ids_provider()):
+                self.index = {}
+                return False
+
+        # Ordenar as tags de cada VM pela ordem de listagem do vCenter (resultado determinístico)
+        order = {id(tag): position for position, tag in enumerate(self.tags.values())}
+        for tags in self.index.values():
+            tags.sort(key=lambda tag: order[id(tag)])
+
+        self.loaded = True
+        display.v(f"{len(self.tags)} tags, {len(self.categories)} categorias, {len(self.index)} VMs com tags")
+        return True
+
+    def tags_for(self, moref):
+        return self.index.get(moref, [])
+
+
+class InventoryModule(BaseInventoryPlugin, Cacheable):
     NAME = 'vmware_dynamic'
 
     def verify_file(self, path):
@@ -35,47 +1262,17 @@ class InventoryModule(BaseInventoryPlugin):
 
     def _sanitize_string(self, value):
         """Sanitiza strings para evitar problemas de JSON/YAML, preservando acentos."""
-        if value is None:
-            return None
         if isinstance(value, str):
-            # Remove caracteres de controle, que são invisíveis e quebram o JSON
-            value = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', value)
-            
-            # Remove sequências problemáticas que podem quebrar JSON/YAML
-            problematic_patterns = [
-                r'"[^"]*"[^"]*"[^"]*"',  # Múltiplas aspas duplas
-                r"'[^']*'[^']*'[^']*'",  # Múltiplas aspas simples
-                r'\{[^}]*\}[^}]*\}',      # Múltiplas chaves
-                r'}}}}',                  # Sequência de chaves problemática
-                r'""',                    # Aspas duplas vazias
-                r"''"                     # Aspas simples vazias
-            ]
-            
-            for pattern in problematic_patterns:
-                value = re.sub(pattern, '', value)
-            
-            # Sanitização básica que não afeta os acentos
-            value = value.replace('"', "'").replace("'", "").replace('\n', ' ').replace('\r', ' ')
-            value = value.replace('\\', '/').replace('{', '').replace('}', '')
-            
-            # A LINHA PROBLEMÁTICA FOI REMOVIDA DAQUI
-            # A linha original `re.sub(r'[^\x20-\x7E]', '', value)` removia todos os caracteres não-ASCII.
-            
-            # Remove espaços múltiplos
-            value = re.sub(r'\s+', ' ', value)
-            
-            # Remove caracteres que podem quebrar o parsing de forma agressiva.
-            # Esta parte da lógica original foi mantida para segurança.
-            value = value.replace(':', '').replace(',', '').replace('[', '').replace(']', '')
-            
-            return value.strip()
+            return _sanitize_text(value)
         return value
 
-    def _get_vcenter_rest_session(self, vcenter_host, username, password):
+    def _get_vcenter_rest_session(self, vcenter_host, username, password, workers=1):
         """Cria uma sessão REST autenticada com o vCenter - Versão robusta para AWX"""
+        endpoints = self._endpoint_caches[vcenter_host]
         try:
-            session = requests.Session()
+            session = _configure_rest_pool(requests.Session(), vcenter_host, workers)
             session.verify = False
+            session.hooks['response'].append(self._stats.response_hook)
             
             # Desabilitar avisos SSL
             import urllib3
@@ -83,14 +1280,14 @@ class InventoryModule(BaseInventoryPlugin):
             
             # Tentar diferentes endpoints de autenticação (compatibilidade com diferentes versões)
             auth_endpoints = [
-                f"https://{vcenter_host}/rest/com/vmware/cis/session",  # vCenter 6.5+
-                f"https://{vcenter_host}/api/session",                   # vCenter 7.0+
-                f"https://{vcenter_host}/rest/com/vmware/cis/session",   # Backup
+                "/rest/com/vmware/cis/session",  # vCenter 6.5+
+                "/api/session",                  # vCenter 7.0+
             ]
             
-            for auth_url in auth_endpoints:
+            for auth_path in endpoints.ordered('auth', auth_endpoints):
+                auth_url = f"https://{vcenter_host}{auth_path}"
                 try:
-                    print(f"🔐 Tentando autenticação em: {auth_url}")
+                    display.vvvv(f"Tentando autenticação em: {auth_url}")
                     auth_response = session.post(
                         auth_url, 
                         auth=(username, password), 
@@ -99,6 +1296,7 @@ class InventoryModule(BaseInventoryPlugin):
                     )
                     
                     if auth_response.status_code == 200:
+                        endpoints.mark_working('auth', auth_path)
                         response_data = auth_response.json()
                         
                         # Diferentes versões retornam a sessão de formas diferentes
@@ -109,27 +1307,28 @@ class InventoryModule(BaseInventoryPlugin):
                             session_id = response_data
                             session.headers.update({'vmware-api-session-id': session_id})
                         
-                        print(f"✅ Sessão REST criada com sucesso usando {auth_url}")
-                        print(f"✅ Session ID: {session_id[:20]}...")
+                        display.v(f"Sessão REST criada com sucesso usando {auth_url}")
                         return session
                         
                     else:
-                        print(f"⚠️  Falha em {auth_url}: Status {auth_response.status_code}")
+                        endpoints.mark_failed('auth', auth_path, auth_response.status_code)
+                        display.vvvv(f"Falha em {auth_url}: Status {auth_response.status_code}")
                         continue
                         
                 except Exception as e:
-                    print(f"⚠️  Erro em {auth_url}: {str(e)}")
+                    display.vvvv(f"Erro em {auth_url}: {str(e)}")
                     continue
             
-            print(f"❌ Falha em todos os endpoints de autenticação")
+            display.vv(f"Falha em todos os endpoints de autenticação de {vcenter_host}")
             return None
                     
         except Exception as e:
-            print(f"❌ Erro geral na criação da sessão REST: {str(e)}")
+            display.vv(f"Erro geral na criação da sessão REST: {str(e)}")
             return None
 
     def _get_vm_tags_via_rest(self, session, vcenter_host, vm_id):
         """Busca tags de uma VM usando a API REST do vCenter - Versão robusta para AWX"""
+        endpoints = self._endpoint_caches[vcenter_host]
         if not session:
             return []
             
@@ -138,6 +1337,7 @@ class InventoryModule(BaseInventoryPlugin):
             tag_endpoints = [
                 # Método 1: Tag Association (mais compatível)
                 {
+                    'key': 'list-attached-tags',
                     'url': f"https://{vcenter_host}/rest/com/vmware/cis/tagging/tag-association?~action=list-attached-tags",
                     'method': 'POST',
                     'payload': {
@@ -149,12 +1349,14 @@ class InventoryModule(BaseInventoryPlugin):
                 },
                 # Método 2: Endpoint direto (vCenter 7.0+)
                 {
+                    'key': '/rest/vcenter/vm/{id}/tags',
                     'url': f"https://{vcenter_host}/rest/vcenter/vm/{vm_id}/tags",
                     'method': 'GET',
                     'payload': None
                 },
                 # Método 3: API alternativa
                 {
+                    'key': '/api/vcenter/vm/{id}/tags',
                     'url': f"https://{vcenter_host}/api/vcenter/vm/{vm_id}/tags",
                     'method': 'GET', 
                     'payload': None
@@ -163,14 +1365,13 @@ class InventoryModule(BaseInventoryPlugin):
             
             session_id = session.headers.get('vmware-api-session-id')
             if not session_id:
-                print(f"   ❌ Session ID não encontrado nos headers")
+                display.vv("Session ID não encontrado nos headers")
                 return []
             
-            print(f"   🔍 Buscando tags para VM ID: {vm_id}")
-            
+            tag_endpoints = endpoints.ordered('vm_tags', tag_endpoints, key=lambda endpoint: endpoint['key'])
             for i, endpoint in enumerate(tag_endpoints, 1):
                 try:
-                    print(f"   🔄 Método {i}: {endpoint['method']} {endpoint['url']}")
+                    self._stats.incr('tag_calls')
                     
                     headers = {
                         'vmware-api-session-id': session_id,
@@ -192,60 +1393,68 @@ class InventoryModule(BaseInventoryPlugin):
                             timeout=30
                         )
                     
-                    print(f"   📊 Resposta: Status {response.status_code}")
-                    
                     if response.status_code == 200:
+                        endpoints.mark_working('vm_tags', endpoint['key'])
                         tag_ids = response.json().get('value', [])
-                        print(f"   ✅ Sucesso! {len(tag_ids)} tag IDs encontrados usando método {i}")
+                        display.vvvv(f"{len(tag_ids)} tag IDs encontrados para {vm_id} usando método {i}")
                         
                         if not tag_ids:
-                            print(f"   ℹ️  VM não possui tags atribuídas")
                             return []
                         
                         # Processar tags encontradas
                         return self._process_tag_details(session, vcenter_host, tag_ids)
                     
                     elif response.status_code == 403:
-                        print(f"   ⚠️  Método {i}: Erro 403 - Sem permissão")
+                        endpoints.mark_failed('vm_tags', endpoint['key'], 403)
+                        display.vvvv(f"Método {i} ({endpoint['url']}): Erro 403 - Sem permissão")
                         continue
                     elif response.status_code == 404:
-                        print(f"   ⚠️  Método {i}: Erro 404 - Recurso não encontrado")
+                        endpoints.mark_failed('vm_tags', endpoint['key'], 404)
+                        display.vvvv(f"Método {i} ({endpoint['url']}): Erro 404 - Recurso não encontrado")
                         continue
                     else:
-                        print(f"   ⚠️  Método {i}: Status {response.status_code} - {response.text[:100]}")
+                        display.vvvv(f"Método {i} ({endpoint['url']}): Status {response.status_code} - {response.text[:100]}")
                         continue
                         
                 except Exception as e:
-                    print(f"   ❌ Método {i} falhou: {str(e)}")
+                    display.vvvv(f"Método {i} ({endpoint['url']}) falhou: {str(e)}")
                     continue
             
-            print(f"   ❌ Todos os métodos falharam para buscar tags")
+            self._stats.incr('tag_failures')
+            display.vv(f"Todos os métodos falharam para buscar tags da VM {vm_id}")
             return []
             
         except Exception as e:
-            print(f"❌ Erro geral ao buscar tags via REST: {str(e)}")
+            self._stats.incr('tag_failures')
+            display.vv(f"Erro geral ao buscar tags via REST: {str(e)}")
             return []
 
     def _process_tag_details(self, session, vcenter_host, tag_ids):
         """Processa os detalhes das tags encontradas"""
+        endpoints = self._endpoint_caches[vcenter_host]
         tags = []
         session_id = session.headers.get('vmware-api-session-id')
         
         for tag_id in tag_ids:
+            # Tags repetidas entre VMs são buscadas uma única vez por execução
+            if (vcenter_host, tag_id) in self._tag_details_cache:
+                if self._tag_details_cache[(vcenter_host, tag_id)]:
+                    tags.append(self._tag_details_cache[(vcenter_host, tag_id)])
+                continue
+
             try:
-                print(f"   🔍 Processando tag: {tag_id}")
-                
                 # Múltiplos endpoints para detalhes da tag
                 tag_detail_endpoints = [
-                    f"https://{vcenter_host}/rest/com/vmware/cis/tagging/tag/id:{tag_id}",
-                    f"https://{vcenter_host}/api/cis/tagging/tag/id:{tag_id}",
-                    f"https://{vcenter_host}/rest/com/vmware/cis/tagging/tag/{tag_id}",
+                    "/rest/com/vmware/cis/tagging/tag/id:{id}",
+                    "/api/cis/tagging/tag/id:{id}",
+                    "/rest/com/vmware/cis/tagging/tag/{id}",
                 ]
                 
                 tag_found = False
-                for endpoint_url in tag_detail_endpoints:
+                for endpoint_path in endpoints.ordered('tag_detail', tag_detail_endpoints):
+                    endpoint_url = f"https://{vcenter_host}{endpoint_path.format(id=tag_id)}"
                     try:
-                        print(f"     🔍 Tentando: {endpoint_url}")
+                        self._stats.incr('tag_calls')
                         tag_response = session.get(
                             endpoint_url, 
                             headers={'vmware-api-session-id': session_id}, 
@@ -253,57 +1462,67 @@ class InventoryModule(BaseInventoryPlugin):
                         )
                         
                         if tag_response.status_code == 200:
+                            endpoints.mark_working('tag_detail', endpoint_path)
                             tag_data = tag_response.json().get('value', {})
-                            print(f"     ✅ Tag encontrada: {tag_data.get('name')}")
                             
                             # Buscar detalhes da categoria
                             category_id = tag_data.get('category_id')
                             category_name = self._get_category_name(session, vcenter_host, category_id)
                             
-                            tag_info = {
-                                'name': self._sanitize_string(tag_data.get('name')),
-                                'category': self._sanitize_string(category_name),
-                                'description': self._sanitize_string(tag_data.get('description'))
-                            }
+                            tag_info = TagRef(
+                                self._sanitize_string(tag_data.get('name')),
+                                self._sanitize_string(category_name),
+                                self._sanitize_string(tag_data.get('description')),
+                            )
                             
-                            if tag_info['name']:
+                            if tag_info.name:
                                 tags.append(tag_info)
-                                print(f"   ✅ Tag processada: {tag_info['name']} (categoria: {tag_info['category']})")
+                                display.vvvv(f"Tag {tag_id}: {tag_info.name} (categoria: {tag_info.category})")
                             
+                            self._tag_details_cache[(vcenter_host, tag_id)] = tag_info if tag_info.name else None
                             tag_found = True
                             break
                             
                         elif tag_response.status_code == 403:
-                            print(f"     ⚠️  Erro 403: Sem permissão")
+                            endpoints.mark_failed('tag_detail', endpoint_path, 403)
+                            display.vvvv(f"{endpoint_url}: Erro 403 - Sem permissão")
                         else:
-                            print(f"     ⚠️  Status {tag_response.status_code}")
+                            endpoints.mark_failed('tag_detail', endpoint_path, tag_response.status_code)
+                            display.vvvv(f"{endpoint_url}: Status {tag_response.status_code}")
                             
                     except Exception as e:
-                        print(f"     ❌ Erro: {str(e)}")
+                        display.vvvv(f"{endpoint_url} falhou: {str(e)}")
                         continue
                 
                 if not tag_found:
-                    print(f"   ⚠️  Não foi possível obter detalhes da tag {tag_id}")
+                    self._stats.incr('tag_failures')
+                    display.vv(f"Não foi possível obter detalhes da tag {tag_id}")
                     
             except Exception as e:
-                print(f"   ❌ Erro ao processar tag {tag_id}: {str(e)}")
+                self._stats.incr('tag_failures')
+                display.vv(f"Erro ao processar tag {tag_id}: {str(e)}")
                 continue
         
         return tags
 
     def _get_category_name(self, session, vcenter_host, category_id):
         """Busca o nome da categoria da tag"""
+        endpoints = self._endpoint_caches[vcenter_host]
         if not category_id:
             return None
+        if (vcenter_host, category_id) in self._category_name_cache:
+            return self._category_name_cache[(vcenter_host, category_id)]
             
         session_id = session.headers.get('vmware-api-session-id')
         category_endpoints = [
-            f"https://{vcenter_host}/rest/com/vmware/cis/tagging/category/id:{category_id}",
-            f"https://{vcenter_host}/api/cis/tagging/category/id:{category_id}",
-            f"https://{vcenter_host}/rest/com/vmware/cis/tagging/category/{category_id}",
+            "/rest/com/vmware/cis/tagging/category/id:{id}",
+            "/api/cis/tagging/category/id:{id}",
+            "/rest/com/vmware/cis/tagging/category/{id}",
         ]
         
-        for category_url in category_endpoints:
+        for category_path in endpoints.ordered('category_detail', category_endpoints):
+            category_url = f"https://{vcenter_host}{category_path.format(id=category_id)}"
+            self._stats.incr('tag_calls')
             try:
                 category_response = session.get(
                     category_url, 
@@ -311,11 +1530,14 @@ class InventoryModule(BaseInventoryPlugin):
                     timeout=30
                 )
                 if category_response.status_code == 200:
+                    endpoints.mark_working('category_detail', category_path)
                     category_data = category_response.json().get('value', {})
                     category_name = category_data.get('name')
                     if category_name:
-                        print(f"     ✅ Categoria encontrada: {category_name}")
+                        self._category_name_cache[(vcenter_host, category_id)] = category_name
                         return category_name
+                else:
+                    endpoints.mark_failed('category_detail', category_path, category_response.status_code)
             except Exception:
                 continue
         
@@ -331,7 +1553,7 @@ class InventoryModule(BaseInventoryPlugin):
                 tag_manager = content.tagManager if hasattr(content, 'tagManager') else None
             
             if not tag_manager:
-                print("   ⚠️  Tag Manager não disponível nesta versão do vCenter")
+                display.vvv("Tag Manager não disponível nesta versão do vCenter")
                 return []
             
             # Obter tags associadas à VM
@@ -343,394 +1565,642 @@ class InventoryModule(BaseInventoryPlugin):
                     tag = tag_manager.GetTag(tag_id)
                     category = tag_manager.GetCategory(tag.categoryId)
                     
-                    tag_info = {
-                        'name': self._sanitize_string(tag.name),
-                        'category': self._sanitize_string(category.name),
-                        'description': self._sanitize_string(tag.description)
-                    }
+                    key = (
+                        self._sanitize_string(tag.name),
+                        self._sanitize_string(category.name),
+                        self._sanitize_string(tag.description),
+                    )
+                    # Uma TagRef por tag na execução, compartilhada pelas VMs
+                    if key not in self._tag_refs:
+                        self._tag_refs[key] = TagRef(*key)
                     
-                    if tag_info['name']:
-                        tags.append(tag_info)
-                        print(f"   ✅ Tag encontrada via pyVmomi: {tag_info['name']} ({tag_info['category']})")
+                    if key[0]:
+                        tags.append(self._tag_refs[key])
                         
                 except Exception as e:
-                    print(f"   ⚠️  Erro ao processar tag {tag_id}: {str(e)}")
+                    display.vv(f"Erro ao processar tag {tag_id} via pyVmomi: {str(e)}")
                     continue
                     
             return tags
             
         except AttributeError:
-            print("   ℹ️  API de tags não disponível via pyVmomi nesta versão")
+            display.vvv("API de tags não disponível via pyVmomi nesta versão")
             return []
         except Exception as e:
-            print(f"   ⚠️  Erro ao buscar tags via pyVmomi: {str(e)}")
+            display.vv(f"Erro ao buscar tags via pyVmomi: {str(e)}")
             return []
 
-    def _cleanup_awx_variables(self):
-        """Remove variáveis problemáticas que o AWX pode injetar automaticamente"""
-        print("🧹 Executando limpeza agressiva de variáveis AWX...")
-        
-        for host_name in list(self.inventory.hosts.keys()):
-            host = self.inventory.hosts[host_name]
-            # Criar cópia das variáveis para iteração segura
-            vars_to_remove = []
-            
-            for var_name, var_value in list(host.vars.items()):
-                should_remove = False
-                
-                # 1. Remover qualquer variável que comece com padrões AWX
-                if any(var_name.startswith(prefix) for prefix in ['remote_', 'tower_', 'awx_']):
-                    should_remove = True
-                    print(f"🚫 Removendo variável AWX: {var_name} do host {host_name}")
-                
-                # 2. Remover variáveis problemáticas específicas
-                problematic_vars = [
-                    'remote_host_enabled', 'remote_host_id', 'remote_tower_enabled', 'remote_tower_id',
-                    'tower_enabled', 'tower_id', 'awx_enabled', 'awx_id', 'ansible_host_key_checking',
-                    'ansible_ssh_common_args', 'ansible_ssh_extra_args', 'ansible_connection_timeout'
-                ]
-                if var_name in problematic_vars:
-                    should_remove = True
-                    print(f"🚫 Removendo variável problemática: {var_name} do host {host_name}")
-                
-                # 3. Remover variáveis com valores que contêm caracteres problemáticos
-                if isinstance(var_value, str):
-                    problematic_patterns = ['"}}}}', '"}', "'}", "{{", "}}", '564dba5b-c886-5576-5ce2-8e7f4889d270']
-                    if any(pattern in var_value for pattern in problematic_patterns):
-                        should_remove = True
-                        print(f"🚫 Removendo variável com padrão problemático: {var_name} do host {host_name}")
-                
-                # 4. Remover variáveis com IDs suspeitos
-                if isinstance(var_value, (int, str)) and str(var_value) in ['1063', '1064']:
-                    should_remove = True
-                    print(f"🚫 Removendo variável com ID suspeito: {var_name}={var_value} do host {host_name}")
-                
-                if should_remove:
-                    vars_to_remove.append(var_name)
-            
-            # Remover variáveis identificadas
-            for var_name in vars_to_remove:
-                if var_name in host.vars:
-                    del host.vars[var_name]
-        
-        print(f"✅ Limpeza concluída para {len(self.inventory.hosts)} hosts")
+    def _retrieve_properties(self, content, container, obj_type, path_set, page_size, release=None):
+        """Busca propriedades em lote via PropertyCollector, página a página.
 
-    def _validate_inventory_json(self):
-        """Valida se o inventário pode ser serializado como JSON válido"""
+        Usa um TraversalSpec sobre a ContainerView para que uma única chamada
+        RetrievePropertiesEx retorne as propriedades de todos os objetos da view;
+        as páginas seguintes são obtidas com ContinueRetrievePropertiesEx. Só uma
+        página fica em memória: ela é liberada antes de a seguinte ser buscada.
+        `release` é chamado quando a última página chega (a view não é mais necessária).
+        """
+        collector = content.propertyCollector
+        object_spec = _container_object_spec(container)
+        property_spec = vmodl.query.PropertyCollector.PropertySpec(
+            type=obj_type,
+            pathSet=path_set,
+            all=False
+        )
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=[object_spec],
+            propSet=[property_spec]
+        )
+        options = vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=page_size)
+
+        result = self._stats.timed_call(
+            'SOAP RetrievePropertiesEx', collector.RetrievePropertiesEx, specSet=[filter_spec], options=options
+        )
+        token = None
         try:
-            # Tenta serializar o inventário como JSON
-            inventory_dict = {}
-            for host_name in self.inventory.hosts:
-                host = self.inventory.hosts[host_name]
-                host_vars = {}
-                for k, v in host.vars.items():
-                    # Garantir que todos os valores são JSON serializáveis
-                    if isinstance(v, str):
-                        v = self._sanitize_string(v)
-                    host_vars[k] = v
-                inventory_dict[host_name] = host_vars
-            
-            # Testa serialização JSON
-            json.dumps(inventory_dict)
-            
-        except (TypeError, ValueError) as e:
-            print(f"Aviso: Problema de serialização JSON detectado: {e}")
-            # Remove hosts problemáticos se necessário
-            self._remove_problematic_hosts()
-
-    def _remove_problematic_hosts(self):
-        """Remove hosts que não podem ser serializados como JSON"""
-        hosts_to_remove = []
-        for host_name in self.inventory.hosts:
-            try:
-                host = self.inventory.hosts[host_name]
-                json.dumps(dict(host.vars))
-            except (TypeError, ValueError):
-                hosts_to_remove.append(host_name)
-                print(f"Removendo host problemático: {host_name}")
-        
-        for host_name in hosts_to_remove:
-            self.inventory.remove_host(host_name)
-    
-    def _final_cleanup(self):
-        """Limpeza final AGRESSIVA para garantir JSON válido"""
-        print("🔥 Executando limpeza final agressiva...")
-        
-        hosts_to_remove = []
-        for host_name in list(self.inventory.hosts.keys()):
-            host = self.inventory.hosts[host_name]
-            vars_to_remove = []
-            
-            # Lista COMPLETA de todas as variáveis e padrões problemáticos
-            for var_name, var_value in list(host.vars.items()):
-                should_remove = False
-                
-                # Remover QUALQUER variável AWX/Tower/Remote
-                awx_patterns = ['remote_', 'tower_', 'awx_', 'ansible_host_key', 'ansible_ssh']
-                if any(pattern in var_name.lower() for pattern in awx_patterns):
-                    should_remove = True
-                
-                # Remover variáveis com valores suspeitos
-                if isinstance(var_value, str):
-                    suspicious_content = [
-                        '564dba5b-c886-5576-5ce2-8e7f4889d270', '564d8ad9-0b54-c1b0-7658-8a0fd40a73f1',
-                        '"remote_host_enabled"', '"remote_tower_enabled"', '}}}}', 'No closing quotation',
-                        '"}}', '"}', '{{', '}}'
-                    ]
-                    if any(content in str(var_value) for content in suspicious_content):
-                        should_remove = True
-                
-                # Remover IDs específicos problemáticos
-                if var_name in ['remote_host_id', 'remote_tower_id'] or str(var_value) in ['1063', '1064']:
-                    should_remove = True
-                
-                if should_remove:
-                    vars_to_remove.append(var_name)
-                    print(f"🔥 REMOVENDO FINAL: {var_name}={var_value} do host {host_name}")
-            
-            # Aplicar remoções
-            for var_name in vars_to_remove:
-                if var_name in host.vars:
-                    del host.vars[var_name]
-            
-            # Teste final de serialização JSON
+            while result:
+                page, token = result.objects, result.token
+                result = None
+                if not token and release:
+                    release()
+                for object_content in page:
+                    yield object_content.obj, {prop.name: prop.val for prop in object_content.propSet or []}
+                page = None
+                if token:
+                    result = self._stats.timed_call(
+                        'SOAP ContinueRetrievePropertiesEx', collector.ContinueRetrievePropertiesEx, token=token
+                    )
+                    token = None
+        finally:
+            # Liberar o resultado no servidor se a iteração for interrompida no meio
+            if token:
+                try:
+                    collector.CancelRetrievePropertiesEx(token=token)
+                except Exception:
+                    pass
+
+    def _retrieve_entity_tree(self, content, page_size):
+        """Mapeia moref -> (nome, moref do pai) de pastas, datacenters, clusters, hosts e resource pools"""
+        container = content.viewManager.CreateContainerView(content.rootFolder, ENTITY_TYPES, True)
+        try:
+            return {
+                obj._moId: (props.get('name'), _moref_id(props.get('parent')))
+                for obj, props in self._retrieve_properties(
+                    content, container, vim.ManagedEntity, ['name', 'parent'], page_size
+                )
+            }
+        finally:
+            container.Destroy()
+
+    def _resolve_entity_names(self, props, entities):
+        """Resolve datacenter, cluster e pasta da VM a partir do mapa de entidades"""
+        def ancestor(moref, levels):
+            for _ in range(levels):
+                if moref not in entities:
+                    return None
+                moref = entities[moref][1]
+            return moref
+
+        def entity_name(moref):
+            return entities[moref][0] if moref in entities else None
+
+        host = props.get('host')
+        # Equivalente a runtime.host.parent.parent.parent.name e runtime.host.parent.name
+        props['datacenter'] = entity_name(ancestor(host, 3)) if host else None
+        props['cluster'] = entity_name(ancestor(host, 1)) if host else None
+        props['folder'] = entity_name(props.get('parent'))
+        return props
+
+    def _iter_vm_properties_bulk(self, content, container, page_size, release=None):
+        """Gera (moref da VM, propriedades normalizadas) usando o PropertyCollector"""
+        entities = self._retrieve_entity_tree(content, page_size)
+        path_set = [path for path, _, _ in VM_PROPERTIES]
+
+        for vm, raw_props in self._retrieve_properties(content, container, vim.VirtualMachine, path_set, page_size, release):
+            yield vm, self._resolve_entity_names(_normalize_vm_properties(raw_props), entities)
+
+    def _iter_vm_properties_incremental(self, si, state):
+        """Gera (VM, propriedades normalizadas) a partir do estado incremental já atualizado"""
+        for moref, props in state.vms.items():
+            vm = vim.VirtualMachine(moref, si._stub)
+            yield vm, self._resolve_entity_names(dict(props), state.entities)
+
+    def _iter_vm_properties_legacy(self, container, release=None):
+        """Gera (VM, propriedades normalizadas) lendo os atributos de cada VM individualmente"""
+        vms = container.view
+        # A leitura das VMs usa só as referências, sem a view
+        if release:
+            release()
+        for vm in vms:
             try:
-                test_data = {host_name: dict(host.vars)}
-                json.dumps(test_data)
-            except (TypeError, ValueError, UnicodeDecodeError) as e:
-                print(f"❌ Host {host_name} ainda tem problemas de JSON, removendo completamente: {e}")
-                hosts_to_remove.append(host_name)
-        
-        # Remover hosts que ainda têm problemas
-        for host_name in hosts_to_remove:
-            self.inventory.remove_host(host_name)
-            print(f"🗑️ Removido host problemático: {host_name}")
-        
-        print(f"✅ Limpeza final concluída. Hosts restantes: {len(self.inventory.hosts)}")
+                config = vm.config
+                if not config:
+                    continue
 
-    def parse(self, inventory, loader, path, cache=True):
-        self.inventory = inventory
-        self.loader = loader
+                summary = vm.summary
+                runtime = vm.runtime
+                guest = vm.guest
+                host = runtime.host if runtime else None
 
-        vcenter_config = {
-            'host': os.environ.get('VCENTER_HOST'),
+                props = {
+                    'name': vm.name,
+                    'template': config.template,
+                    'uuid': config.uuid,
+                    'guest_full_name': config.guestFullName,
+                    'disk_total_gb': _disk_total_gb(config.hardware.device if config.hardware else None),
+                    'num_cpu': summary.config.numCpu if summary.config else None,
+                    'memory_mb': summary.config.memorySizeMB if summary.config else None,
+                    'power_state': runtime.powerState if runtime else None,
+                    'guest_family': guest.guestFamily if guest else None,
+                    'host_name': guest.hostName if guest else None,
+                    'tools_status': guest.toolsStatus if guest else None,
+                    'ip_addresses': _nic_ip_addresses(guest.net if guest else None),
+                    'datacenter': host.parent.parent.parent.name if host else None,
+                    'cluster': host.parent.name if host else None,
+                    'folder': vm.parent.name if vm.parent else None,
+                }
+                yield vm, props
+
+            except Exception as e:
+                self._stats.incr('vm_errors')
+                display.vv(f"Erro processando VM {getattr(vm, 'name', 'unknown')}: {str(e)}")
+                continue
+
+    def _timed_iter(self, phase, iterable):
+        """Repassa os itens de `iterable` somando à fase o tempo gasto para obter cada um"""
+        iterator = iter(iterable)
+        try:
+            while True:
+                with self._stats.phase(phase):
+                    item = next(iterator, _EXHAUSTED)
+                if item is _EXHAUSTED:
+                    return
+                yield item
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    def _is_collectable(self, props):
+        """Ignora VMs sem configuração (inacessíveis) e templates"""
+        name = props.get('name')
+        return props.get('template') is False and bool(name) and not name.startswith('template')
+
+    def _prefetch_vm_tags(self, vm_properties, rest_session, vcenter_host, workers):
+        """Busca as tags REST das VMs em paralelo, em blocos, preservando a ordem das VMs.
+
+        Gera (vm, propriedades, tags pré-carregadas, segundos gastos nas tags) para o laço principal.
+        """
+        def fetch(moref):
+            started = time.monotonic()
+            return self._timed_vm_tags(rest_session, vcenter_host, moref), time.monotonic() - started
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                chunk = list(itertools.islice(vm_properties, workers * 4))
+                if not chunk:
+                    break
+                morefs = [vm._moId for vm, props in chunk if hasattr(vm, '_moId') and self._is_collectable(props)]
+                tags_by_moref = dict(zip(morefs, executor.map(fetch, morefs)))
+                for vm, props in chunk:
+                    yield (vm, props) + tags_by_moref.get(getattr(vm, '_moId', None), (None, 0.0))
+
+    def _timed_vm_tags(self, rest_session, vcenter_host, moref):
+        with self._stats.phase('tags_por_vm'):
+            return self._get_vm_tags_via_rest(rest_session, vcenter_host, moref)
+
+    def _filter_host_vars(self, host_name, vm_data):
+        """Aplica as regras de variáveis de host uma única vez, no momento em que são definidas.
+
+        Retorna as variáveis sanitizadas e aceitas, ou None se o host não puder ser
+        serializado como JSON (e deve ser descartado).
+        """
+        host_vars = {}
+        for k, v in vm_data.items():
+            if v is None:
+                continue
+
+            # Bloquear qualquer variável que não seja explicitamente VMware
+            if k in BLOCKED_VAR_NAMES or not k.startswith(ALLOWED_VAR_PREFIXES) or _BLOCKED_VAR_NAME_PATTERN.search(k):
+                self._stats.incr('vars_blocked')
+                display.vvv(f"Variável bloqueada: {k} do host {host_name} (AWX/não permitida)")
+                continue
+
+            if isinstance(v, str):
+                # Sanitizar valores que podem conter caracteres especiais
+                v = self._sanitize_string(v)
+                if _SUSPICIOUS_VALUE_PATTERN.search(v):
+                    self._stats.incr('vars_blocked')
+                    display.vvv(f"Variável removida: {k} do host {host_name} (padrão problemático)")
+                    continue
+            elif isinstance(v, (list, dict)):
+                # Só listas e dicionários podem esconder valores não serializáveis
+                try:
+                    json.dumps(v)
+                except (TypeError, ValueError) as e:
+                    self._stats.incr('hosts_dropped')
+                    display.vv(f"Host {host_name} tem problemas de JSON em {k}, removendo: {e}")
+                    return None
+                host_vars[k] = v
+                continue
+
+            # Remover variáveis com IDs suspeitos
+            if str(v) in SUSPICIOUS_VAR_IDS:
+                self._stats.incr('vars_blocked')
+                display.vvv(f"Variável removida: {k}={v} do host {host_name} (ID suspeito)")
+                continue
+
+            host_vars[k] = v
+        return host_vars
+
+    def _get_cache_key_for(self, vcenter_config):
+        """Chave do cache de inventário: vCenter + datacenter"""
+        target = re.sub(r'[^A-Za-z0-9_.-]', '_', f"{vcenter_config['host']}_{vcenter_config['datacenter']}")
+        return f"{self.NAME}_{target}"
+
+    def _add_host(self, record):
+        """Adiciona ao inventário o host, suas variáveis e grupos (VM coletada ou lida do cache)"""
+        host_name = record.inventory_hostname
+        self.inventory.add_host(host_name)
+        for k, v in record.host_vars().items():
+            self.inventory.set_variable(host_name, k, v)
+        for group_name in record.groups():
+            self.inventory.add_group(group_name)
+            self.inventory.add_child(group_name, host_name)
+
+    def _get_targets(self):
+        """Lista de alvos (vCenter + datacenter) a coletar.
+
+        Vem da opção `targets` do inventory.yml; sem ela, das variáveis de ambiente
+        (DATACENTER_NAME aceita vários datacenters separados por vírgula).
+        """
+        defaults = {
             'user': os.environ.get('VCENTER_USER'),
             'pwd': os.environ.get('VCENTER_PASSWORD'),
-            'port': int(os.environ.get('VCENTER_PORT', 443)),
-            'datacenter': os.environ.get('DATACENTER_NAME')
+            'port': os.environ.get('VCENTER_PORT', 443),
         }
+        configured = self.get_option('targets') or [{
+            'host': os.environ.get('VCENTER_HOST'),
+            'datacenters': [dc.strip() for dc in (os.environ.get('DATACENTER_NAME') or '').split(',') if dc.strip()] or [None],
+        }]
+
+        targets = []
+        for item in configured:
+            for datacenter in item.get('datacenters') or [item.get('datacenter')]:
+                vcenter_config = {
+                    'host': item.get('host'),
+                    'user': item.get('user', defaults['user']),
+                    'pwd': item.get('password', defaults['pwd']),
+                    'port': int(item.get('port', defaults['port'])),
+                    'datacenter': datacenter
+                }
+                missing = [k for k, v in vcenter_config.items() if v is None]
+                if missing:
+                    raise Exception(f"Missing required environment variables: {', '.join(missing)}")
+                targets.append(vcenter_config)
+        return targets
 
-        missing = [k for k, v in vcenter_config.items() if v is None]
-        if missing:
-            raise Exception(f"Missing required environment variables: {', '.join(missing)}")
+    def _target_merger(self, vcenter_config, owners):
+        """Função que dá às VMs de um alvo nomes de host únicos entre os alvos e os grupos de origem.
 
-        # Criar sessão REST para buscar tags
-        print("🔑 Criando sessão REST com vCenter...")
-        rest_session = self._get_vcenter_rest_session(
-            vcenter_config['host'],
-            vcenter_config['user'],
-            vcenter_config['pwd']
+        `owners` (nome do host -> origem que o registrou primeiro) é compartilhado pelos alvos,
+        consumidos na ordem da configuração; o resultado não depende de qual alvo terminou antes.
+        """
+        def label(value):
+            return re.sub(r'[^a-z0-9_]', '_', value.lower())
+
+        source = (vcenter_config['host'], vcenter_config['datacenter'])
+        source_groups = (
+            sys.intern(f"vcenter_{label(vcenter_config['host'])}"),
+            sys.intern(f"datacenter_{label(vcenter_config['datacenter'])}"),
         )
-        
-        if not rest_session:
-            print("""
-⚠️  AVISO: Não foi possível criar sessão REST. As tags não serão coletadas.
-   
-   Se você precisa das tags, verifique:
-   1. Permissões do usuário no vCenter (precisa de System.View e Global.GlobalTag)
-   2. Versão do vCenter (6.5 ou superior para API REST)
-   3. Conectividade com a porta 443 do vCenter
-   
-   O inventário continuará sem as tags...
-""")
+        # Em caso de colisão com outra origem: nome_datacenter, depois nome_vcenter_datacenter
+        suffixes = (
+            f"_{label(vcenter_config['datacenter'])}",
+            f"_{label(vcenter_config['host'])}_{label(vcenter_config['datacenter'])}",
+        )
+
+        def merge(record):
+            candidates = [record.inventory_hostname] + [record.inventory_hostname + suffix for suffix in suffixes]
+            name = next((c for c in candidates if owners.get(c, source) == source), candidates[-1])
+            owners[name] = source
+            record.inventory_hostname = name
+            record.source_groups = source_groups
+
+        return merge
+
+    def _find_datacenter(self, content, name):
+        """Localiza o datacenter pelo nome, inclusive dentro de pastas"""
+        container = content.viewManager.CreateContainerView(content.rootFolder, [vim.Datacenter], True)
+        try:
+            datacenter = next((dc for dc in container.view if dc.name == name), None)
+        finally:
+            container.Destroy()
+        if not datacenter:
+            raise Exception(f"Datacenter {name} not found")
+        return datacenter
+
+    def _get_endpoint_cache(self, vcenter_host, version):
+        """Um cache de endpoints por vCenter, compartilhado entre os datacenters do mesmo vCenter"""
+        with self._lock:
+            if vcenter_host not in self._endpoint_caches:
+                self._endpoint_caches[vcenter_host] = VCenterEndpointCache(
+                    vcenter_host,
+                    version,
+                    cache_dir=os.environ.get('VCENTER_CACHE_DIR', DEFAULT_CACHE_DIR),
+                    ttl=int(os.environ.get('VCENTER_ENDPOINT_CACHE_TTL', DEFAULT_ENDPOINT_CACHE_TTL))
+                )
+            return self._endpoint_caches[vcenter_host]
+
+    def _init_run_state(self):
+        """Estado compartilhado entre as coletas de uma execução (indexado pelo host do vCenter)"""
+        self._lock = threading.Lock()
+        self._stats = VCenterRunStats()
+        self._endpoint_caches = {}
+        self._tag_details_cache = {}
+        self._category_name_cache = {}
+        self._tag_refs = {}  # (nome, categoria, descrição) -> TagRef, para as tags lidas via pyVmomi
+        self._failed_uuids = set()  # UUID das VMs que existem no vCenter mas não viraram host (erro ou filtro)
+
+    def parse(self, inventory, loader, path, cache=True):
+        super(InventoryModule, self).parse(inventory, loader, path, cache)
+        self._read_config_data(path)
+
+        targets = self._get_targets()
+        self._init_run_state()
+
+        # Cache de inventário (jsonfile, redis...) configurado via ansible.cfg / inventory.yml.
+        # O parâmetro `cache` é False quando o ansible é chamado com --flush-cache.
+        user_cache_setting = self.get_option('cache')
+        attempt_to_read_cache = user_cache_setting and cache and not self.get_option('refresh_cache')
+
+        def target_records(vcenter_config):
+            """VMs do alvo, lidas do cache ou coletadas; uma coleta completa atualiza o cache ao final"""
+            cache_key = self._get_cache_key_for(vcenter_config)
+            records = None
+            if attempt_to_read_cache:
+                try:
+                    with self._stats.phase('cache'):
+                        records = _records_from_cache(self._cache[cache_key])
+                    if records is None:
+                        display.v(f"Cache de inventário ({cache_key}) em formato antigo, coletando novamente")
+                except KeyError:
+                    pass
+            if records is not None:
+                self._stats.incr('targets_cached')
+                display.v(f"Inventário carregado do cache ({cache_key}), sem conexão com o vCenter")
+                yield from records
+                return
+
+            self._stats.incr('targets')
+            # Só as linhas do cache (uma lista de valores por VM) acompanham a coleta inteira
+            rows = [] if user_cache_setting else None
+            with contextlib.closing(self._iter_hosts(vcenter_config)) as hosts:
+                for record in hosts:
+                    if rows is not None:
+                        rows.append(record.to_cache())
+                    yield record
+            if rows is not None:
+                self._cache[cache_key] = _records_to_cache(rows)
+
+        # Uma conexão por alvo, coletados em paralelo. Cada VM entra no inventário assim que chega,
+        # na ordem dos alvos: a coleta não é acumulada em listas (ver _iter_hosts).
+        workers = max(int(self.get_option('target_workers')), 1)
+        owners = {}
+        errors = []
+        failed_targets = []
+        streams = _ordered_streams([functools.partial(target_records, vcenter_config) for vcenter_config in targets], workers)
+        with contextlib.closing(streams):
+            for vcenter_config, records in zip(targets, streams):
+                merge = self._target_merger(vcenter_config, owners) if len(targets) > 1 else None
+                try:
+                    for record in records:
+                        if merge:
+                            merge(record)
+                        # As variáveis já foram filtradas na coleta (_filter_host_vars), sem limpeza posterior
+                        with self._stats.phase('inventario'):
+                            self._add_host(record)
+                except Exception as e:
+                    # Um alvo fora do ar não derruba o inventário dos demais; as VMs dele já recebidas permanecem
+                    self._stats.incr('targets_failed')
+                    errors.append(e)
+                    failed_targets.append(f"{vcenter_config['host']}/{vcenter_config['datacenter']}")
+                    display.warning(f"Falha na coleta de {vcenter_config['host']} / {vcenter_config['datacenter']}: {str(e)}")
+        if errors and len(errors) == len(targets):
+            raise errors[0]
+        if failed_targets:
+            # Inventário parcial: visível em cada host, pois o AWX importa as variáveis de host
+            self.inventory.set_variable('all', 'vmware_dynamic_targets_failed', failed_targets)
+            for host_name in self.inventory.hosts:
+                self.inventory.set_variable(host_name, 'vmware_dynamic_targets_failed', failed_targets)
+
+        # Única linha de saída de uma execução normal (stderr, para não misturar com o JSON do inventário)
+        display.display(self._stats.summary(len(self.inventory.hosts)), stderr=True)
+        self._write_metrics(len(self.inventory.hosts))
+
+    def _write_metrics(self, hosts):
+        """Grava o relatório JSON e o textfile do Prometheus, quando configurados"""
+        outputs = (
+            (self.get_option('metrics_report'), lambda: json.dumps(self._stats.report(hosts), indent=2, ensure_ascii=False)),
+            (self.get_option('metrics_textfile'), lambda: self._stats.prometheus(hosts)),
+        )
+        for path, render in outputs:
+            if not path:
+                continue
+            try:
+                _write_atomic(path, render())
+                display.v(f"Métricas da coleta gravadas em {path}")
+            except OSError as e:
+                display.warning(f"Não foi possível gravar as métricas em {path}: {e}")
+
+    def _iter_hosts(self, vcenter_config):
+        """Gera as VMs do vCenter uma a uma (VMRecord), à medida que são coletadas.
+
+        A conexão, a view e a sessão REST são encerradas ao final da iteração ou quando o
+        gerador é fechado antes disso, o que permite consumir a coleta em fluxo
+        (scripts/vcenter_to_netbox_pipeline.py).
+        """
+        tag_workers = max(int(os.environ.get('VCENTER_TAG_WORKERS', 1)), 1)
 
         context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
         context.check_hostname = False
         context.verify_mode = ssl.CERT_NONE
 
-        si = SmartConnect(
-            host=vcenter_config['host'],
-            user=vcenter_config['user'],
-            pwd=vcenter_config['pwd'],
-            port=vcenter_config['port'],
-            sslContext=context
-        )
+        # Modo incremental: reaproveitar a sessão SOAP da execução anterior
+        incremental_state = None
+        si = None
+        if self.get_option('incremental'):
+            target = re.sub(r'[^A-Za-z0-9_.-]', '_', f"{vcenter_config['host']}_{vcenter_config['datacenter']}")
+            incremental_state = VCenterIncrementalState(os.path.join(
+                os.environ.get('VCENTER_CACHE_DIR', DEFAULT_CACHE_DIR), f"incremental_{target}.json"
+            ))
+            si = incremental_state.resume(vcenter_config['host'], vcenter_config['port'], context)
+        endpoints = None
+        rest_session = None
+        vm_properties = None
+        container = None
 
-        content = si.RetrieveContent()
-        datacenter = next(
-            (dc for dc in content.rootFolder.childEntity if dc.name == vcenter_config['datacenter']),
-            None
-        )
-        if not datacenter:
-            raise Exception(f"Datacenter {vcenter_config['datacenter']} not found")
+        def release_view():
+            # Destruída assim que as referências das VMs estão em mãos, sem esperar o fim da iteração
+            nonlocal container
+            if container is not None:
+                view, container = container, None
+                view.Destroy()
 
-        container = content.viewManager.CreateContainerView(
-            datacenter.vmFolder, [vim.VirtualMachine], True
-        )
+        # Tudo o que segue a conexão fica no try: o finally encerra a sessão SOAP, a sessão REST e a
+        # view também quando um passo anterior à coleta falha (datacenter inexistente, índice de tags...)
+        try:
+            resumed = si is not None
 
-        for vm in container.view:
-            try:
-                if not vm.config or vm.config.template or vm.name.startswith('template'):
-                    continue
+            with self._stats.phase('conexao'):
+                if si is None:
+                    si = SmartConnect(
+                        host=vcenter_config['host'],
+                        user=vcenter_config['user'],
+                        pwd=vcenter_config['pwd'],
+                        port=vcenter_config['port'],
+                        sslContext=context
+                    )
+                else:
+                    display.v(f"Sessão vCenter da execução anterior reaproveitada ({vcenter_config['host']})")
 
-                name = vm.name
-                config = vm.config
-                summary = vm.summary
-                runtime = vm.runtime
-                guest = vm.guest
-                
-                # Validações básicas
-                if not name or not config:
-                    continue
+                content = si.RetrieveContent()
 
-                ip_addresses = []
-                if guest and guest.net:
-                    for nic in guest.net:
-                        if nic.ipAddress:
-                            ip_addresses.extend([ip for ip in nic.ipAddress if ip and not ip.startswith('fe80')])
-
-                memory_gb = round((summary.config.memorySizeMB / 1024), 1) if summary.config else 0
-
-                # Calcular capacidade total do disco
-                disk_total_gb = 0
-                if config and config.hardware and config.hardware.device:
-                    for device in config.hardware.device:
-                        if hasattr(device, 'capacityInKB') and device.capacityInKB:
-                            disk_total_gb += round((device.capacityInKB / 1024 / 1024), 1)
-
-                # Buscar tags via API REST - MÉTODO CORRIGIDO
-                vm_tags = []
-                if rest_session and hasattr(vm, '_moId'):
-                    print(f"🔍 Buscando tags para VM: {name} (ID: {vm._moId})")
-                    vm_tags = self._get_vm_tags_via_rest(rest_session, vcenter_config['host'], vm._moId)
-                    
-                    # Se falhar via REST, tentar via pyVmomi
-                    if not vm_tags:
-                        print("   🔄 Tentando método alternativo via pyVmomi...")
-                        vm_tags = self._get_vm_tags_via_pyvmomi(content, vm)
-                    
-                    print(f"✅ VM {name}: {len(vm_tags)} tags encontradas")
-
-                vm_data = {
-                    'ansible_host': ip_addresses[0] if ip_addresses else None,
-                    'vm_name': self._sanitize_string(name),
-                    'vm_uuid': self._sanitize_string(config.uuid if config else None),
-                    'vm_power_state': self._sanitize_string(runtime.powerState if runtime else None),
-                    'vm_guest_os': self._sanitize_string(config.guestFullName if config else None),
-                    'vm_guest_family': self._sanitize_string(guest.guestFamily if guest else None),
-                    'vm_cpu_count': summary.config.numCpu if summary.config else 0,
-                    'vm_memory_mb': summary.config.memorySizeMB if summary.config else 0,
-                    'vm_memory_gb': memory_gb,
-                    'vm_datacenter': self._sanitize_string(runtime.host.parent.parent.parent.name if runtime and runtime.host else None),
-                    'vm_cluster': self._sanitize_string(runtime.host.parent.name if runtime and runtime.host else None),
-                    'vm_folder': self._sanitize_string(vm.parent.name if vm.parent else None),
-                    'vm_ip_addresses': ip_addresses,
-                    'vm_hostname': self._sanitize_string(guest.hostName if guest else None),
-                    'vm_tools_status': self._sanitize_string(guest.toolsStatus if guest else None),
-                    'vm_tools_running': guest.toolsStatus == 'toolsOk' if guest else False,
-                    'vm_environment': 'production' if 'prod' in name.lower() else 'development' if 'dev' in name.lower() else 'testing' if 'test' in name.lower() else 'staging' if 'stg' in name.lower() else 'unknown',
-                    'vm_criticality': 'high' if 'prod' in name.lower() else 'medium' if 'test' in name.lower() or 'stg' in name.lower() else 'low',
-                    'vm_is_windows': 'windows' in (config.guestFullName.lower() if config and config.guestFullName else ''),
-                    'vm_is_linux': any(x in (config.guestFullName.lower() if config and config.guestFullName else '') for x in ['linux', 'ubuntu', 'centos', 'red hat', 'suse', 'debian']),
-                    'vm_cpu_category': 'high' if summary.config.numCpu >= 8 else 'medium' if summary.config.numCpu >= 4 else 'low',
-                    'vm_memory_category': 'high' if memory_gb >= 16 else 'medium' if memory_gb >= 8 else 'low' if memory_gb >= 4 else 'minimal',
-                    'vm_disk_total_gb': disk_total_gb,
-                    'vm_disk_category': 'high' if disk_total_gb >= 1000 else 'medium' if disk_total_gb >= 500 else 'low' if disk_total_gb >= 100 else 'minimal',
-                    'vm_tags': vm_tags
-                }
+            # Cache de endpoints REST por vCenter e versão
+            endpoints = self._get_endpoint_cache(vcenter_config['host'], f"{content.about.version}-{content.about.build}")
 
-                # Sanitizar nome do host para evitar problemas
-                safe_name = self._sanitize_string(name)
-                if not safe_name:
-                    safe_name = f"vm_{config.uuid[:8]}" if config and config.uuid else f"unknown_vm_{len(self.inventory.hosts)}"
-                
-                self.inventory.add_host(safe_name)
-                
-                # Adicionar APENAS variáveis VMware válidas - BLOQUEAR completamente variáveis AWX
-                awx_blocked_vars = [
-                    'remote_host_enabled', 'remote_host_id', 'remote_tower_enabled', 'remote_tower_id',
-                    'tower_enabled', 'tower_id', 'awx_enabled', 'awx_id', 
-                    'ansible_host_key_checking', 'ansible_ssh_common_args'
-                ]
-                
-                # FILTRO RIGOROSO: Apenas variáveis que começam com 'vm_' ou 'ansible_host'
-                allowed_prefixes = ['vm_', 'ansible_host']
-                
-                for k, v in vm_data.items():
-                    # Bloquear qualquer variável que não seja explicitamente VMware
-                    if k in awx_blocked_vars:
-                        print(f"🚫 BLOQUEADO: {k} (variável AWX)")
-                        continue
-                    
-                    # Permitir apenas variáveis com prefixos seguros
-                    if not any(k.startswith(prefix) for prefix in allowed_prefixes):
-                        print(f"🚫 BLOQUEADO: {k} (prefixo não permitido)")
+            # Criar sessão REST para buscar tags
+            with self._stats.phase('sessao_rest'):
+                rest_session = self._get_vcenter_rest_session(
+                    vcenter_config['host'],
+                    vcenter_config['user'],
+                    vcenter_config['pwd'],
+                    workers=tag_workers
+                )
+        
+            if not rest_session:
+                display.warning(
+                    f"Não foi possível criar sessão REST com {vcenter_config['host']}; o inventário continuará sem as tags. "
+                    "Verifique as permissões do usuário (System.View e Global.GlobalTag), a versão do vCenter "
+                    "(6.5 ou superior) e a conectividade com a porta 443."
+                )
+
+            collection_mode = 'incremental' if incremental_state else os.environ.get('VCENTER_COLLECTION_MODE', 'property_collector').lower()
+            page_size = int(os.environ.get('VCENTER_PAGE_SIZE', DEFAULT_PAGE_SIZE))
+            display.v(f"Modo de coleta em {vcenter_config['host']}: {collection_mode}")
+
+            if incremental_state:
+                with self._stats.phase('atualizacao_incremental'):
+                    if not resumed or not incremental_state.update(si, page_size):
+                        display.v("Carga completa do estado incremental")
+                        incremental_state.full_sync(si, content, self._find_datacenter(content, vcenter_config['datacenter']), page_size)
+                vm_properties = self._iter_vm_properties_incremental(si, incremental_state)
+                vm_ids_provider = lambda: list(incremental_state.vms)
+            else:
+                container = content.viewManager.CreateContainerView(
+                    self._find_datacenter(content, vcenter_config['datacenter']).vmFolder, [vim.VirtualMachine], True
+                )
+                if collection_mode == 'legacy':
+                    vm_properties = self._iter_vm_properties_legacy(container, release_view)
+                else:
+                    vm_properties = self._iter_vm_properties_bulk(content, container, page_size, release_view)
+                # Usado só antes da iteração (índice de tags), enquanto a view existe
+                vm_ids_provider = lambda: [vm._moId for vm in container.view]
+            # Tempo de obtenção das propriedades (páginas do PropertyCollector ou leitura VM a VM)
+            vm_properties = self._timed_iter('coleta_vms', vm_properties)
+
+            # Carregar o índice de tags em lote antes de percorrer as VMs
+            tag_index = None
+            tag_mode = os.environ.get('VCENTER_TAG_MODE', 'bulk').lower()
+            if rest_session and tag_mode == 'bulk':
+                tag_index = VCenterTagIndex(
+                    rest_session, vcenter_config['host'], self._sanitize_string, endpoints, tag_workers, self._stats
+                )
+                with self._stats.phase('tags_lote'):
+                    tags_loaded = tag_index.load(vm_ids_provider)
+                if not tags_loaded:
+                    display.warning(f"API de tags em lote indisponível em {vcenter_config['host']}, buscando tags por VM")
+                    tag_index = None
+
+            # Sem índice em lote, as tags por VM podem ser buscadas em paralelo
+            if rest_session and not tag_index and tag_workers > 1:
+                vm_properties = self._prefetch_vm_tags(vm_properties, rest_session, vcenter_config['host'], tag_workers)
+            else:
+                vm_properties = ((vm, props, None, 0.0) for vm, props in vm_properties)
+
+            emitted = 0
+            for vm, props, prefetched_tags, prefetch_seconds in vm_properties:
+                self._stats.incr('vms_seen')
+                vm_started = time.monotonic() - prefetch_seconds
+                try:
+                    name = props.get('name')
+
+                    # Ignorar VMs sem configuração (inacessíveis) e templates
+                    if not self._is_collectable(props):
+                        self._stats.incr('vms_skipped')
                         continue
+
+                    # Buscar tags via API REST - MÉTODO CORRIGIDO
+                    vm_tags = []
+                    if tag_index and hasattr(vm, '_moId'):
+                        vm_tags = tag_index.tags_for(vm._moId)
+                    elif rest_session and hasattr(vm, '_moId'):
+                        if prefetched_tags is not None:
+                            vm_tags = prefetched_tags
+                        else:
+                            display.vvv(f"Buscando tags para VM: {name} (ID: {vm._moId})")
+                            vm_tags = self._timed_vm_tags(rest_session, vcenter_config['host'], vm._moId)
                     
-                    # Bloquear se contém padrões AWX no nome
-                    if any(blocked in str(k).lower() for blocked in ['remote_', 'tower_', 'awx_']):
-                        print(f"🚫 BLOQUEADO: {k} (padrão AWX detectado)")
-                        continue
+                        # Se falhar via REST, tentar via pyVmomi
+                        if not vm_tags:
+                            display.vvv(f"Tentando método alternativo via pyVmomi para {name}")
+                            with self._stats.phase('tags_pyvmomi'):
+                                vm_tags = self._get_vm_tags_via_pyvmomi(content, vm)
                     
-                    if v is not None:
-                        # Sanitizar valores que podem conter caracteres especiais
-                        if isinstance(v, str):
-                            v = self._sanitize_string(v)
-                        self.inventory.set_variable(safe_name, k, v)
-
-                # Criar grupos por estado de energia
-                if runtime and runtime.powerState == 'poweredOn':
-                    self.inventory.add_group('powered_on')
-                    self.inventory.add_child('powered_on', safe_name)
-                elif runtime and runtime.powerState == 'poweredOff':
-                    self.inventory.add_group('powered_off')
-                    self.inventory.add_child('powered_off', safe_name)
-                elif runtime and runtime.powerState == 'suspended':
-                    self.inventory.add_group('suspended')
-                    self.inventory.add_child('suspended', safe_name)
-
-                # Criar grupos por sistema operacional
-                if vm_data['vm_is_windows']:
-                    self.inventory.add_group('windows')
-                    self.inventory.add_child('windows', safe_name)
-                elif vm_data['vm_is_linux']:
-                    self.inventory.add_group('linux')
-                    self.inventory.add_child('linux', safe_name)
+                        display.vvv(f"VM {name}: {len(vm_tags)} tags encontradas")
+
+                    record = VMRecord.from_properties(props, vm_tags, self._sanitize_string)
+
+                    # Sanitizar nome do host para evitar problemas
+                    safe_name = self._sanitize_string(name)
+                    if not safe_name:
+                        safe_name = f"vm_{props['uuid'][:8]}" if props.get('uuid') else f"unknown_vm_{emitted}"
                 
-                # Criar grupos por tags
-                for tag in vm_tags:
-                    if tag.get('name'):
-                        # Criar nome de grupo baseado na tag
-                        tag_group_name = f"tag_{self._sanitize_string(tag['name']).lower().replace(' ', '_')}"
-                        self.inventory.add_group(tag_group_name)
-                        self.inventory.add_child(tag_group_name, safe_name)
-                        
-                        # Se houver categoria, criar grupo por categoria também
-                        if tag.get('category'):
-                            category_group_name = f"category_{self._sanitize_string(tag['category']).lower().replace(' ', '_')}"
-                            self.inventory.add_group(category_group_name)
-                            self.inventory.add_child(category_group_name, safe_name)
+                    with self._stats.phase('filtro'):
+                        host_vars = self._filter_host_vars(safe_name, record.host_vars())
+                    if host_vars is None:
+                        self._failed_uuids.add(props.get('uuid'))
+                        continue
+                    record.restrict(host_vars)
+                    record.inventory_hostname = safe_name
+
+                    emitted += 1
+                    # Tempo da VM no plugin (tags por VM, montagem e filtro), sem o tempo do consumidor
+                    self._stats.observe_vm(safe_name, time.monotonic() - vm_started)
+                    yield record
             
-            except Exception as e:
-                # Log do erro mas continua processando outras VMs
-                print(f"Erro processando VM {getattr(vm, 'name', 'unknown')}: {str(e)}")
-                continue
+                except Exception as e:
+                    # Log do erro mas continua processando outras VMs
+                    self._stats.incr('vm_errors')
+                    self._failed_uuids.add(props.get('uuid'))
+                    display.vv(f"Erro processando VM {props.get('name', 'unknown')}: {str(e)}")
+                    continue
+        finally:
+            # Executado também quando o consumidor interrompe o gerador (close)
+            if vm_properties is not None:
+                vm_properties.close()
+            with self._stats.phase('encerramento'):
+                if si is not None:
+                    if incremental_state:
+                        # Sem logout: a sessão, o coletor e as views precisam sobreviver até a próxima execução
+                        incremental_state.save(si)
+                    else:
+                        release_view()
+                        Disconnect(si)
+                if endpoints is not None:
+                    endpoints.save()
 
-        container.Destroy()
-        Disconnect(si)
-        
-        # Fechar sessão REST
-        if rest_session:
-            try:
-                rest_session.delete(f"https://{vcenter_config['host']}/rest/com/vmware/cis/session")
-            except:
-                pass
-        
-        # Limpar variáveis problemáticas que o AWX pode injetar
-        self._cleanup_awx_variables()
-        
-        # Validação final de integridade JSON
-        self._validate_inventory_json()
-        
-        # Limpeza final - remover qualquer host que ainda tenha problemas
-        self._final_cleanup()
\ No newline at end of file
+                # Fechar sessão REST
+                if rest_session:
+                    try:
+                        rest_session.delete(f"https://{vcenter_config['host']}/rest/com/vmware/cis/session")
+                    except:
+                        pass
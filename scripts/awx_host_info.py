@@ -2,34 +2,155 @@
 """
 Script para consulta de informações de host via API do AWX
 Similar ao teste.sh, mas em Python com melhor tratamento de erros
+
+Modo exportação (--export): todos os hosts do inventário, com variáveis e
+grupos, em uma única chamada a /inventories/{id}/script/, gravados como NDJSON
+(um JSON por linha) no stdout ou em --output.
+
+Modo lote (vários hosts, --pattern ou --json): detalhes, facts e grupos de
+todos os hosts buscados em paralelo (--workers) sobre uma única sessão, com a
+saída em JSON. As respostas do AWX ficam em cache em disco
+(AWX_CACHE_DIR, padrão /tmp/awx_host_info_cache) por AWX_CACHE_TTL segundos
+(padrão 300); depois disso são revalidadas com If-None-Match quando o AWX
+enviou ETag. O cache é separado por AWX e usuário e o diretório precisa ser
+do usuário atual (permissão 0700). --no-cache desliga o cache.
 """
 
+import argparse
+import fnmatch
+import hashlib
 import json
 import requests
+import stat
 import sys
 import os
-from typing import Dict, Any, Optional
+import threading
+import time
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, Iterator, List, Optional
+from urllib.parse import quote
+
+
+# Tamanho máximo de página aceito pela API do AWX
+AWX_PAGE_SIZE = 200
+
+DEFAULT_CACHE_DIR = '/tmp/awx_host_info_cache'
+DEFAULT_CACHE_TTL = 300
+DEFAULT_WORKERS = 8
+
+
+def parse_variables(variables: Any) -> Dict[str, Any]:
+    """O AWX retorna as variáveis do host como texto JSON ou YAML"""
+    if isinstance(variables, dict):
+        return variables
+    if not variables:
+        return {}
+    try:
+        return json.loads(variables)
+    except ValueError:
+        return yaml.safe_load(variables) or {}
+
+
+class AWXResponseCache:
+    """Cache em disco de respostas GET do AWX: válido por `ttl` segundos e revalidado por ETag depois disso.
+
+    As respostas dependem das permissões de quem consulta: a chave inclui um hash de `identity`
+    (AWX e usuário), e o diretório só é usado se for do usuário atual, com permissão 0700.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, ttl: int = DEFAULT_CACHE_TTL, identity: str = ''):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self._scope = hashlib.sha256(identity.encode()).hexdigest()
+        self._usable: Optional[bool] = None
+
+    def _path(self, url: str) -> str:
+        key = hashlib.sha256(f"{self._scope} {url}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _private_dir(self) -> bool:
+        """Cria o diretório com 0700 ou corrige a permissão; um diretório de outro usuário (ou link) não é usado"""
+        if self._usable is None:
+            try:
+                os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+                info = os.lstat(self.cache_dir)
+                if stat.S_ISLNK(info.st_mode) or info.st_uid != os.getuid():
+                    print(f"⚠️  Cache ignorado: {self.cache_dir} não pertence ao usuário atual", file=sys.stderr)
+                    self._usable = False
+                else:
+                    if stat.S_IMODE(info.st_mode) & 0o077:
+                        os.chmod(self.cache_dir, 0o700)
+                    self._usable = True
+            except OSError as e:
+                print(f"⚠️  Cache ignorado: {self.cache_dir}: {e}", file=sys.stderr)
+                self._usable = False
+        return self._usable
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        if not self._private_dir():
+            return None
+        try:
+            with open(self._path(url)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry.get('saved_at', 0) <= self.ttl
+
+    def store(self, url: str, body: Any, etag: Optional[str]) -> None:
+        if not self._private_dir():
+            return
+        path = self._path(url)
+        try:
+            # Nome temporário por thread: vários workers podem gravar ao mesmo tempo
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'url': url, 'etag': etag, 'saved_at': time.time(), 'body': body}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️  Não foi possível gravar o cache em {path}: {e}", file=sys.stderr)
 
 
 class AWXHostInfo:
-    def __init__(self, awx_url: str, username: str, password: str, inventory_id: int):
+    def __init__(self, awx_url: str, username: str, password: str, inventory_id: int,
+                 cache: Optional[AWXResponseCache] = None, workers: int = 1):
         self.awx_url = awx_url.rstrip('/')
         self.username = username
         self.password = password
         self.inventory_id = inventory_id
+        self.cache = cache
         self.session = requests.Session()
         self.session.auth = (username, password)
         self.session.headers.update({'Content-Type': 'application/json'})
+        # Uma conexão reaproveitável por worker
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(workers, 1))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
     
     def awx_api(self, endpoint: str) -> Dict[str, Any]:
         """Faz requisição para API do AWX"""
+        url = f"{self.awx_url}/api/v2/{endpoint}"
+        cached = self.cache.get(url) if self.cache else None
+        if cached and self.cache.is_fresh(cached):
+            return cached['body']
+
         try:
-            url = f"{self.awx_url}/api/v2/{endpoint}"
-            response = self.session.get(url)
+            headers = {'If-None-Match': cached['etag']} if cached and cached.get('etag') else {}
+            response = self.session.get(url, headers=headers, timeout=60)
+            if response.status_code == 304:
+                self.cache.store(url, cached['body'], cached['etag'])
+                return cached['body']
             response.raise_for_status()
-            return response.json()
+            body = response.json()
+            if self.cache:
+                self.cache.store(url, body, response.headers.get('ETag'))
+            return body
         except requests.exceptions.RequestException as e:
-            print(f"❌ Erro na requisição: {e}")
+            print(f"❌ Erro na requisição: {e}", file=sys.stderr)
             return {}
     
     def find_host(self, host_name: str) -> Optional[Dict[str, Any]]:
@@ -131,14 +252,113 @@ class AWXHostInfo:
         
         return groups
     
+    def iter_hosts(self) -> Iterator[Dict[str, Any]]:
+        """Percorre todas as páginas de hosts do inventário"""
+        endpoint: Optional[str] = f"inventories/{self.inventory_id}/hosts/?page_size={AWX_PAGE_SIZE}"
+        while endpoint:
+            response = self.awx_api(endpoint)
+            yield from response.get('results', [])
+            # `next` vem como /api/v2/inventories/...?page=2
+            next_url = response.get('next')
+            endpoint = next_url.split('/api/v2/', 1)[1] if next_url else None
+
     def list_available_hosts(self):
         """Lista hosts disponíveis no inventário"""
         print("\n🖥️ Hosts disponíveis no inventário VMware Inventory:")
-        response = self.awx_api(f"inventories/{self.inventory_id}/hosts/")
-        
-        if response and response.get('results'):
-            for host in response['results']:
-                print(f"   • {host['name']} (ID: {host['id']})")
+        for host in self.iter_hosts():
+            print(f"   • {host['name']} (ID: {host['id']})")
+
+    def export_hosts(self) -> Iterator[Dict[str, Any]]:
+        """Todos os hosts com variáveis e grupos em uma única requisição (endpoint script do inventário).
+
+        Se o endpoint não estiver disponível, lê os hosts página a página (sem os grupos completos).
+        """
+        url = f"{self.awx_url}/api/v2/inventories/{self.inventory_id}/script/"
+        try:
+            response = self.session.get(url, params={'hostvars': 1, 'towervars': 1}, timeout=300)
+            response.raise_for_status()
+            inventory = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"⚠️  Endpoint script indisponível ({e}), lendo hosts página a página", file=sys.stderr)
+            for host in self.iter_hosts():
+                yield {
+                    'name': host['name'],
+                    'id': host['id'],
+                    'enabled': host.get('enabled'),
+                    'variables': parse_variables(host.get('variables')),
+                    'groups': [group['name'] for group in host.get('summary_fields', {}).get('groups', {}).get('results', [])]
+                }
+            return
+
+        hostvars = inventory.pop('_meta', {}).get('hostvars', {})
+        groups_by_host: Dict[str, List[str]] = {}
+        for group_name, group in inventory.items():
+            for host_name in (group.get('hosts', []) if isinstance(group, dict) else group):
+                groups_by_host.setdefault(host_name, []).append(group_name)
+
+        for host_name in sorted(set(hostvars) | set(groups_by_host)):
+            variables = dict(hostvars.get(host_name, {}))
+            yield {
+                'name': host_name,
+                # towervars=1 inclui o ID e o estado do host nas variáveis remote_tower_*
+                'id': variables.pop('remote_tower_id', None),
+                'enabled': variables.pop('remote_tower_enabled', None),
+                'variables': variables,
+                'groups': sorted(groups_by_host.get(host_name, []))
+            }
+
+    def _search_host(self, host_name: str) -> Optional[Dict[str, Any]]:
+        response = self.awx_api(f"inventories/{self.inventory_id}/hosts/?name={quote(host_name)}")
+        results = response.get('results') or []
+        return results[0] if results else None
+
+    def collect_hosts(self, host_names: Optional[List[str]] = None, pattern: Optional[str] = None,
+                      workers: int = DEFAULT_WORKERS) -> List[Dict[str, Any]]:
+        """Detalhes, facts e grupos de vários hosts, buscados em paralelo, sem saída no console.
+
+        Os hosts vêm por nome (uma busca por host, em paralelo) ou por padrão estilo
+        shell (ex: 'ADAASD-*'), resolvido sobre a listagem paginada do inventário.
+        """
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            if pattern:
+                found = [host for host in self.iter_hosts() if fnmatch.fnmatch(host['name'], pattern)]
+                hosts = [(host['name'], host) for host in found]
+            else:
+                hosts = list(zip(host_names or [], executor.map(self._search_host, host_names or [])))
+
+            # Três consultas por host, todas disparadas de uma vez no mesmo pool
+            lookups = {
+                (host['id'], kind): executor.submit(self.awx_api, endpoint.format(id=host['id']))
+                for _, host in hosts if host
+                for kind, endpoint in (('details', 'hosts/{id}/'), ('facts', 'hosts/{id}/ansible_facts/'),
+                                       ('groups', 'hosts/{id}/groups/'))
+            }
+
+            records = []
+            for host_name, host in hosts:
+                if not host:
+                    records.append({'name': host_name, 'error': 'host não encontrado'})
+                    continue
+                details = lookups[(host['id'], 'details')].result()
+                groups = lookups[(host['id'], 'groups')].result()
+                records.append({
+                    'name': host['name'],
+                    'id': host['id'],
+                    'enabled': details.get('enabled', host.get('enabled')),
+                    'description': details.get('description'),
+                    'variables': parse_variables(details.get('variables', host.get('variables'))),
+                    'facts': lookups[(host['id'], 'facts')].result(),
+                    'groups': [group['name'] for group in groups.get('results', [])]
+                })
+            return records
+
+    def export_ndjson(self, output) -> int:
+        """Grava um host por linha em `output` à medida que são lidos; retorna o total"""
+        count = 0
+        for host in self.export_hosts():
+            output.write(json.dumps(host, ensure_ascii=False) + '\n')
+            count += 1
+        return count
     
     def print_useful_commands(self, host_id: int):
         """Imprime comandos úteis para consulta"""
@@ -167,6 +387,18 @@ class AWXHostInfo:
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Consulta informações de hosts no inventário do AWX')
+    parser.add_argument('hosts', nargs='*', help='Host(s) a consultar (padrão: HOST_NAME ou ADAASD-SIDAPI01)')
+    parser.add_argument('--pattern', help="Consulta os hosts cujo nome casa com o padrão (ex: 'ADAASD-*')")
+    parser.add_argument('--json', action='store_true', help='Saída em JSON (implícito com vários hosts ou --pattern)')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('AWX_WORKERS', DEFAULT_WORKERS)),
+                        help='Consultas paralelas no modo lote')
+    parser.add_argument('--no-cache', action='store_true', help='Não usa o cache em disco de respostas')
+    parser.add_argument('--export', action='store_true',
+                        help='Exporta todos os hosts (variáveis e grupos) como NDJSON')
+    parser.add_argument('--output', help='Arquivo de saída do --export / modo lote (padrão: stdout)')
+    args = parser.parse_args()
+
     # Configurações obtidas das variáveis de ambiente (injetadas pelo AWX)
     AWX_URL = os.getenv('AWX_API_URL', 'http://10.0.100.159:8013')
     USERNAME = os.getenv('AWX_USERNAME')
@@ -178,13 +410,40 @@ def main():
         print("❌ Erro: Credenciais AWX não encontradas nas variáveis de ambiente")
         print("   Certifique-se de que AWX_USERNAME e AWX_PASSWORD estão configuradas")
         sys.exit(1)
+
+    cache = None
+    if not args.no_cache:
+        cache = AWXResponseCache(
+            os.getenv('AWX_CACHE_DIR', DEFAULT_CACHE_DIR), int(os.getenv('AWX_CACHE_TTL', DEFAULT_CACHE_TTL)),
+            identity=f"{AWX_URL.rstrip('/')}\n{USERNAME}"
+        )
     
+    if args.export:
+        awx_client = AWXHostInfo(AWX_URL, USERNAME, PASSWORD, INVENTORY_ID)
+        # Mensagens de progresso vão para o stderr para não misturar com o NDJSON
+        print(f"📦 Exportando hosts do inventário {INVENTORY_ID}...", file=sys.stderr)
+        if args.output:
+            with open(args.output, 'w') as output:
+                count = awx_client.export_ndjson(output)
+        else:
+            count = awx_client.export_ndjson(sys.stdout)
+        print(f"✅ {count} hosts exportados", file=sys.stderr)
+        return
+
+    if args.pattern or args.json or len(args.hosts) > 1:
+        awx_client = AWXHostInfo(AWX_URL, USERNAME, PASSWORD, INVENTORY_ID, cache=cache, workers=args.workers)
+        records = awx_client.collect_hosts(args.hosts, pattern=args.pattern, workers=args.workers)
+        result = json.dumps(records, indent=2, ensure_ascii=False)
+        if args.output:
+            with open(args.output, 'w') as output:
+                output.write(result + '\n')
+        else:
+            print(result)
+        print(f"✅ {len(records)} hosts consultados", file=sys.stderr)
+        sys.exit(1 if any('error' in record for record in records) else 0)
+
     # Host a ser consultado (da variável de ambiente ou argumento)
-    HOST_NAME = os.getenv('HOST_NAME')
-    if len(sys.argv) > 1:
-        HOST_NAME = sys.argv[1]
-    elif not HOST_NAME:
-        HOST_NAME = "ADAASD-SIDAPI01"
+    HOST_NAME = (args.hosts[0] if args.hosts else None) or os.getenv('HOST_NAME') or "ADAASD-SIDAPI01"
     
     print(f"📊 AWX Host Information Collector")
     print(f"🔗 AWX URL: {AWX_URL}")
@@ -194,9 +453,9 @@ def main():
     print()
     
     # Criar instância e executar consulta
-    awx_client = AWXHostInfo(AWX_URL, USERNAME, PASSWORD, INVENTORY_ID)
+    awx_client = AWXHostInfo(AWX_URL, USERNAME, PASSWORD, INVENTORY_ID, cache=cache)
     awx_client.get_host_info(HOST_NAME)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
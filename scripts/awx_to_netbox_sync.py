@@ -0,0 +1,1878 @@
+#!/usr/bin/env python3
+"""
+Sincronização de VMs do inventário AWX (vmware_dynamic) para o NetBox
+
+Lê as variáveis vm_* geradas pelo plugin vmware_dynamic, direto da API do AWX
+ou de um JSON exportado com `ansible-inventory --list`, e cria/atualiza as VMs
+no NetBox com as operações em lote da API (POST/PATCH com lista no corpo),
+em blocos de sync_options.batch_size. Substitui as ~10 tarefas `uri` por host
+de playbooks/vmware_to_netbox.yml por algumas dezenas de requisições.
+
+Uso:
+    python3 scripts/awx_to_netbox_sync.py [--config arquivo.json] [--inventory-file inventario.json]
+                                          [--metrics-textfile arquivo.prom] [--full-verify]
+                                          [--resume | --restart] [--dry-run] [--verbose]
+"""
+
+import argparse
+import asyncio
+import bisect
+import contextlib
+import hashlib
+import heapq
+import ipaddress
+import itertools
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+import yaml
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import aiohttp
+except ImportError:  # Opcional: sem aiohttp as requisições independentes rodam em sequência
+    aiohttp = None
+
+
+DEFAULT_CONFIG_FILE = 'config/awx_netbox_sync.json'
+DEFAULT_LOG_FILE = '/tmp/awx_netbox_sync.log'
+REPORT_FILE_PATTERN = '/tmp/awx_netbox_sync_report_{timestamp}.json'
+
+# Variáveis de ambiente que sobrescrevem o arquivo de configuração
+ENV_OVERRIDES = {
+    'AWX_URL': ('awx_url', str),
+    'AWX_TOKEN': ('awx_token', str),
+    'AWX_INVENTORY_ID': ('inventory_id', int),
+    'NETBOX_URL': ('netbox_url', str),
+    'NETBOX_TOKEN': ('netbox_token', str),
+    'DEFAULT_SITE': ('default_site', str),
+    'DEFAULT_CLUSTER_TYPE': ('default_cluster_type', str),
+    'VERIFY_SSL': ('verify_ssl', lambda value: value.lower() in ('1', 'true', 'yes')),
+    'LOG_LEVEL': ('log_level', str),
+}
+
+# Respostas 429/5xx da API são repetidas com backoff exponencial (POST só em 429, ver _NetBoxRetry)
+HTTP_RETRY_TOTAL = 5
+HTTP_RETRY_BACKOFF = 0.5
+HTTP_RETRY_STATUS = (429, 502, 503, 504)
+
+# Requisições concorrentes ao NetBox (cliente assíncrono, ver AIMDLimiter)
+DEFAULT_CONCURRENCY = 4
+LATENCY_SPIKE_FACTOR = 3.0
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'PATCH', 'DELETE')
+
+AWX_PAGE_SIZE = 200
+NETBOX_PAGE_SIZE = 1000
+VIRTUAL_MACHINES = 'virtualization/virtual-machines/'
+VM_INTERFACES = 'virtualization/interfaces/'
+IP_ADDRESSES = 'ipam/ip-addresses/'
+VM_INTERFACE_TYPE = 'virtualization.vminterface'
+DEFAULT_INTERFACE_NAME = 'eth0'
+
+# Campos da VM comparados na reconciliação (e pedidos ao NetBox com ?fields=)
+VM_DIFF_FIELDS = ('name', 'status', 'site', 'cluster', 'vcpus', 'memory', 'disk', 'comments', 'custom_fields', 'tags')
+VM_FETCH_FIELDS = ('id',) + VM_DIFF_FIELDS + ('primary_ip4',)
+NUMERIC_VM_FIELDS = ('vcpus', 'memory', 'disk')
+# Variável de host do vmware_dynamic num inventário parcial (alvos vCenter/datacenter com falha)
+TARGETS_FAILED_VAR = 'vmware_dynamic_targets_failed'
+_COMMENTS_UUID = re.compile(r'^vm_uuid: (\S+)$', re.MULTILINE)
+
+# Métricas da execução (ver SyncMetrics): buckets de latência em segundos e VMs mais lentas
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOWEST_VMS = 10
+_OBJECT_ID = re.compile(r'/\d+/')
+
+# VM transformada: (objeto para o NetBox, vm_uuid, IPs, hash do conteúdo ou None sem estado local)
+TransformedVM = Tuple[Dict[str, Any], Optional[str], List[str], Optional[str]]
+
+logger = logging.getLogger('awx_netbox_sync')
+
+
+def load_config(path: str) -> Dict[str, Any]:
+    """Lê o JSON de configuração e aplica as variáveis de ambiente por cima"""
+    config: Dict[str, Any] = {}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            config = json.load(f)
+
+    for env_name, (key, convert) in ENV_OVERRIDES.items():
+        value = os.getenv(env_name)
+        if value:
+            config[key] = convert(value)
+
+    batch_size = os.getenv('BATCH_SIZE')
+    sync_options = config.setdefault('sync_options', {})
+    if batch_size:
+        sync_options['batch_size'] = int(batch_size)
+    sync_options.setdefault('batch_size', 50)
+    return config
+
+
+def setup_logging(level: str, log_file: str) -> None:
+    """Console com emojis e arquivo de log detalhado"""
+    logger.setLevel(logging.DEBUG)
+
+    console = logging.StreamHandler(sys.stdout)
+    console.setLevel(getattr(logging, level.upper(), logging.INFO))
+    console.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(console)
+
+    try:
+        file_handler = logging.FileHandler(log_file)
+        file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+        logger.addHandler(file_handler)
+    except OSError as e:
+        logger.warning(f"⚠️  Não foi possível abrir o log {log_file}: {e}")
+
+
+def slugify(value: str) -> str:
+    """Slug no formato aceito pelo NetBox (ex: ATI_SLC-HCI -> ati-slc-hci)"""
+    return re.sub(r'[^a-z0-9]+', '-', value.lower()).strip('-')
+
+
+def _comparable(field: str, value: Any) -> Any:
+    """Valor do NetBox na forma gravada: objetos aninhados viram ID, escolhas viram `value`"""
+    if isinstance(value, dict):
+        if 'id' in value:
+            return value['id']
+        if 'value' in value:
+            return value['value']
+    # vcpus é decimal no NetBox (2.0 ou "2.00")
+    if field in NUMERIC_VM_FIELDS and value is not None:
+        return float(value)
+    return value
+
+
+def diff_vm(desired: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """Campos de `desired` que diferem da VM atual no NetBox"""
+    changes = {}
+    for field, value in desired.items():
+        if field == 'custom_fields':
+            current_fields = current.get('custom_fields') or {}
+            if any(current_fields.get(name) != custom_value for name, custom_value in value.items()):
+                changes[field] = value
+        elif field == 'tags':
+            # Tags só são acrescentadas: o PATCH leva as atuais, preservando as aplicadas fora do sync
+            current_ids = [_comparable(field, tag) for tag in current.get('tags') or []]
+            missing = [tag for tag in value if _comparable(field, tag) not in current_ids]
+            if missing:
+                changes[field] = [{'id': tag_id} for tag_id in current_ids] + missing
+        elif _comparable(field, current.get(field)) != _comparable(field, value):
+            changes[field] = value
+    return changes
+
+
+def chunks(items: List[Any], size: int) -> Iterator[List[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _prometheus_label(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_textfile(path: str, text: str) -> None:
+    """Grava via arquivo temporário + rename, para o textfile collector nunca ler um arquivo pela metade"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class SyncMetrics:
+    """Tempo por fase, requisições e latência por endpoint do NetBox e VMs mais lentas.
+
+    Compartilhado entre os clientes e as threads de uma execução; o tempo de uma
+    fase é somado entre threads (no pipeline, as etapas se sobrepõem).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self.phases: Dict[str, List[float]] = {}         # fase -> [segundos, execuções]
+        self.requests: Dict[str, Dict[str, Any]] = {}    # endpoint -> count, errors, sum, buckets
+        self._slowest: List[Tuple[float, str]] = []      # heap limitado a SLOWEST_VMS
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                totals = self.phases.setdefault(name, [0.0, 0])
+                totals[0] += elapsed
+                totals[1] += 1
+
+    @staticmethod
+    def endpoint(method: str, path: str) -> str:
+        """Rótulo do endpoint: método e caminho relativo à API, sem IDs nem parâmetros"""
+        path = urlsplit(path).path
+        path = path.split('/api/', 1)[1] if '/api/' in path else path
+        return f"{method} {_OBJECT_ID.sub('/{id}/', path)}"
+
+    def observe_request(self, method: str, path: str, seconds: float, error: bool = False) -> None:
+        endpoint = self.endpoint(method, path)
+        with self._lock:
+            entry = self.requests.get(endpoint)
+            if entry is None:
+                entry = self.requests[endpoint] = {
+                    'count': 0, 'errors': 0, 'sum': 0.0, 'buckets': [0] * len(LATENCY_BUCKETS)
+                }
+            entry['count'] += 1
+            entry['errors'] += 1 if error else 0
+            entry['sum'] += seconds
+            bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+            if bucket < len(LATENCY_BUCKETS):
+                entry['buckets'][bucket] += 1
+
+    def observe_vm(self, name: str, seconds: float) -> None:
+        with self._lock:
+            if len(self._slowest) < SLOWEST_VMS:
+                heapq.heappush(self._slowest, (seconds, name))
+            elif seconds > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, (seconds, name))
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'duration_seconds': round(time.monotonic() - self._started, 3),
+                'phases': {
+                    name: {'seconds': round(seconds, 3), 'count': count}
+                    for name, (seconds, count) in sorted(self.phases.items())
+                },
+                'requests': {
+                    endpoint: {
+                        'count': entry['count'],
+                        'errors': entry['errors'],
+                        'seconds': round(entry['sum'], 3),
+                        'buckets': dict(zip(
+                            [str(bound) for bound in LATENCY_BUCKETS], itertools.accumulate(entry['buckets'])
+                        )),
+                    }
+                    for endpoint, entry in sorted(self.requests.items())
+                },
+                'slowest_vms': [
+                    {'name': name, 'seconds': round(seconds, 6)} for seconds, name in sorted(self._slowest, reverse=True)
+                ],
+            }
+
+    def prometheus(self, stats: Dict[str, Any], prefix: str = 'awx_netbox_sync') -> str:
+        """Métricas e contadores numéricos de `stats` no formato texto do Prometheus"""
+        report = self.report()
+        lines = [
+            f"# HELP {prefix}_last_run_timestamp_seconds Fim da última sincronização.",
+            f"# TYPE {prefix}_last_run_timestamp_seconds gauge",
+            f"{prefix}_last_run_timestamp_seconds {time.time():.0f}",
+            f"# HELP {prefix}_stats Estatísticas da sincronização (criadas, atualizadas, falhas, duração...).",
+            f"# TYPE {prefix}_stats gauge",
+        ]
+        lines += [
+            f'{prefix}_stats{{counter="{name}"}} {value}' for name, value in sorted(stats.items())
+            if isinstance(value, (int, float)) and not isinstance(value, bool)
+        ]
+        lines += [
+            f"# HELP {prefix}_phase_seconds Tempo acumulado por fase (soma entre threads).",
+            f"# TYPE {prefix}_phase_seconds gauge",
+        ]
+        lines += [f'{prefix}_phase_seconds{{phase="{name}"}} {phase["seconds"]}' for name, phase in report['phases'].items()]
+        lines += [
+            f"# HELP {prefix}_request_duration_seconds Latência das requisições ao NetBox por endpoint.",
+            f"# TYPE {prefix}_request_duration_seconds histogram",
+        ]
+        for endpoint, entry in report['requests'].items():
+            label = f'endpoint="{_prometheus_label(endpoint)}"'
+            lines += [f'{prefix}_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}'
+                      for bound, count in entry['buckets'].items()]
+            lines += [
+                f'{prefix}_request_duration_seconds_bucket{{{label},le="+Inf"}} {entry["count"]}',
+                f'{prefix}_request_duration_seconds_sum{{{label}}} {entry["seconds"]}',
+                f'{prefix}_request_duration_seconds_count{{{label}}} {entry["count"]}',
+            ]
+        lines += [
+            f"# HELP {prefix}_request_errors Requisições ao NetBox com erro por endpoint.",
+            f"# TYPE {prefix}_request_errors gauge",
+        ]
+        lines += [f'{prefix}_request_errors{{endpoint="{_prometheus_label(endpoint)}"}} {entry["errors"]}'
+                  for endpoint, entry in report['requests'].items()]
+        return '\n'.join(lines) + '\n'
+
+
+class _NetBoxRetry(Retry):
+    """Repete métodos idempotentes em 429/5xx e erros de leitura; POST só em 429.
+
+    Um POST que recebeu 5xx ou perdeu a resposta pode já ter sido aplicado pelo NetBox,
+    e repeti-lo duplicaria VMs, interfaces ou IPs (mesma regra do AsyncNetBoxClient).
+    """
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if status_code == 429:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def _retrying_session(verify_ssl: bool) -> requests.Session:
+    session = requests.Session()
+    session.verify = verify_ssl
+    retry = _NetBoxRetry(
+        total=HTTP_RETRY_TOTAL,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        status_forcelist=HTTP_RETRY_STATUS,
+        allowed_methods=IDEMPOTENT_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not verify_ssl:
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    return session
+
+
+def _parse_host_variables(variables: Any) -> Dict[str, Any]:
+    """O AWX retorna as variáveis do host como texto JSON ou YAML"""
+    if isinstance(variables, dict):
+        return variables
+    if not variables:
+        return {}
+    try:
+        return json.loads(variables)
+    except ValueError:
+        return yaml.safe_load(variables) or {}
+
+
+class AWXInventorySource:
+    """Hosts e variáveis de um inventário do AWX, lidos página a página"""
+
+    def __init__(self, awx_url: str, token: str, inventory_id: int, verify_ssl: bool = False):
+        self.awx_url = awx_url.rstrip('/')
+        self.inventory_id = inventory_id
+        self.label = f"awx:{self.awx_url}:{inventory_id}"
+        self.session = _retrying_session(verify_ssl)
+        self.session.headers.update({'Authorization': f"Bearer {token}", 'Accept': 'application/json'})
+
+    def hosts(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        url: Optional[str] = f"{self.awx_url}/api/v2/inventories/{self.inventory_id}/hosts/?page_size={AWX_PAGE_SIZE}"
+        while url:
+            response = self.session.get(url, timeout=60)
+            response.raise_for_status()
+            data = response.json()
+            for host in data.get('results', []):
+                yield host['name'], _parse_host_variables(host.get('variables'))
+            # `next` é relativo (/api/v2/...?page=2)
+            url = f"{self.awx_url}{data['next']}" if data.get('next') else None
+
+
+class InventoryFileSource:
+    """Hosts e variáveis de um JSON gerado por `ansible-inventory -i inventory.yml --list`"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.label = f"arquivo:{os.path.abspath(path)}"
+
+    def hosts(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        with open(self.path) as f:
+            inventory = json.load(f)
+        for host_name, hostvars in inventory.get('_meta', {}).get('hostvars', {}).items():
+            yield host_name, hostvars
+
+
+class NetBoxAPIError(Exception):
+    """Resposta de erro da API do NetBox"""
+
+    def __init__(self, method: str, path: str, status_code: int, detail: str):
+        super().__init__(f"{method} {path}: HTTP {status_code} - {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _rejected_reference(error: Any) -> bool:
+    """400 do NetBox que recusa o site ou o cluster da VM (ID que não existe mais, vindo de um cache)"""
+    return (isinstance(error, NetBoxAPIError) and error.status_code == 400
+            and any(f'"{field}"' in error.detail for field in ('site', 'cluster')))
+
+
+class NetBoxClient:
+    """Cliente mínimo da API REST do NetBox: leitura paginada e escrita em lote.
+
+    As requisições independentes (`execute`) rodam num único event loop, em thread própria,
+    com um só AsyncNetBoxClient para toda a execução: a janela do AIMDLimiter, a latência de
+    referência e as conexões keep-alive passam de um lote para o outro. `close` encerra o loop.
+    """
+
+    def __init__(self, netbox_url: str, token: str, verify_ssl: bool = False,
+                 metrics: Optional[SyncMetrics] = None):
+        self.netbox_url = netbox_url
+        self.token = token
+        self.verify_ssl = verify_ssl
+        self.metrics = metrics or SyncMetrics()
+        self.api_url = f"{netbox_url.rstrip('/')}/api/"
+        self.session = _retrying_session(verify_ssl)
+        self.session.headers.update({
+            'Authorization': f"Token {token}",
+            'Content-Type': 'application/json',
+            'Accept': 'application/json'
+        })
+        self._request_count = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._loop_lock = threading.Lock()
+        self._async_client: Optional['AsyncNetBoxClient'] = None
+
+    @property
+    def request_count(self) -> int:
+        return self._request_count + (self._async_client.request_count if self._async_client else 0)
+
+    def request(self, method: str, path: str, params: Any = None, payload: Any = None) -> Any:
+        url = path if path.startswith('http') else f"{self.api_url}{path}"
+        self._request_count += 1
+        started = time.monotonic()
+        try:
+            response = self.session.request(
+                method, url, params=params,
+                data=json.dumps(payload) if payload is not None else None,
+                timeout=120
+            )
+        except requests.RequestException:
+            self.metrics.observe_request(method, path, time.monotonic() - started, error=True)
+            raise
+        self.metrics.observe_request(method, path, time.monotonic() - started, response.status_code >= 400)
+        if response.status_code >= 400:
+            raise NetBoxAPIError(method, path, response.status_code, response.text[:500])
+        return response.json() if response.content else None
+
+    def iterate(self, path: str, params: Any = None) -> Iterator[Dict[str, Any]]:
+        """Percorre todas as páginas de um endpoint de listagem"""
+        data = self.request('GET', path, params=params)
+        while data:
+            yield from data.get('results', [])
+            data = self.request('GET', data['next']) if data.get('next') else None
+
+    def bulk_create(self, path: str, objects: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return self.request('POST', path, payload=objects) if objects else []
+
+    def bulk_update(self, path: str, objects: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """PATCH em lote: cada objeto precisa do campo `id`"""
+        return self.request('PATCH', path, payload=objects) if objects else []
+
+    def execute(self, calls: List[Tuple[str, str, Any]], concurrency: int = 1) -> List[Any]:
+        """Executa requisições independentes (método, caminho, corpo), em paralelo se o aiohttp existir.
+
+        Retorna, na ordem de `calls`, o conteúdo da resposta ou a exceção de cada chamada.
+        """
+        if aiohttp is None or concurrency <= 1 or len(calls) <= 1:
+            results: List[Any] = []
+            for method, path, payload in calls:
+                try:
+                    results.append(self.request(method, path, payload=payload))
+                except (NetBoxAPIError, requests.RequestException) as e:
+                    results.append(e)
+            return results
+        return self._run_async(self._execute_async(calls, concurrency))
+
+    def _run_async(self, coroutine: Any) -> Any:
+        """Executa a corrotina no event loop do cliente (criado na primeira chamada), de qualquer thread"""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self._loop.run_forever, name='netbox-async', daemon=True)
+                self._loop_thread.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _execute_async(self, calls: List[Tuple[str, str, Any]], concurrency: int) -> List[Any]:
+        # Roda sempre no loop do cliente: a criação do AsyncNetBoxClient não concorre com outra chamada.
+        # A concorrência da primeira chamada é o teto da janela (todas usam a do sync_options).
+        if self._async_client is None:
+            self._async_client = await AsyncNetBoxClient(
+                self.netbox_url, self.token, self.verify_ssl, concurrency, metrics=self.metrics
+            ).__aenter__()
+        client = self._async_client
+        return await asyncio.gather(
+            *(client.request(method, path, payload=payload) for method, path, payload in calls),
+            return_exceptions=True
+        )
+
+    async def _close_async(self) -> None:
+        if self._async_client is not None:
+            self._request_count += self._async_client.request_count
+            client, self._async_client = self._async_client, None
+            await client.__aexit__(None, None, None)
+
+    def close(self) -> None:
+        """Fecha o cliente assíncrono e o event loop, se tiverem sido criados (uma nova chamada os recria)"""
+        with self._loop_lock:
+            loop, thread = self._loop, self._loop_thread
+            self._loop = self._loop_thread = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._close_async(), loop).result()
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    def bulk_write(self, method: str, path: str, objects: List[Dict[str, Any]], batch_size: int,
+                   concurrency: int = 1) -> Tuple[List[Dict[str, Any]], int]:
+        """POST/PATCH em lote de `objects` em blocos de batch_size, vários blocos em paralelo.
+
+        Retorna os objetos gravados (como o NetBox os devolveu) e quantos falharam.
+        """
+        batches = list(chunks(objects, batch_size))
+        written: List[Dict[str, Any]] = []
+        failed = 0
+        for batch, result in zip(batches, self.execute([(method, path, batch) for batch in batches], concurrency)):
+            if isinstance(result, Exception):
+                # O NetBox aplica o lote inteiro ou nada: o lote todo conta como falha
+                logger.error(f"❌ Falha no lote {method} {path} ({len(batch)} objetos): {result}")
+                failed += len(batch)
+            else:
+                written.extend(result or [])
+        return written, failed
+
+
+class AIMDLimiter:
+    """Janela de concorrência adaptativa (aumento aditivo, redução multiplicativa).
+
+    A janela cresce ~1 requisição por janela completa de respostas rápidas e cai
+    pela metade em 429/5xx, erros de conexão ou latência acima de
+    LATENCY_SPIKE_FACTOR vezes a média móvel, no máximo uma vez por intervalo
+    de latência para que uma rajada de erros não zere a janela.
+    """
+
+    def __init__(self, max_limit: int, latency_factor: float = LATENCY_SPIKE_FACTOR):
+        self.max_limit = max(max_limit, 1)
+        self.limit = float(max(1, self.max_limit // 2))
+        self.latency_factor = latency_factor
+        self.in_flight = 0
+        self.baseline: Optional[float] = None
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency: float, overloaded: bool) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            spike = self.baseline is not None and latency > self.baseline * self.latency_factor
+            if overloaded or spike:
+                now = time.monotonic()
+                if now - self._last_decrease > (self.baseline or 1.0):
+                    self.limit = max(1.0, self.limit / 2)
+                    self._last_decrease = now
+                    logger.debug(f"🐢 Janela de concorrência reduzida para {int(self.limit)}")
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+                self.baseline = latency if self.baseline is None else 0.8 * self.baseline + 0.2 * latency
+            self._condition.notify_all()
+
+
+class AsyncNetBoxClient:
+    """Cliente assíncrono do NetBox (aiohttp) com conexões keep-alive e concorrência limitada por AIMD.
+
+    Métodos idempotentes são repetidos em 429/5xx e erros de conexão; POST só é
+    repetido em 429, quando o NetBox rejeitou a requisição sem processá-la.
+    """
+
+    def __init__(self, netbox_url: str, token: str, verify_ssl: bool = False,
+                 concurrency: int = DEFAULT_CONCURRENCY, retries: int = HTTP_RETRY_TOTAL,
+                 metrics: Optional[SyncMetrics] = None):
+        self.api_url = f"{netbox_url.rstrip('/')}/api/"
+        self.metrics = metrics or SyncMetrics()
+        self.token = token
+        self.verify_ssl = verify_ssl
+        self.concurrency = max(concurrency, 1)
+        self.retries = retries
+        self.request_count = 0
+        self.session = None
+        self.limiter: Optional[AIMDLimiter] = None
+
+    async def __aenter__(self) -> 'AsyncNetBoxClient':
+        # O limitador e a sessão precisam ser criados dentro do loop em execução
+        self.limiter = AIMDLimiter(self.concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency, ssl=None if self.verify_ssl else False),
+            timeout=aiohttp.ClientTimeout(total=120),
+            headers={
+                'Authorization': f"Token {self.token}",
+                'Content-Type': 'application/json',
+                'Accept': 'application/json'
+            }
+        )
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.session.close()
+
+    def _retryable(self, method: str, status: Optional[int]) -> bool:
+        if status == 429:
+            return True
+        if method not in IDEMPOTENT_METHODS:
+            return False
+        return status is None or status in HTTP_RETRY_STATUS
+
+    async def request(self, method: str, path: str, params: Any = None, payload: Any = None) -> Any:
+        url = path if path.startswith('http') else f"{self.api_url}{path}"
+        data = json.dumps(payload) if payload is not None else None
+
+        for attempt in range(self.retries + 1):
+            status: Optional[int] = None
+            retry_after: Optional[str] = None
+            body = b''
+            error: Optional[Exception] = None
+
+            await self.limiter.acquire()
+            started = time.monotonic()
+            try:
+                self.request_count += 1
+                async with self.session.request(method, url, params=params, data=data) as response:
+                    status = response.status
+                    retry_after = response.headers.get('Retry-After')
+                    body = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            finally:
+                latency = time.monotonic() - started
+                self.metrics.observe_request(method, path, latency, error is not None or (status or 0) >= 400)
+                await self.limiter.release(
+                    latency, error is not None or status == 429 or (status or 0) >= 500
+                )
+
+            if status is not None and status < 400:
+                return json.loads(body) if body else None
+            if attempt == self.retries or not self._retryable(method, status):
+                if error is not None:
+                    raise error
+                raise NetBoxAPIError(method, path, status, body[:500].decode(errors='replace'))
+
+            delay = HTTP_RETRY_BACKOFF * (2 ** attempt)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            await asyncio.sleep(delay)
+
+
+class ReferenceResolver:
+    """IDs de sites, tipos de cluster e clusters por nome, resolvidos uma única vez por execução.
+
+    Os nomes distintos do inventário são coletados antes da sincronização; cada
+    tipo de objeto é lido do NetBox em uma única listagem paginada, os que
+    faltam são criados em lote e os IDs são servidos de memória. O mapa pode
+    ser gravado em disco e reaproveitado por `ttl` segundos. IDs recusados pelo
+    NetBox na gravação das VMs são descartados (`invalidate`) e resolvidos de novo;
+    no pipeline isso acontece na thread de gravação, daí o lock.
+    """
+
+    SITES = 'dcim/sites/'
+    CLUSTER_TYPES = 'virtualization/cluster-types/'
+    CLUSTERS = 'virtualization/clusters/'
+    TAGS = 'extras/tags/'
+    PAGE_SIZE = 1000
+
+    def __init__(self, netbox: NetBoxClient, create_missing: bool = True, dry_run: bool = False,
+                 cache_file: Optional[str] = None, ttl: int = 3600):
+        self.netbox = netbox
+        self.create_missing = create_missing
+        self.dry_run = dry_run
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.ids: Dict[str, Dict[str, int]] = {self.SITES: {}, self.CLUSTER_TYPES: {}, self.CLUSTERS: {}, self.TAGS: {}}
+        self._fetched = set()
+        self._invalidated: Dict[str, Dict[int, str]] = {path: {} for path in self.ids}  # ID descartado -> nome
+        self._cache_loaded = False
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _load_cache(self) -> None:
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️  Cache de referências ilegível ({self.cache_file}): {e}")
+            return
+        # IDs só valem para a mesma instância do NetBox e dentro do TTL
+        if data.get('api_url') != self.netbox.api_url or time.time() - data.get('saved_at', 0) > self.ttl:
+            return
+        for path, ids in data.get('ids', {}).items():
+            if path in self.ids:
+                self.ids[path].update(ids)
+        logger.debug(f"♻️  Cache de referências carregado de {self.cache_file}")
+
+    def _save_cache(self) -> None:
+        if not self.cache_file or self.dry_run:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_file)), exist_ok=True)
+            tmp_path = f"{self.cache_file}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'api_url': self.netbox.api_url, 'saved_at': time.time(), 'ids': self.ids}, f)
+            os.replace(tmp_path, self.cache_file)
+        except OSError as e:
+            logger.warning(f"⚠️  Não foi possível gravar o cache de referências em {self.cache_file}: {e}")
+
+    def _fetch(self, path: str) -> None:
+        """Uma listagem paginada do tipo inteiro substitui o que veio do cache"""
+        self.ids[path] = {
+            obj['name']: obj['id'] for obj in self.netbox.iterate(path, {'brief': 1, 'limit': self.PAGE_SIZE})
+        }
+        self._fetched.add(path)
+        self._dirty = True
+
+    def _ensure(self, path: str, wanted: Dict[str, Dict[str, Any]]) -> None:
+        """Garante IDs para os nomes em `wanted` (nome -> corpo de criação)"""
+        if all(name in self.ids[path] for name in wanted):
+            return
+        if path not in self._fetched:
+            self._fetch(path)
+        missing = [name for name in wanted if name not in self.ids[path]]
+        if not missing:
+            return
+        if not self.create_missing or self.dry_run:
+            logger.info(f"🧪 {len(missing)} objetos ausentes em {path}: {', '.join(sorted(missing))}")
+            return
+        logger.info(f"➕ Criando {len(missing)} objetos em {path}: {', '.join(sorted(missing))}")
+        try:
+            for obj in self.netbox.bulk_create(path, [wanted[name] for name in missing]):
+                self.ids[path][obj['name']] = obj['id']
+            self._dirty = True
+        except (NetBoxAPIError, requests.RequestException) as e:
+            # VMs que dependem desses objetos seguem sem a referência
+            logger.error(f"❌ Falha ao criar objetos em {path}: {e}")
+
+    def prepare(self, sites: Iterable[str], clusters: Dict[str, Optional[str]], cluster_type: str,
+                tags: Iterable[str] = ()) -> None:
+        """Resolve as referências informadas: sites, o tipo de cluster, clusters (nome -> site) e tags.
+
+        Pode ser chamado a cada lote: o cache em disco é lido só na primeira chamada e
+        nomes já conhecidos não geram requisições.
+        """
+        with self._lock:
+            self._prepare(sites, clusters, cluster_type, tags)
+
+    def _prepare(self, sites: Iterable[str], clusters: Dict[str, Optional[str]], cluster_type: str,
+                 tags: Iterable[str]) -> None:
+        if not self._cache_loaded:
+            self._load_cache()
+            self._cache_loaded = True
+
+        site_names = set(sites) | {site for site in clusters.values() if site}
+        self._ensure(self.SITES, {
+            name: {'name': name, 'slug': slugify(name), 'status': 'active'} for name in site_names
+        })
+        if clusters:
+            self._ensure(self.CLUSTER_TYPES, {cluster_type: {'name': cluster_type, 'slug': slugify(cluster_type)}})
+            type_id = self.ids[self.CLUSTER_TYPES].get(cluster_type)
+            wanted = {}
+            for name, site in clusters.items():
+                payload = {'name': name, 'type': type_id}
+                if self.site_id(site):
+                    payload['site'] = self.site_id(site)
+                wanted[name] = payload
+            if type_id is not None:
+                self._ensure(self.CLUSTERS, wanted)
+        tags = set(tags)
+        if tags:
+            self._ensure(self.TAGS, {name: {'name': name, 'slug': slugify(name)} for name in tags})
+
+        if self._dirty:
+            self._save_cache()
+            self._dirty = False
+
+    def invalidate(self, path: str, object_ids: Iterable[int]) -> Dict[int, str]:
+        """Descarta IDs recusados pelo NetBox; o próximo `prepare` relê o tipo e recria o que faltar.
+
+        Retorna o nome de cada ID descartado, também dos descartados antes nesta execução
+        (objetos montados com o ID antigo ainda podem chegar depois).
+        """
+        object_ids = set(object_ids)
+        with self._lock:
+            names = {object_id: name for name, object_id in self.ids[path].items() if object_id in object_ids}
+            for name in names.values():
+                del self.ids[path][name]
+            if names:
+                self._fetched.discard(path)
+                self._dirty = True
+            invalidated = self._invalidated[path]
+            invalidated.update(names)
+            return {object_id: invalidated[object_id] for object_id in object_ids if object_id in invalidated}
+
+    def site_id(self, name: Optional[str]) -> Optional[int]:
+        return self.ids[self.SITES].get(name) if name else None
+
+    def cluster_id(self, name: Optional[str]) -> Optional[int]:
+        return self.ids[self.CLUSTERS].get(name) if name else None
+
+    def tag_id(self, name: Optional[str]) -> Optional[int]:
+        return self.ids[self.TAGS].get(name) if name else None
+
+
+class SyncState:
+    """Hash do conteúdo de cada VM na última sincronização bem-sucedida, em SQLite, por vm_uuid.
+
+    Uma VM cujo hash não mudou é pulada sem nenhuma chamada ao NetBox. O mesmo arquivo guarda
+    o journal da execução em andamento (lotes gravados, IDs de referências resolvidas e de VMs
+    criadas), que permite retomar uma execução interrompida (--resume). O estado só vale
+    para a instância do NetBox em que foi gravado: outra `api_url` descarta hashes e journal.
+    A conexão é compartilhada entre as threads do pipeline, protegida por um lock.
+    """
+
+    QUERY_CHUNK = 500  # abaixo do limite de parâmetros por consulta do SQLite
+
+    def __init__(self, path: str, api_url: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS vm_state (vm_uuid TEXT PRIMARY KEY, content_hash TEXT NOT NULL, '
+                'synced_at REAL NOT NULL)'
+            )
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS journal_batches (batch INTEGER PRIMARY KEY, digest TEXT NOT NULL, '
+                'vms INTEGER NOT NULL, committed_at REAL NOT NULL)'
+            )
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS journal_references (path TEXT NOT NULL, name TEXT NOT NULL, '
+                'object_id INTEGER NOT NULL, PRIMARY KEY (path, name))'
+            )
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS journal_created (batch INTEGER NOT NULL, vm_name TEXT NOT NULL, '
+                'object_id INTEGER NOT NULL)'
+            )
+            self._db.execute('CREATE TABLE IF NOT EXISTS stale_vms (vm_uuid TEXT PRIMARY KEY, missing_since REAL NOT NULL)')
+        if self.get('api_url') != api_url:
+            with self._lock, self._db:
+                self._db.execute('DELETE FROM vm_state')
+                self._db.execute('DELETE FROM stale_vms')
+                self._clear_journal()
+            self.set('api_url', api_url)
+
+    @staticmethod
+    def content_hash(payload: Dict[str, Any], addresses: List[str]) -> str:
+        """Hash estável do objeto normalizado da VM e dos seus IPs (ordem das chaves e dos IPs não importa)"""
+        content = json.dumps([payload, sorted(addresses)], sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+    @staticmethod
+    def batch_digest(hosts: List[Tuple[str, Dict[str, Any]]]) -> str:
+        """Identidade de um lote do inventário: as VMs (vm_uuid ou nome do host) na ordem em que chegaram"""
+        keys = '\n'.join(hostvars.get('vm_uuid') or host_name for host_name, hostvars in hosts)
+        return hashlib.blake2b(keys.encode(), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def hashes(self, uuids: List[str]) -> Dict[str, str]:
+        found: Dict[str, str] = {}
+        with self._lock:
+            for batch in chunks(uuids, self.QUERY_CHUNK):
+                found.update(self._db.execute(
+                    f"SELECT vm_uuid, content_hash FROM vm_state WHERE vm_uuid IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall())
+        return found
+
+    def record(self, hashes: Dict[str, str]) -> None:
+        if not hashes:
+            return
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO vm_state (vm_uuid, content_hash, synced_at) VALUES (?, ?, ?)',
+                [(uuid, content_hash, now) for uuid, content_hash in hashes.items()]
+            )
+
+    def forget(self, uuids: Iterable[str]) -> None:
+        with self._lock, self._db:
+            self._db.executemany('DELETE FROM vm_state WHERE vm_uuid = ?', [(uuid,) for uuid in uuids])
+
+    def track_stale(self, uuids: Iterable[str], record: bool = True) -> Dict[str, float]:
+        """Desde quando cada VM de `uuids` está ausente da origem; as que voltaram saem da lista.
+
+        `record=False` (dry-run) apenas consulta.
+        """
+        uuids = set(uuids)
+        now = time.time()
+        with self._lock, self._db:
+            since = dict(self._db.execute('SELECT vm_uuid, missing_since FROM stale_vms').fetchall())
+            if not record:
+                return {uuid: since.get(uuid, now) for uuid in uuids}
+            self._db.executemany('DELETE FROM stale_vms WHERE vm_uuid = ?', [(uuid,) for uuid in since if uuid not in uuids])
+            self._db.executemany(
+                'INSERT INTO stale_vms (vm_uuid, missing_since) VALUES (?, ?)',
+                [(uuid, now) for uuid in uuids if uuid not in since]
+            )
+        return {uuid: since.get(uuid, now) for uuid in uuids}
+
+    # Journal da execução em andamento
+
+    def _clear_journal(self) -> None:
+        for table in ('journal_batches', 'journal_references', 'journal_created'):
+            self._db.execute(f"DELETE FROM {table}")
+        self._db.execute("DELETE FROM meta WHERE key LIKE 'journal_%'")
+
+    def journal(self) -> Optional[Dict[str, Any]]:
+        """Journal de uma execução interrompida (iniciada e não concluída); None se não houver"""
+        with self._lock:
+            meta = dict(self._db.execute("SELECT key, value FROM meta WHERE key LIKE 'journal_%'").fetchall())
+            if meta.get('journal_status') != 'running':
+                return None
+            batches = self._db.execute('SELECT batch, digest, vms FROM journal_batches').fetchall()
+            references: Dict[str, Dict[str, int]] = {}
+            for path, name, object_id in self._db.execute('SELECT path, name, object_id FROM journal_references'):
+                references.setdefault(path, {})[name] = object_id
+            created = self._db.execute('SELECT COUNT(*) FROM journal_created').fetchone()[0]
+        return {
+            'fingerprint': meta.get('journal_fingerprint'),
+            'started_at': float(meta.get('journal_started_at') or 0),
+            'batches': {batch: digest for batch, digest, _ in batches},
+            'vms': sum(vms for _, _, vms in batches),
+            'references': references,
+            'created': created,
+        }
+
+    def begin_journal(self, fingerprint: str) -> None:
+        """Descarta o journal anterior e marca uma nova execução como em andamento"""
+        with self._lock, self._db:
+            self._clear_journal()
+            self._db.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', [
+                ('journal_status', 'running'),
+                ('journal_fingerprint', fingerprint),
+                ('journal_started_at', str(time.time())),
+            ])
+
+    def commit_batch(self, batch: int, digest: str, vms: int, created: Dict[str, int],
+                     references: Dict[str, Dict[str, int]]) -> None:
+        """Registra um lote gravado, as VMs criadas nele e as referências conhecidas, em uma transação"""
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO journal_batches (batch, digest, vms, committed_at) VALUES (?, ?, ?, ?)',
+                (batch, digest, vms, time.time())
+            )
+            self._db.executemany(
+                'INSERT INTO journal_created (batch, vm_name, object_id) VALUES (?, ?, ?)',
+                [(batch, name, object_id) for name, object_id in created.items()]
+            )
+            self._db.executemany(
+                'INSERT OR REPLACE INTO journal_references (path, name, object_id) VALUES (?, ?, ?)',
+                [(path, name, object_id) for path, ids in references.items() for name, object_id in ids.items()]
+            )
+
+    def end_journal(self) -> None:
+        """Execução concluída: o journal deixa de valer para --resume"""
+        with self._lock, self._db:
+            self._clear_journal()
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('journal_status', 'complete')")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def _ip_with_prefix(address: str) -> Optional[str]:
+    """Endereço no formato do NetBox (10.0.0.1/32, 2001:db8::1/128); None se inválido"""
+    try:
+        ip = ipaddress.ip_address(address.split('%')[0])
+    except ValueError:
+        return None
+    return f"{ip}/{ip.max_prefixlen}"
+
+
+class NetworkSync:
+    """Interfaces, IPs e IP primário de todas as VMs, em lote.
+
+    Interfaces e IPs existentes são lidos com uma listagem paginada de cada tipo;
+    o que falta é calculado em memória para a frota inteira e gravado pelos
+    endpoints em lote, em três etapas (interfaces, IPs, primary_ip4), sem
+    nenhuma requisição por VM.
+
+    O vmware_dynamic entrega os IPs de todas as placas em uma lista única
+    (vm_ip_addresses), sem a placa de origem; por isso todos os IPs da VM são
+    atribuídos a uma única interface (sync_options.interface_name, padrão eth0).
+    """
+
+    def __init__(self, netbox: NetBoxClient, stats: Dict[str, Any], batch_size: int, concurrency: int = 1,
+                 interface_name: str = DEFAULT_INTERFACE_NAME, sync_ips: bool = True, dry_run: bool = False):
+        self.netbox = netbox
+        self.stats = stats
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.interface_name = interface_name
+        self.sync_ips = sync_ips
+        self.dry_run = dry_run
+        self.interfaces: Dict[int, int] = {}          # id da VM -> id da interface
+        self.ip_addresses: Dict[str, Dict[str, Any]] = {}  # endereço com prefixo -> IP
+        for counter in ('interfaces_created', 'ips_created', 'ips_assigned', 'primary_ips_set',
+                        'ip_conflicts', 'network_failed'):
+            stats.setdefault(counter, 0)
+
+    def load(self) -> None:
+        """Uma listagem paginada de interfaces (com o nome configurado) e outra de IPs"""
+        params = {'name': self.interface_name, 'limit': NETBOX_PAGE_SIZE, 'fields': 'id,name,virtual_machine'}
+        for interface in self.netbox.iterate(VM_INTERFACES, params):
+            self.interfaces.setdefault(_comparable('virtual_machine', interface['virtual_machine']), interface['id'])
+        if self.sync_ips:
+            params = {'limit': NETBOX_PAGE_SIZE, 'fields': 'id,address,assigned_object_type,assigned_object_id'}
+            for ip in self.netbox.iterate(IP_ADDRESSES, params):
+                self.ip_addresses.setdefault(ip['address'], ip)
+        logger.info(f"📥 {len(self.interfaces)} interfaces {self.interface_name} e {len(self.ip_addresses)} IPs existentes")
+
+    def _create_interfaces(self, vm_ids: List[int]) -> None:
+        missing = [vm_id for vm_id in vm_ids if vm_id not in self.interfaces]
+        if not missing:
+            return
+        if self.dry_run:
+            logger.info(f"🧪 [dry-run] {len(missing)} interfaces seriam criadas")
+            return
+        written, failed = self.netbox.bulk_write('POST', VM_INTERFACES, [
+            {'virtual_machine': vm_id, 'name': self.interface_name, 'type': 'virtual'} for vm_id in missing
+        ], self.batch_size, self.concurrency)
+        for interface in written:
+            self.interfaces[_comparable('virtual_machine', interface['virtual_machine'])] = interface['id']
+        self.stats['interfaces_created'] += len(written)
+        self.stats['network_failed'] += failed
+
+    def _sync_ip_addresses(self, vms: List[Tuple[int, List[str], Any]]) -> None:
+        creates: List[Dict[str, Any]] = []
+        assignments: List[Dict[str, Any]] = []
+        claimed = set()
+        for vm_id, addresses, _ in vms:
+            interface_id = self.interfaces.get(vm_id)
+            if interface_id is None:
+                continue
+            for address in addresses:
+                if address in claimed:
+                    continue
+                claimed.add(address)
+                current = self.ip_addresses.get(address)
+                if current is None:
+                    creates.append({
+                        'address': address,
+                        'status': 'active',
+                        'assigned_object_type': VM_INTERFACE_TYPE,
+                        'assigned_object_id': interface_id
+                    })
+                elif not current.get('assigned_object_id'):
+                    # IP já cadastrado sem atribuição: reaproveitar
+                    assignments.append({
+                        'id': current['id'],
+                        'assigned_object_type': VM_INTERFACE_TYPE,
+                        'assigned_object_id': interface_id
+                    })
+                elif (current.get('assigned_object_type'), current['assigned_object_id']) != (VM_INTERFACE_TYPE, interface_id):
+                    logger.debug(f"⚠️  IP {address} já atribuído a outro objeto, mantido")
+                    self.stats['ip_conflicts'] += 1
+
+        if self.dry_run:
+            logger.info(f"🧪 [dry-run] {len(creates)} IPs seriam criados e {len(assignments)} atribuídos")
+            return
+        written, failed = self.netbox.bulk_write('POST', IP_ADDRESSES, creates, self.batch_size, self.concurrency)
+        self.stats['ips_created'] += len(written)
+        self.stats['network_failed'] += failed
+        assigned, failed = self.netbox.bulk_write('PATCH', IP_ADDRESSES, assignments, self.batch_size, self.concurrency)
+        self.stats['ips_assigned'] += len(assigned)
+        self.stats['network_failed'] += failed
+        for ip in written + assigned:
+            self.ip_addresses[ip['address']] = ip
+
+    def _set_primary_ips(self, vms: List[Tuple[int, List[str], Any]]) -> None:
+        updates = []
+        for vm_id, addresses, current_primary in vms:
+            ipv4 = next((address for address in addresses if address.endswith('/32')), None)
+            ip = self.ip_addresses.get(ipv4) if ipv4 else None
+            # Só vira primário um IP atribuído à interface da própria VM
+            if not ip or ip.get('assigned_object_id') != self.interfaces.get(vm_id):
+                continue
+            if _comparable('primary_ip4', current_primary) != ip['id']:
+                updates.append({'id': vm_id, 'primary_ip4': ip['id']})
+
+        if self.dry_run:
+            logger.info(f"🧪 [dry-run] {len(updates)} IPs primários seriam definidos")
+            return
+        written, failed = self.netbox.bulk_write('PATCH', VIRTUAL_MACHINES, updates, self.batch_size, self.concurrency)
+        self.stats['primary_ips_set'] += len(written)
+        self.stats['network_failed'] += failed
+
+    def sync(self, vms: List[Tuple[int, List[str], Any]]) -> None:
+        """`vms`: (id da VM no NetBox, IPs do inventário, primary_ip4 atual)"""
+        vms = [
+            (vm_id, [ip for ip in (_ip_with_prefix(address) for address in addresses) if ip], primary)
+            for vm_id, addresses, primary in vms
+        ]
+        self._create_interfaces([vm_id for vm_id, _, _ in vms])
+        if self.sync_ips:
+            self._sync_ip_addresses(vms)
+            self._set_primary_ips(vms)
+        logger.info(
+            f"🌐 Rede: {self.stats['interfaces_created']} interfaces, {self.stats['ips_created']} IPs criados, "
+            f"{self.stats['ips_assigned']} IPs atribuídos, {self.stats['primary_ips_set']} IPs primários"
+        )
+
+
+class AWXToNetBoxSync:
+    """Sincroniza as VMs do inventário com o NetBox em lotes"""
+
+    def __init__(self, config: Dict[str, Any], source, netbox: NetBoxClient, dry_run: bool = False,
+                 reference_client: Optional[NetBoxClient] = None, full_verify: bool = False,
+                 resume: bool = False, restart: bool = False):
+        self.config = config
+        self.source = source
+        self.netbox = netbox
+        self.dry_run = dry_run
+        self.sync_options = config.get('sync_options', {})
+        self.batch_size = max(int(self.sync_options.get('batch_size', 50)), 1)
+        self.concurrency = max(int(self.sync_options.get('concurrency', DEFAULT_CONCURRENCY)), 1)
+        self.field_mappings = config.get('field_mappings', {'vm_name': 'name'})
+        self.status_mappings = config.get('status_mappings', {})
+        self.filters = config.get('filters', {})
+        self.uuid_custom_field = self.sync_options.get('uuid_custom_field') or None
+        # Tag das VMs gravadas por este sync: delimita o que a etapa de limpeza pode marcar/remover
+        self.managed_tag = self.sync_options.get('managed_tag') or None
+        # reference_client: cliente próprio para as referências quando elas são resolvidas em outra thread
+        self.references = ReferenceResolver(
+            reference_client or netbox,
+            create_missing=self.sync_options.get('create_missing_objects', True),
+            dry_run=dry_run,
+            cache_file=self.sync_options.get('reference_cache_file') or None,
+            ttl=int(self.sync_options.get('reference_cache_ttl', 3600))
+        )
+        self.stats = {
+            'hosts_total': 0,
+            'hosts_skipped': 0,
+            'invalid': 0,
+            'created': 0,
+            'updated': 0,
+            'unchanged': 0,
+            'hash_matches': 0,
+            'resumed': 0,
+            'failed': 0,
+            'stale': 0,
+            'pruned_offline': 0,
+            'pruned_deleted': 0,
+        }
+        self._seen = set()
+        # No pipeline, transformação e gravação rodam em threads distintas e ambas
+        # atualizam _seen e stats['unchanged']
+        self._seen_lock = threading.Lock()
+        self._live = set()  # vm_uuid de todos os hosts lidos da origem, para a etapa de limpeza
+        self._incomplete: List[str] = []  # motivos pelos quais a origem não foi lida por inteiro
+        self._network: Optional[NetworkSync] = None
+        self._by_name: Optional[Dict[str, Dict[str, Any]]] = None
+        # Mesmo objeto de métricas dos clientes do NetBox: fases e requisições em um só relatório
+        self.metrics = netbox.metrics
+
+        # Estado local (hash por vm_uuid): VMs sem alteração desde a última sincronização são puladas.
+        # Na verificação completa (--full-verify ou a cada full_verify_interval segundos) todas as VMs
+        # são comparadas com o NetBox, o que corrige edições feitas diretamente no NetBox.
+        self.state: Optional[SyncState] = None
+        self.full_verify = full_verify
+        state_file = self.sync_options.get('state_file')
+        if state_file:
+            self.state = SyncState(state_file, netbox.api_url)
+            interval = int(self.sync_options.get('full_verify_interval', 86400))
+            last_verify = float(self.state.get('last_full_verify') or 0)
+            if interval and time.time() - last_verify > interval:
+                self.full_verify = True
+            if self.full_verify:
+                logger.info("🔎 Verificação completa: todas as VMs serão comparadas com o NetBox")
+
+        # Journal por lote no mesmo estado local: lotes já gravados por uma execução interrompida
+        # (número do lote -> digest das VMs) são pulados com --resume
+        self._committed: Dict[int, str] = {}
+        self._start_journal(resume, restart)
+
+    def _journal_fingerprint(self) -> str:
+        """Origem, NetBox e regras de transformação: um journal só é retomado pela mesma sincronização"""
+        identity = [
+            getattr(self.source, 'label', None) or 'vcenter', self.netbox.api_url, self.field_mappings,
+            self.status_mappings, self.filters, self.uuid_custom_field,
+            self.config.get('default_site'), self.config.get('default_cluster_type'),
+        ]
+        content = json.dumps(identity, sort_keys=True, default=str)
+        return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+    def _start_journal(self, resume: bool, restart: bool) -> None:
+        if not self.state or self.dry_run:
+            if resume:
+                logger.warning("⚠️  --resume requer sync_options.state_file e não se aplica ao dry-run: iniciando do zero")
+            return
+        fingerprint = self._journal_fingerprint()
+        previous = self.state.journal()
+        if previous and resume and previous['fingerprint'] == fingerprint:
+            self._committed = previous['batches']
+            for path, ids in previous['references'].items():
+                if path in self.references.ids:
+                    self.references.ids[path].update(ids)
+            logger.info(
+                f"⏯️  Retomando a execução interrompida: {len(self._committed)} lotes ({previous['vms']} VMs) já "
+                f"gravados, {previous['created']} VMs criadas"
+            )
+            return
+        if previous and resume:
+            logger.warning("⚠️  A execução interrompida usou outra origem ou configuração: iniciando do zero")
+        elif previous and not restart:
+            logger.warning(
+                "⚠️  A execução anterior foi interrompida; iniciando do zero "
+                "(--resume continua do último lote gravado)"
+            )
+        self.state.begin_journal(fingerprint)
+
+    def accept_host(self, host_name: str, hostvars: Dict[str, Any]) -> bool:
+        """Conta um host lido da origem e diz se é uma VM a sincronizar.
+
+        O vm_uuid de todo host lido (válido ou não) entra no conjunto de VMs existentes na origem.
+        """
+        self.stats['hosts_total'] += 1
+        if hostvars.get('vm_uuid'):
+            self._live.add(hostvars['vm_uuid'])
+        if hostvars.get(TARGETS_FAILED_VAR):
+            # Inventário parcial do vmware_dynamic: as VMs dos alvos com falha não foram lidas
+            self.mark_incomplete(f"alvos com falha no inventário: {', '.join(hostvars[TARGETS_FAILED_VAR])}")
+        if self._is_valid_vm(host_name, hostvars):
+            return True
+        self.stats['hosts_skipped'] += 1
+        logger.debug(f"⏭️  Ignorando host {host_name}")
+        return False
+
+    def mark_live(self, uuids: Iterable[str]) -> None:
+        """VMs que existem na origem mas não chegaram como hosts (ex.: falha ao montar o registro)"""
+        self._live.update(uuid for uuid in uuids if uuid)
+
+    def mark_incomplete(self, reason: str) -> None:
+        """Registra que a origem não foi lida por inteiro: a etapa de limpeza não roda nesta execução"""
+        if reason not in self._incomplete:
+            self._incomplete.append(reason)
+
+    def _is_valid_vm(self, host_name: str, hostvars: Dict[str, Any]) -> bool:
+        """Mesmos critérios de vmware_to_netbox.yml, mais os filtros da configuração"""
+        vm_name = hostvars.get('vm_name')
+        if self.filters.get('skip_localhost', True) and host_name == 'localhost':
+            return False
+        if self.filters.get('skip_templates', True) and hostvars.get('vm_template'):
+            return False
+        if any(not hostvars.get(field) for field in self.filters.get('required_fields', ['vm_name'])):
+            return False
+        return vm_name not in (None, '', 'N/A')
+
+    def _site_name(self, hostvars: Dict[str, Any]) -> Optional[str]:
+        return hostvars.get('vm_datacenter') or self.config.get('default_site')
+
+    def prepare_references(self, hosts: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Coleta os sites e clusters distintos do inventário e resolve todos de uma vez"""
+        sites = set()
+        clusters: Dict[str, Optional[str]] = {}
+        for _, hostvars in hosts:
+            site = self._site_name(hostvars)
+            if site:
+                sites.add(site)
+            if 'vm_cluster' in self.field_mappings and hostvars.get('vm_cluster'):
+                clusters.setdefault(hostvars['vm_cluster'], site)
+        with self.metrics.phase('referencias'):
+            self.references.prepare(
+                sites, clusters, self.config.get('default_cluster_type', 'VMware vSphere'),
+                tags=[self.managed_tag] if self.managed_tag else ()
+            )
+        logger.debug(f"🗂️  Referências resolvidas: {len(sites)} sites, {len(clusters)} clusters")
+
+    def normalize_vm(self, host_name: str, hostvars: Dict[str, Any]) -> Dict[str, Any]:
+        """Objeto da VM conforme field_mappings/status_mappings, com site e cluster ainda por nome.
+
+        É a base do hash de conteúdo (SyncState): não depende dos IDs do NetBox.
+        """
+        payload: Dict[str, Any] = {}
+        comments = ['Sincronizado via AWX', f"Host: {host_name}"]
+
+        for var_name, field in self.field_mappings.items():
+            value = hostvars.get(var_name)
+            if value is None or value == '':
+                continue
+            if field == 'name':
+                payload['name'] = str(value)
+            elif field in NUMERIC_VM_FIELDS:
+                payload[field] = int(float(value))
+            elif field == 'status':
+                payload['status'] = self.status_mappings.get(value, 'offline')
+            elif field == 'comments':
+                comments.append(f"{var_name}: {value}")
+            # cluster é resolvido abaixo; primary_ip, platform e tags não fazem parte do objeto da VM aqui
+
+        if self._site_name(hostvars):
+            payload['site'] = self._site_name(hostvars)
+        if 'vm_cluster' in self.field_mappings and hostvars.get('vm_cluster'):
+            payload['cluster'] = hostvars['vm_cluster']
+
+        if self.uuid_custom_field and hostvars.get('vm_uuid'):
+            payload['custom_fields'] = {self.uuid_custom_field: hostvars['vm_uuid']}
+        if self.managed_tag:
+            payload['tags'] = [self.managed_tag]
+
+        payload['comments'] = '\n'.join(comments)
+        return payload
+
+    def resolve_references(self, normalized: Dict[str, Any]) -> Dict[str, Any]:
+        """Objeto da VM no NetBox: site, cluster e tags por ID (omitidos se não resolvidos)"""
+        payload = dict(normalized)
+        site_id = self.references.site_id(payload.pop('site', None))
+        if site_id:
+            payload['site'] = site_id
+        cluster_id = self.references.cluster_id(payload.pop('cluster', None))
+        if cluster_id:
+            payload['cluster'] = cluster_id
+        tag_ids = [self.references.tag_id(name) for name in payload.pop('tags', [])]
+        if any(tag_ids):
+            payload['tags'] = [{'id': tag_id} for tag_id in tag_ids if tag_id]
+        return payload
+
+    def build_vm_payload(self, host_name: str, hostvars: Dict[str, Any]) -> Dict[str, Any]:
+        """Monta o objeto da VM no NetBox conforme field_mappings/status_mappings"""
+        return self.resolve_references(self.normalize_vm(host_name, hostvars))
+
+    def load_existing_vms(self) -> None:
+        """Lê todas as VMs do NetBox uma única vez e indexa por UUID; as sem UUID legível, por nome"""
+        params = {'limit': NETBOX_PAGE_SIZE, 'fields': ','.join(VM_FETCH_FIELDS)}
+        self._by_uuid: Dict[str, Dict[str, Any]] = {}
+        self._by_name = {}
+        total = 0
+        with self.metrics.phase('vms_existentes'):
+            for vm in self.netbox.iterate(VIRTUAL_MACHINES, params):
+                total += 1
+                uuid = self._netbox_vm_uuid(vm)
+                if uuid:
+                    self._by_uuid.setdefault(uuid, vm)
+                else:
+                    self._by_name.setdefault(vm['name'], vm)
+        logger.info(f"📥 {total} VMs existentes no NetBox ({len(self._by_uuid)} com UUID)")
+
+    def _netbox_vm_uuid(self, vm: Dict[str, Any]) -> Optional[str]:
+        """UUID da VM no NetBox: custom field configurado ou a linha `vm_uuid:` dos comentários"""
+        if self.uuid_custom_field:
+            return (vm.get('custom_fields') or {}).get(self.uuid_custom_field)
+        match = _COMMENTS_UUID.search(vm.get('comments') or '')
+        return match.group(1) if match else None
+
+    def _match_existing(self, payload: Dict[str, Any], uuid: Optional[str]) -> Optional[Dict[str, Any]]:
+        """VM do NetBox com o mesmo UUID; pelo nome, só uma VM sem UUID legível (gravada fora do sync).
+
+        Uma VM homônima com outro UUID é outra VM (outro vCenter, ou recriada) e nunca é sobrescrita.
+        """
+        if uuid and uuid in self._by_uuid:
+            return self._by_uuid[uuid]
+        return self._by_name.get(payload['name'])
+
+    def _write(self, action: str, objects: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Grava as VMs em lotes de batch_size (POST ou PATCH com lista no corpo), vários lotes em paralelo"""
+        if self.dry_run:
+            for batch in chunks(objects, self.batch_size):
+                logger.info(f"🧪 [dry-run] {len(batch)} VMs seriam {'criadas' if action == 'created' else 'atualizadas'}")
+                self.stats[action] += len(batch)
+            return []
+
+        method = 'POST' if action == 'created' else 'PATCH'
+        written, failed, rejected = self._write_batches(method, objects, retry_rejected=True)
+        if rejected:
+            # Site ou cluster removido do NetBox depois de ir para o cache: resolve de novo e repete uma vez
+            logger.warning(f"⚠️  {len(rejected)} VMs recusadas por site/cluster inexistente: resolvendo de novo")
+            retried, failed_again, _ = self._write_batches(method, self._refresh_references(rejected))
+            written += retried
+            failed += failed_again
+        self.stats[action] += len(written)
+        self.stats['failed'] += failed
+        return written
+
+    def _write_batches(self, method: str, objects: List[Dict[str, Any]], retry_rejected: bool = False
+                       ) -> Tuple[List[Dict[str, Any]], int, List[Dict[str, Any]]]:
+        """Como NetBoxClient.bulk_write; com `retry_rejected`, as VMs dos lotes recusados por
+        site/cluster inexistente voltam à parte, sem contar como falha"""
+        batches = list(chunks(objects, self.batch_size))
+        written: List[Dict[str, Any]] = []
+        failed = 0
+        rejected: List[Dict[str, Any]] = []
+        calls = [(method, VIRTUAL_MACHINES, batch) for batch in batches]
+        for batch, result in zip(batches, self.netbox.execute(calls, self.concurrency)):
+            if not isinstance(result, Exception):
+                written.extend(result or [])
+            elif retry_rejected and _rejected_reference(result):
+                rejected.extend(batch)
+            else:
+                logger.error(f"❌ Falha no lote {method} {VIRTUAL_MACHINES} ({len(batch)} objetos): {result}")
+                failed += len(batch)
+        return written, failed, rejected
+
+    def _refresh_references(self, objects: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Descarta os IDs de site e cluster de `objects`, resolve os nomes de novo e troca os IDs"""
+        references = self.references
+        sites = references.invalidate(references.SITES, [obj['site'] for obj in objects if obj.get('site')])
+        clusters = references.invalidate(references.CLUSTERS, [obj['cluster'] for obj in objects if obj.get('cluster')])
+        site_names = {site_id: name for name, site_id in dict(references.ids[references.SITES]).items()}
+        site_names.update(sites)
+        cluster_sites = {
+            clusters[obj['cluster']]: site_names.get(obj.get('site'))
+            for obj in objects if obj.get('cluster') in clusters
+        }
+        with self.metrics.phase('referencias'):
+            references.prepare(
+                sites.values(), cluster_sites, self.config.get('default_cluster_type', 'VMware vSphere')
+            )
+
+        resolvers = (('site', sites, references.site_id), ('cluster', clusters, references.cluster_id))
+        refreshed = []
+        for obj in objects:
+            obj = dict(obj)
+            for field, names, resolve in resolvers:
+                if obj.get(field) in names:
+                    object_id = resolve(names[obj[field]])
+                    if object_id:
+                        obj[field] = object_id
+                    else:
+                        obj.pop(field)
+            refreshed.append(obj)
+        return refreshed
+
+    def transform(self, hosts: List[Tuple[str, Dict[str, Any]]]) -> List[TransformedVM]:
+        """Aplica field_mappings/status_mappings: (payload, UUID, IPs, hash) de cada host alterado.
+
+        Com o estado local, as VMs com o mesmo hash da última sincronização contam como sem
+        alteração e param aqui, sem nenhuma chamada ao NetBox; as referências (sites e
+        clusters) são resolvidas apenas para as demais.
+        """
+        entries = []
+        with self.metrics.phase('transformacao'):
+            for host_name, hostvars in hosts:
+                started = time.monotonic()
+                try:
+                    normalized = self.normalize_vm(host_name, hostvars)
+                except ValueError as e:
+                    logger.error(f"❌ {host_name}: {e}")
+                    self.stats['invalid'] += 1
+                    continue
+                uuid = hostvars.get('vm_uuid')
+                addresses = hostvars.get('vm_ip_addresses') or []
+                content_hash = SyncState.content_hash(normalized, addresses) if self.state and uuid else None
+                entries.append((host_name, hostvars, (normalized, uuid, addresses, content_hash)))
+                self.metrics.observe_vm(host_name, time.monotonic() - started)
+            entries = self._skip_unchanged(entries)
+
+        if entries:
+            self.prepare_references([(host_name, hostvars) for host_name, hostvars, _ in entries])
+        return [
+            (self.resolve_references(normalized), uuid, addresses, content_hash)
+            for _, _, (normalized, uuid, addresses, content_hash) in entries
+        ]
+
+    def _skip_unchanged(self, entries: List[Tuple[str, Dict[str, Any], TransformedVM]]
+                        ) -> List[Tuple[str, Dict[str, Any], TransformedVM]]:
+        """Descarta as VMs cujo hash é igual ao da última sincronização (exceto na verificação completa)"""
+        if not self.state or self.full_verify:
+            return entries
+        stored = self.state.hashes([item[1] for _, _, item in entries if item[3]])
+        changed = []
+        for entry in entries:
+            _, uuid, _, content_hash = entry[2]
+            if content_hash and stored.get(uuid) == content_hash:
+                with self._seen_lock:
+                    if uuid not in self._seen:
+                        self._seen.add(uuid)
+                        self.stats['unchanged'] += 1
+                        self.stats['hash_matches'] += 1
+                        continue
+            changed.append(entry)
+        return changed
+
+    def reconcile(self, items: List[TransformedVM]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Compara o inventário com o estado do NetBox: VMs a criar e apenas os campos alterados das existentes.
+
+        Pode ser chamado lote a lote; VMs repetidas são descartadas entre chamadas.
+        """
+        creates: List[Dict[str, Any]] = []
+        updates: List[Dict[str, Any]] = []
+        self._network_targets: List[Tuple[str, Optional[Dict[str, Any]], List[str]]] = []
+        update_existing = self.sync_options.get('update_existing_vms', True)
+
+        for payload, uuid, addresses, _ in items:
+            key = uuid or payload['name']
+            with self._seen_lock:
+                repeated = key in self._seen
+                self._seen.add(key)
+            if repeated:
+                logger.debug(f"⏭️  VM repetida no inventário: {payload['name']}")
+                continue
+
+            current = self._match_existing(payload, uuid)
+            self._network_targets.append((payload['name'], current, addresses))
+            if current is None:
+                creates.append(payload)
+                continue
+
+            changes = diff_vm(payload, current)
+            if not changes or not update_existing:
+                with self._seen_lock:
+                    self.stats['unchanged'] += 1
+                continue
+            logger.debug(f"✏️  {payload['name']}: {', '.join(sorted(changes))}")
+            updates.append(dict(changes, id=current['id']))
+
+        return creates, updates
+
+    def sync_network(self, created: List[Dict[str, Any]]) -> None:
+        """Interfaces e IPs das VMs do último reconcile (existentes e recém-criadas) em lote.
+
+        Interfaces e IPs existentes são lidos do NetBox apenas na primeira chamada.
+        """
+        created_ids = {vm['name']: vm['id'] for vm in created}
+        vms = []
+        for name, current, addresses in self._network_targets:
+            vm_id = current['id'] if current else created_ids.get(name)
+            if vm_id is not None:
+                vms.append((vm_id, addresses, current.get('primary_ip4') if current else None))
+        if not vms:
+            return
+
+        if self._network is None:
+            self._network = NetworkSync(
+                self.netbox, self.stats, self.batch_size, self.concurrency,
+                interface_name=self.sync_options.get('interface_name', DEFAULT_INTERFACE_NAME),
+                sync_ips=self.sync_options.get('sync_ip_addresses', True),
+                dry_run=self.dry_run
+            )
+            self._network.load()
+        self._network.sync(vms)
+
+    def skip_committed(self, number: int, hosts: List[Tuple[str, Dict[str, Any]]]) -> bool:
+        """True se o lote `number` com estas mesmas VMs já foi gravado pela execução retomada"""
+        if number not in self._committed or self._committed[number] != SyncState.batch_digest(hosts):
+            return False
+        self.stats['resumed'] += len(hosts)
+        with self._seen_lock:
+            self._seen.update(hostvars['vm_uuid'] for _, hostvars in hosts if hostvars.get('vm_uuid'))
+        logger.debug(f"⏭️  Lote {number} já gravado ({len(hosts)} VMs)")
+        return True
+
+    def commit_batch(self, number: int, hosts: List[Tuple[str, Dict[str, Any]]], created: List[Dict[str, Any]],
+                     ok: bool = True) -> None:
+        """Registra no journal o lote gravado, as VMs criadas nele e as referências resolvidas até aqui.
+
+        Um lote com falhas de gravação (`ok` False) não é registrado: --resume o processa de novo,
+        e as VMs que já tinham sido gravadas são apenas comparadas com o NetBox.
+        """
+        if not self.state or self.dry_run:
+            return
+        if not ok:
+            logger.warning(f"⚠️  Lote {number} com falhas de gravação: não registrado no journal, será refeito por --resume")
+            return
+        # Cópias: no pipeline as referências são resolvidas em outra thread
+        references = {path: dict(ids) for path, ids in list(self.references.ids.items())}
+        self.state.commit_batch(
+            number, SyncState.batch_digest(hosts), len(hosts), {vm['name']: vm['id'] for vm in created}, references
+        )
+
+    def run(self) -> Dict[str, Any]:
+        started = time.monotonic()
+        logger.info("🚀 Iniciando sincronização AWX → NetBox")
+
+        valid_hosts = []
+        with self.metrics.phase('leitura_inventario'):
+            for host_name, hostvars in self.source.hosts():
+                if self.accept_host(host_name, hostvars):
+                    valid_hosts.append((host_name, hostvars))
+        logger.info(f"📊 {self.stats['hosts_total']} hosts lidos, {len(valid_hosts)} VMs válidas")
+
+        # Cada lote do journal ocupa todas as gravações paralelas (batch_size × concurrency VMs)
+        for number, batch in enumerate(chunks(valid_hosts, self.batch_size * self.concurrency)):
+            if self.skip_committed(number, batch):
+                continue
+            created, ok = self.write_batch(self.transform(batch))
+            self.commit_batch(number, batch, created, ok)
+        if self.stats['hash_matches']:
+            logger.info(f"♻️  {self.stats['hash_matches']} VMs sem alteração desde a última sincronização")
+        self.prune()
+        return self.finish(started)
+
+    def write_batch(self, items: List[TransformedVM]) -> Tuple[List[Dict[str, Any]], bool]:
+        """Reconcilia e grava um conjunto de VMs transformadas, com a etapa de rede quando habilitada.
+
+        As VMs existentes no NetBox são lidas no primeiro lote com algo a gravar. Retorna as VMs
+        criadas e se todas as gravações do lote (VMs e rede) tiveram sucesso.
+        """
+        if not items:
+            return [], True
+        failed = self.stats['failed']
+        if self._by_name is None:
+            self.load_existing_vms()
+        with self.metrics.phase('reconciliacao'):
+            creates, updates = self.reconcile(items)
+        with self.metrics.phase('gravacao_vms'):
+            created = self._write('created', creates)
+            updated = self._write('updated', updates)
+
+        network_failed = self.stats.get('network_failed', 0)
+        if self.sync_options.get('sync_interfaces', True):
+            with self.metrics.phase('rede'):
+                self.sync_network(created)
+
+        network_ok = self.stats.get('network_failed', 0) == network_failed
+        if self.state and not self.dry_run:
+            self._record_state(items, created, updates, updated, network_ok)
+        return created, network_ok and self.stats['failed'] == failed
+
+    def _record_state(self, items: List[TransformedVM], created: List[Dict[str, Any]], updates: List[Dict[str, Any]],
+                      updated: List[Dict[str, Any]], network_ok: bool) -> None:
+        """Grava o hash das VMs gravadas com sucesso; as que falharam perdem o hash e são refeitas na próxima execução"""
+        created_names = {vm['name'] for vm in created}
+        failed_updates = {update['id'] for update in updates} - {vm['id'] for vm in updated}
+        synced: Dict[str, str] = {}
+        failed: List[str] = []
+        for payload, uuid, _, content_hash in items:
+            if not content_hash or uuid in synced:
+                continue
+            current = self._match_existing(payload, uuid)
+            if current is None:
+                ok = payload['name'] in created_names
+            else:
+                ok = current['id'] not in failed_updates
+            if ok and network_ok:
+                synced[uuid] = content_hash
+            else:
+                failed.append(uuid)
+        self.state.record(synced)
+        self.state.forget(failed)
+
+    def prune(self) -> None:
+        """Etapa de limpeza: VMs com a managed_tag no NetBox cujo vm_uuid não veio da origem.
+
+        Deve rodar só depois de uma leitura completa da origem; com a origem marcada como
+        incompleta (mark_incomplete) a etapa é ignorada e o relatório mostra `prune_skipped`.
+        As VMs gerenciadas são lidas em uma única listagem paginada (filtrada pela tag) e
+        comparadas em memória com os UUIDs lidos. As ausentes vão para `offline` em PATCH em
+        lote; com prune_action=delete, as que continuam ausentes depois de prune_grace_period
+        segundos são removidas em DELETE em lote. Se a execução alteraria mais de
+        prune_max_fraction das VMs gerenciadas, a etapa é abortada; as que já estão offline e
+        ainda não venceram a carência não contam, pois não seriam alteradas.
+        """
+        if not self.sync_options.get('prune_stale_vms', False):
+            return
+        if not self.managed_tag:
+            logger.warning("⚠️  prune_stale_vms requer sync_options.managed_tag: limpeza ignorada")
+            return
+        if self._incomplete:
+            # VMs não lidas pareceriam removidas da origem
+            logger.warning(f"⚠️  Limpeza ignorada: leitura da origem incompleta ({'; '.join(self._incomplete)})")
+            self.stats['prune_skipped'] = list(self._incomplete)
+            return
+
+        with self.metrics.phase('limpeza'):
+            params = {
+                'tag': slugify(self.managed_tag), 'limit': NETBOX_PAGE_SIZE,
+                'fields': 'id,name,status,comments,custom_fields',
+            }
+            managed: Dict[str, Dict[str, Any]] = {}
+            for vm in self.netbox.iterate(VIRTUAL_MACHINES, params):
+                uuid = self._netbox_vm_uuid(vm)
+                if uuid:
+                    managed.setdefault(uuid, vm)
+            stale = {uuid: vm for uuid, vm in managed.items() if uuid not in self._live}
+            self.stats['stale'] = len(stale)
+
+            # Desde quando cada VM está ausente (só consulta: uma limpeza abortada não registra nada);
+            # sem estado local a carência começa a cada execução
+            now = time.time()
+            since = self.state.track_stale(stale, record=False) if self.state else dict.fromkeys(stale, now)
+            deleting: List[Dict[str, Any]] = []
+            if self.sync_options.get('prune_action', 'offline') == 'delete':
+                grace = int(self.sync_options.get('prune_grace_period', 604800))
+                if grace and not self.state:
+                    logger.warning(
+                        "⚠️  prune_action=delete com prune_grace_period requer state_file: VMs apenas marcadas offline"
+                    )
+                deleting = [vm for uuid, vm in stale.items() if now - since[uuid] >= grace]
+            deleting_ids = {vm['id'] for vm in deleting}
+            offline = [
+                {'id': vm['id'], 'status': 'offline'} for vm in stale.values()
+                if vm['id'] not in deleting_ids and _comparable('status', vm.get('status')) != 'offline'
+            ]
+
+            # O limite vale para as VMs que esta execução alteraria, não para as já tratadas antes
+            changes = len(offline) + len(deleting)
+            limit = int(len(managed) * float(self.sync_options.get('prune_max_fraction', 0.1)))
+            if changes > limit:
+                logger.error(
+                    f"❌ Limpeza abortada: {changes} de {len(managed)} VMs gerenciadas seriam alteradas "
+                    f"({len(stale)} ausentes da origem; limite: {limit}, prune_max_fraction)"
+                )
+                self.stats['prune_aborted'] = True
+                return
+            if self.state and not self.dry_run:
+                self.state.track_stale(stale)
+            if not stale:
+                logger.info(f"🧹 Nenhuma VM obsoleta entre as {len(managed)} gerenciadas no NetBox")
+                return
+
+            if self.dry_run:
+                logger.info(
+                    f"🧪 [dry-run] {len(stale)} VMs obsoletas: {len(offline)} seriam marcadas offline, "
+                    f"{len(deleting)} removidas"
+                )
+                return
+            if offline:
+                written, failed = self.netbox.bulk_write('PATCH', VIRTUAL_MACHINES, offline, self.batch_size, self.concurrency)
+                self.stats['pruned_offline'] += len(written)
+                self.stats['failed'] += failed
+            if deleting:
+                calls = [{'id': vm['id']} for vm in deleting]
+                _, failed = self.netbox.bulk_write('DELETE', VIRTUAL_MACHINES, calls, self.batch_size, self.concurrency)
+                self.stats['pruned_deleted'] += len(calls) - failed
+                self.stats['failed'] += failed
+            if self.state:
+                # Uma VM que voltar à origem precisa ser regravada, mesmo com o conteúdo igual
+                self.state.forget(stale)
+        logger.info(
+            f"🧹 {len(stale)} VMs obsoletas no NetBox: {self.stats['pruned_offline']} marcadas offline, "
+            f"{self.stats['pruned_deleted']} removidas"
+        )
+
+    def finish(self, started: float, complete: bool = True) -> Dict[str, Any]:
+        """Fecha as estatísticas da execução iniciada em `started` (time.monotonic) e registra o resumo.
+
+        `complete`: todas as VMs do inventário foram processadas (o pipeline passa False quando
+        uma etapa foi interrompida); só então o journal é encerrado e uma verificação completa
+        sem falhas é registrada.
+        """
+        self.stats['duration_seconds'] = round(time.monotonic() - started, 1)
+        # Fim da execução: encerra o event loop das requisições concorrentes
+        self.netbox.close()
+        if self.references.netbox is not self.netbox:
+            self.references.netbox.close()
+        self.stats['netbox_requests'] = self.netbox.request_count
+        if self.references.netbox is not self.netbox:
+            self.stats['netbox_requests'] += self.references.netbox.request_count
+        if self.state:
+            failures = self.stats['failed'] + self.stats.get('network_failed', 0)
+            if self.full_verify and complete and not failures and not self.dry_run:
+                self.state.set('last_full_verify', time.time())
+            if complete and not self.dry_run:
+                self.state.end_journal()
+            self.state.close()
+        logger.info(
+            f"✅ Concluído em {self.stats['duration_seconds']}s: {self.stats['created']} criadas, "
+            f"{self.stats['updated']} atualizadas, {self.stats['unchanged']} sem alteração, "
+            f"{self.stats['failed'] + self.stats['invalid']} falhas, {self.stats['hosts_skipped']} ignoradas "
+            f"({self.stats['netbox_requests']} requisições ao NetBox)"
+        )
+        if self.stats['resumed']:
+            logger.info(f"⏯️  {self.stats['resumed']} VMs já gravadas pela execução interrompida")
+        return self.stats
+
+
+def write_report(config: Dict[str, Any], stats: Dict[str, Any], dry_run: bool,
+                 metrics: Optional[Dict[str, Any]] = None) -> str:
+    """Relatório JSON da execução; `metrics` é o SyncMetrics.report() (fases, requisições, VMs mais lentas)"""
+    completed_at = datetime.now(timezone.utc)
+    path = REPORT_FILE_PATTERN.format(timestamp=completed_at.strftime('%Y%m%d%H%M%S'))
+    report = {
+        'completed_at': completed_at.isoformat(),
+        'dry_run': dry_run,
+        'netbox_url': config.get('netbox_url'),
+        'inventory_id': config.get('inventory_id'),
+        'batch_size': config['sync_options']['batch_size'],
+        'stats': stats,
+    }
+    if metrics is not None:
+        report['metrics'] = metrics
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def write_metrics_textfile(path: Optional[str], text: str) -> None:
+    if not path:
+        return
+    try:
+        write_textfile(path, text)
+        logger.info(f"📈 Métricas: {path}")
+    except OSError as e:
+        logger.warning(f"⚠️  Não foi possível gravar as métricas em {path}: {e}")
+
+
+def add_journal_arguments(parser: argparse.ArgumentParser) -> None:
+    """--resume/--restart, compartilhados com o pipeline vCenter → NetBox"""
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--resume', action='store_true',
+                       help='Continua uma execução interrompida a partir do último lote gravado (requer state_file)')
+    group.add_argument('--restart', action='store_true',
+                       help='Descarta o journal de uma execução interrompida e começa do zero')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sincroniza as VMs do inventário AWX com o NetBox')
+    parser.add_argument('--config', default=os.getenv('CONFIG_FILE', DEFAULT_CONFIG_FILE),
+                        help='Arquivo de configuração JSON')
+    parser.add_argument('--inventory-file',
+                        help='JSON de `ansible-inventory --list` em vez da API do AWX')
+    parser.add_argument('--metrics-textfile', default=os.getenv('METRICS_TEXTFILE'),
+                        help='Grava as métricas da execução no formato do Prometheus (textfile collector)')
+    parser.add_argument('--full-verify', action='store_true',
+                        help='Ignora o estado local e compara todas as VMs com o NetBox')
+    add_journal_arguments(parser)
+    parser.add_argument('--dry-run', action='store_true', help='Apenas lê e mostra o que seria gravado')
+    parser.add_argument('--verbose', action='store_true', help='Log detalhado no console')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    setup_logging('DEBUG' if args.verbose else config.get('log_level', 'INFO'), os.getenv('LOG_FILE', DEFAULT_LOG_FILE))
+
+    missing = [key for key in ('netbox_url', 'netbox_token') if not config.get(key)]
+    if not args.inventory_file:
+        missing += [key for key in ('awx_url', 'awx_token', 'inventory_id') if not config.get(key)]
+    if missing:
+        logger.error(f"❌ Configuração incompleta: {', '.join(missing)}")
+        sys.exit(1)
+
+    verify_ssl = config.get('verify_ssl', False)
+    if args.inventory_file:
+        source = InventoryFileSource(args.inventory_file)
+    else:
+        source = AWXInventorySource(config['awx_url'], config['awx_token'], config['inventory_id'], verify_ssl)
+    netbox = NetBoxClient(config['netbox_url'], config['netbox_token'], verify_ssl)
+
+    sync = AWXToNetBoxSync(config, source, netbox, dry_run=args.dry_run, full_verify=args.full_verify,
+                           resume=args.resume, restart=args.restart)
+    try:
+        stats = sync.run()
+    except (NetBoxAPIError, requests.RequestException) as e:
+        logger.error(f"❌ Sincronização interrompida: {e}")
+        sys.exit(1)
+
+    logger.info(f"📄 Relatório: {write_report(config, stats, args.dry_run, sync.metrics.report())}")
+    write_metrics_textfile(args.metrics_textfile, sync.metrics.prometheus(stats))
+    sys.exit(1 if stats['failed'] or stats['invalid'] or stats.get('prune_aborted') else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Pipeline direto vCenter → NetBox, sem passar pelo inventário do AWX
+
+Usa a coleta do plugin vmware_dynamic como gerador de VMs e grava no NetBox
+com as mesmas regras de scripts/awx_to_netbox_sync.py (field_mappings,
+status_mappings, filtros e reconciliação de config/awx_netbox_sync.json),
+sem serializar o inventário no banco do AWX e sem rodar um playbook por host.
+
+Três etapas em threads, ligadas por filas limitadas:
+
+    coleta (vCenter) → transformação (lotes de batch_size) → gravação (NetBox)
+
+A coleta para quando a fila de hosts enche, então a memória fica limitada a
+algumas páginas de VMs e as primeiras gravações no NetBox acontecem enquanto
+o vCenter ainda está sendo lido. Apenas os índices do estado atual do NetBox
+(VMs, interfaces e IPs) são carregados por inteiro, uma vez, pela etapa de
+gravação. Com sync_options.prune_stale_vms, uma coleta completa termina com a
+etapa de limpeza das VMs que deixaram de existir no vCenter.
+
+Uso:
+    python3 scripts/vcenter_to_netbox_pipeline.py [--config arquivo.json] [--inventory inventory.yml]
+                                                  [--queue-size N] [--metrics-textfile arquivo.prom]
+                                                  [--full-verify] [--resume | --restart]
+                                                  [--dry-run] [--verbose]
+"""
+
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+import requests
+from ansible.parsing.dataloader import DataLoader
+from ansible.plugins.loader import inventory_loader
+
+from awx_to_netbox_sync import (
+    DEFAULT_CONFIG_FILE,
+    AWXToNetBoxSync,
+    NetBoxAPIError,
+    NetBoxClient,
+    add_journal_arguments,
+    load_config,
+    logger,
+    setup_logging,
+    write_metrics_textfile,
+    write_report,
+)
+
+
+DEFAULT_INVENTORY_FILE = 'inventory.yml'
+DEFAULT_LOG_FILE = '/tmp/vcenter_netbox_pipeline.log'
+PLUGIN_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'inventory_plugins')
+
+# Lotes transformados aguardando gravação; a fila de hosts é dimensionada pelo batch_size
+BATCH_QUEUE_SIZE = 2
+QUEUE_POLL_SECONDS = 0.5
+
+_END = object()
+
+# Contadores do vmware_dynamic que indicam VMs do vCenter ausentes da coleta
+INCOMPLETE_COLLECTION_COUNTERS = ('vm_errors', 'hosts_dropped', 'targets_failed')
+
+
+def load_collector(inventory_file: str):
+    """Instancia o vmware_dynamic com as opções do inventory.yml, sem montar um inventário Ansible"""
+    inventory_loader.add_directory(PLUGIN_DIR)
+    plugin = inventory_loader.get('vmware_dynamic')
+    plugin.loader = DataLoader()
+    plugin._read_config_data(inventory_file)
+    plugin._init_run_state()
+    return plugin
+
+
+class StreamingPipeline:
+    """Coleta, transformação e gravação em threads ligadas por filas limitadas.
+
+    Uma falha em qualquer etapa interrompe as demais; o gerador da coleta é
+    fechado, o que encerra a conexão com o vCenter.
+    """
+
+    def __init__(self, collector, targets: List[Dict[str, Any]], sync: AWXToNetBoxSync, queue_size: int):
+        self.collector = collector
+        self.targets = targets
+        self.sync = sync
+        self.hosts: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.batches: queue.Queue = queue.Queue(maxsize=BATCH_QUEUE_SIZE)
+        self._stop = threading.Event()
+        self._errors: List[Exception] = []
+
+    def _put(self, target: queue.Queue, item: Any) -> bool:
+        """Espera espaço na fila; False se o pipeline foi interrompido"""
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=QUEUE_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source: queue.Queue) -> Any:
+        while True:
+            try:
+                return source.get(timeout=QUEUE_POLL_SECONDS)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return _END
+
+    def _collect(self) -> None:
+        try:
+            owners: Dict[str, Any] = {}
+            for target in self.targets:
+                logger.info(f"🔌 Coletando {target['host']} / {target['datacenter']}")
+                # Com vários alvos, os mesmos nomes de host e grupos de origem que o inventário do plugin
+                merge = self.collector._target_merger(target, owners) if len(self.targets) > 1 else None
+                hosts = self.collector._iter_hosts(target)
+                try:
+                    # O VMRecord do plugin vai direto ao sync, sem montar um dicionário de hostvars por VM
+                    for record in hosts:
+                        if merge:
+                            merge(record)
+                        if not self._put(self.hosts, (record.inventory_hostname, record)):
+                            return
+                finally:
+                    hosts.close()
+        finally:
+            self._put(self.hosts, _END)
+
+    def _transform(self) -> None:
+        try:
+            batch: List[Tuple[str, Dict[str, Any]]] = []
+            number = 0
+            while True:
+                item = self._get(self.hosts)
+                if self._stop.is_set():
+                    return
+                if item is not _END:
+                    if self.sync.accept_host(*item):
+                        batch.append(item)
+                    if len(batch) < self.sync.batch_size:
+                        continue
+                if batch:
+                    # Lotes numerados na ordem da coleta: com --resume os já gravados são pulados
+                    if not self.sync.skip_committed(number, batch):
+                        if not self._put(self.batches, (number, batch, self.sync.transform(batch))):
+                            return
+                    number += 1
+                    batch = []
+                if item is _END:
+                    return
+        finally:
+            self._put(self.batches, _END)
+
+    def _write(self) -> None:
+        while True:
+            entry = self._get(self.batches)
+            if entry is _END:
+                return
+            number, hosts, items = entry
+            created, ok = self.sync.write_batch(items)
+            self.sync.commit_batch(number, hosts, created, ok)
+            logger.info(
+                f"📤 {self.sync.stats['hosts_total']} hosts lidos: {self.sync.stats['created']} criadas, "
+                f"{self.sync.stats['updated']} atualizadas, {self.sync.stats['unchanged']} sem alteração"
+            )
+
+    def _run_stage(self, name: str, stage) -> None:
+        try:
+            stage()
+        except Exception as e:
+            logger.error(f"❌ Etapa de {name} interrompida: {e}")
+            self._errors.append(e)
+            self._stop.set()
+
+    def run(self) -> Dict[str, Any]:
+        started = time.monotonic()
+        logger.info("🚀 Iniciando pipeline vCenter → NetBox")
+
+        threads = [
+            threading.Thread(target=self._run_stage, args=(name, stage), name=f"pipeline-{name}", daemon=True)
+            for name, stage in (('coleta', self._collect), ('transformação', self._transform), ('gravação', self._write))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        logger.info(self.collector._stats.summary(self.sync.stats['hosts_total']))
+        if not self._errors:
+            # Só uma coleta completa diz quais VMs deixaram de existir no vCenter: VMs com erro
+            # ou descartadas pelo filtro não chegam ao sync e pareceriam removidas
+            self.sync.mark_live(self.collector._failed_uuids)
+            for counter in INCOMPLETE_COLLECTION_COUNTERS:
+                if self.collector._stats.counters.get(counter):
+                    self.sync.mark_incomplete(f"{counter}={self.collector._stats.counters[counter]}")
+            self.sync.prune()
+        stats = self.sync.finish(started, complete=not self._errors)
+        if self._errors:
+            raise self._errors[0]
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sincroniza as VMs do vCenter direto com o NetBox')
+    parser.add_argument('--config', default=os.getenv('CONFIG_FILE', DEFAULT_CONFIG_FILE),
+                        help='Arquivo de configuração JSON (mesmo do awx_to_netbox_sync.py)')
+    parser.add_argument('--inventory', default=os.getenv('INVENTORY_FILE', DEFAULT_INVENTORY_FILE),
+                        help='inventory.yml com as opções do vmware_dynamic (targets, incremental...)')
+    parser.add_argument('--queue-size', type=int,
+                        help='Hosts aguardando transformação (padrão: 4 × batch_size)')
+    parser.add_argument('--metrics-textfile', default=os.getenv('METRICS_TEXTFILE'),
+                        help='Grava as métricas do vCenter e do NetBox no formato do Prometheus (textfile collector)')
+    parser.add_argument('--full-verify', action='store_true',
+                        help='Ignora o estado local e compara todas as VMs com o NetBox')
+    add_journal_arguments(parser)
+    parser.add_argument('--dry-run', action='store_true', help='Apenas lê e mostra o que seria gravado')
+    parser.add_argument('--verbose', action='store_true', help='Log detalhado no console')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    setup_logging('DEBUG' if args.verbose else config.get('log_level', 'INFO'), os.getenv('LOG_FILE', DEFAULT_LOG_FILE))
+
+    missing = [key for key in ('netbox_url', 'netbox_token') if not config.get(key)]
+    if missing:
+        logger.error(f"❌ Configuração incompleta: {', '.join(missing)}")
+        sys.exit(1)
+
+    try:
+        collector = load_collector(args.inventory)
+        targets = collector._get_targets()
+    except Exception as e:
+        logger.error(f"❌ Não foi possível configurar a coleta do vCenter: {e}")
+        sys.exit(1)
+
+    verify_ssl = config.get('verify_ssl', False)
+    netbox = NetBoxClient(config['netbox_url'], config['netbox_token'], verify_ssl)
+    sync = AWXToNetBoxSync(
+        config, None, netbox, dry_run=args.dry_run, full_verify=args.full_verify,
+        resume=args.resume, restart=args.restart,
+        reference_client=NetBoxClient(config['netbox_url'], config['netbox_token'], verify_ssl, metrics=netbox.metrics)
+    )
+    queue_size = max(args.queue_size or sync.batch_size * 4, 1)
+
+    try:
+        stats = StreamingPipeline(collector, targets, sync, queue_size).run()
+    except (NetBoxAPIError, requests.RequestException) as e:
+        logger.error(f"❌ Pipeline interrompido: {e}")
+        sys.exit(1)
+    except Exception as e:
+        logger.error(f"❌ Falha na coleta do vCenter: {e}")
+        sys.exit(1)
+
+    # Métricas do NetBox (sync) e da coleta no vCenter (vmware_dynamic) no mesmo relatório
+    vcenter_metrics = collector._stats.report(stats['hosts_total'])
+    logger.info(f"📄 Relatório: {write_report(config, stats, args.dry_run, dict(sync.metrics.report(), vcenter=vcenter_metrics))}")
+    write_metrics_textfile(
+        args.metrics_textfile,
+        sync.metrics.prometheus(stats, prefix='vcenter_netbox_pipeline') + collector._stats.prometheus(stats['hosts_total'])
+    )
+    sys.exit(1 if stats['failed'] or stats['invalid'] or stats.get('prune_aborted') else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Fixtures comuns: o sync contra o NetBox simulado dos benchmarks, sem rede"""
+import functools
+import importlib.util
+import json
+import os
+import sys
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'scripts'), os.path.join(ROOT, 'benchmarks')]
+
+import awx_to_netbox_sync as sync_module  # noqa: E402
+from fake_netbox import FakeNetBox  # noqa: E402
+
+NETBOX_URL = 'http://netbox.test'
+
+
+@functools.lru_cache(maxsize=None)
+def load_plugin():
+    """O plugin vmware_dynamic como módulo (inventory_plugins não é um pacote)"""
+    spec = importlib.util.spec_from_file_location(
+        'vmware_dynamic', os.path.join(ROOT, 'inventory_plugins', 'vmware_dynamic.py')
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class InMemoryNetBoxClient(sync_module.NetBoxClient):
+    """NetBoxClient atendido em processo pelo FakeNetBox.
+
+    `fail(method, path, payload)` simula erros: um valor verdadeiro vira um HTTP 400 (uma string
+    é usada como corpo da resposta).
+    """
+
+    def __init__(self, app=None, netbox_url=NETBOX_URL, fail=None):
+        super().__init__(netbox_url, 'token')
+        self.app = app or FakeNetBox()
+        self.fail = fail
+        self.calls = []
+
+    def request(self, method, path, params=None, payload=None):
+        url = urlsplit(path if path.startswith('http') else f"{self.api_url}{path}")
+        query = parse_qs(url.query, keep_blank_values=True)
+        query.update({key: [str(value)] for key, value in (params or {}).items()})
+        self._request_count += 1
+        self.calls.append((method, url.path))
+        error = self.fail and self.fail(method, path, payload)
+        if error:
+            raise sync_module.NetBoxAPIError(method, path, 400, error if isinstance(error, str) else 'erro simulado')
+        _, status, body = self.app.handle(method, url.path, query, payload, {}, self.netbox_url)
+        if status >= 400:
+            raise sync_module.NetBoxAPIError(method, path, status, json.dumps(body))
+        return body
+
+    def execute(self, calls, concurrency=1):
+        # Sempre sequencial: sem event loop nem aiohttp nos testes
+        return super().execute(calls, 1)
+
+    def vms(self):
+        return {vm['name']: vm for vm in self.app.objects[sync_module.VIRTUAL_MACHINES].values()}
+
+
+class ListSource:
+    """Origem com hosts fixos, como AWXInventorySource/InventoryFileSource"""
+
+    label = 'teste'
+
+    def __init__(self, hosts):
+        self._hosts = list(hosts)
+
+    def hosts(self):
+        return iter(self._hosts)
+
+
+def vm_host(index, **overrides):
+    """(nome do host, hostvars) de uma VM ligada do vmware_dynamic"""
+    hostvars = {
+        'vm_name': f"vm{index:03d}",
+        'vm_uuid': f"uuid-{index:03d}",
+        'vm_datacenter': 'DC1',
+        'vm_cluster': 'cluster1',
+        'vm_power_state': 'poweredOn',
+        'vm_cpu_count': 2,
+        'vm_memory_mb': 2048,
+        'vm_ip_addresses': [f"10.0.{index // 250}.{index % 250 + 1}"],
+    }
+    hostvars.update(overrides)
+    return hostvars['vm_name'], hostvars
+
+
+def make_config(**sync_options):
+    config = {
+        'default_cluster_type': 'VMware vSphere',
+        'sync_options': {
+            'batch_size': 10,
+            'concurrency': 1,
+            'reference_cache_file': '',
+            'state_file': '',
+            'managed_tag': 'awx-netbox-sync',
+        },
+        'field_mappings': {
+            'vm_name': 'name',
+            'vm_cpu_count': 'vcpus',
+            'vm_memory_mb': 'memory',
+            'vm_power_state': 'status',
+            'vm_cluster': 'cluster',
+            'vm_uuid': 'comments',
+        },
+        'status_mappings': {'poweredOn': 'active', 'poweredOff': 'offline'},
+        'filters': {'skip_templates': True, 'skip_localhost': True, 'required_fields': ['vm_name']},
+    }
+    config['sync_options'].update(sync_options)
+    return config
+
+
+@pytest.fixture
+def netbox():
+    return InMemoryNetBoxClient()
+
+
+@pytest.fixture
+def state_file(tmp_path):
+    return str(tmp_path / 'state.db')
+
+
+@pytest.fixture
+def run_sync(netbox):
+    """Executa uma sincronização completa de `hosts` e retorna (sync, stats)"""
+    def run(hosts, client=None, dry_run=False, full_verify=False, resume=False, restart=False, **sync_options):
+        sync = sync_module.AWXToNetBoxSync(
+            make_config(**sync_options), ListSource(hosts), client or netbox, dry_run=dry_run,
+            full_verify=full_verify, resume=resume, restart=restart
+        )
+        return sync, sync.run()
+    return run
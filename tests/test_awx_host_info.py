@@ -0,0 +1,128 @@
+"""Cache em disco das respostas do AWX (awx_host_info.AWXResponseCache), sem rede"""
+import os
+import stat
+
+import pytest
+
+import awx_host_info
+
+URL = 'https://awx.example.com/api/v2/hosts/7/'
+
+
+class _Response:
+    def __init__(self, status_code, body=None, etag=None):
+        self.status_code = status_code
+        self._body = body
+        self.headers = {'ETag': etag} if etag else {}
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        pass
+
+
+class _Session:
+    """Responde com `responses`, em ordem, e guarda os cabeçalhos de cada GET"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.sent = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.sent.append((url, headers or {}))
+        return self.responses.pop(0)
+
+
+def _client(cache, responses):
+    client = awx_host_info.AWXHostInfo('https://awx.example.com', 'user', 'secret', 3, cache=cache)
+    client.session = _Session(responses)
+    return client
+
+
+def _cache(tmp_path, ttl=300, identity='https://awx.example.com\nuser'):
+    return awx_host_info.AWXResponseCache(str(tmp_path / 'cache'), ttl, identity=identity)
+
+
+def test_fresh_entry_is_served_without_request(tmp_path):
+    client = _client(_cache(tmp_path), [_Response(200, {'id': 7}, etag='"v1"')])
+    assert client.awx_api('hosts/7/') == {'id': 7}
+    assert client.awx_api('hosts/7/') == {'id': 7}
+    assert len(client.session.sent) == 1
+
+
+def test_expired_entry_is_revalidated_with_etag(tmp_path):
+    cache = _cache(tmp_path, ttl=0)
+    client = _client(cache, [_Response(200, {'id': 7}, etag='"v1"'), _Response(304)])
+    client.awx_api('hosts/7/')
+    saved_at = cache.get(URL)['saved_at']
+
+    assert client.awx_api('hosts/7/') == {'id': 7}
+
+    assert client.session.sent[0][1] == {}
+    assert client.session.sent[1][1] == {'If-None-Match': '"v1"'}
+    # 304 renova a entrada, com o mesmo corpo e ETag
+    entry = cache.get(URL)
+    assert (entry['body'], entry['etag']) == ({'id': 7}, '"v1"')
+    assert entry['saved_at'] >= saved_at
+
+
+def test_changed_response_replaces_entry(tmp_path):
+    cache = _cache(tmp_path, ttl=0)
+    client = _client(cache, [_Response(200, {'id': 7}, etag='"v1"'), _Response(200, {'id': 7, 'x': 1}, etag='"v2"')])
+    client.awx_api('hosts/7/')
+
+    assert client.awx_api('hosts/7/') == {'id': 7, 'x': 1}
+    assert cache.get(URL)['etag'] == '"v2"'
+
+
+def test_no_etag_means_plain_request(tmp_path):
+    client = _client(_cache(tmp_path, ttl=0), [_Response(200, {'id': 7}), _Response(200, {'id': 7})])
+    client.awx_api('hosts/7/')
+    client.awx_api('hosts/7/')
+    assert client.session.sent[1][1] == {}
+
+
+def test_entries_are_scoped_by_identity(tmp_path):
+    cache = _cache(tmp_path)
+    cache.store(URL, {'id': 7}, None)
+
+    assert _cache(tmp_path).get(URL)['body'] == {'id': 7}
+    assert _cache(tmp_path, identity='https://awx.example.com\nother').get(URL) is None
+    assert _cache(tmp_path, identity='https://awx2.example.com\nuser').get(URL) is None
+
+
+def test_directory_and_files_are_private(tmp_path):
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir(mode=0o755)
+    os.chmod(cache_dir, 0o755)
+
+    _cache(tmp_path).store(URL, {'id': 7}, None)
+
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+    [entry] = os.listdir(cache_dir)
+    assert stat.S_IMODE(os.stat(cache_dir / entry).st_mode) == 0o600
+
+
+def test_directory_of_another_user_is_not_used(tmp_path, monkeypatch, capsys):
+    _cache(tmp_path).store(URL, {'id': 7}, None)
+    monkeypatch.setattr(os, 'getuid', lambda: os.stat(tmp_path).st_uid + 1)
+
+    cache = _cache(tmp_path)
+    assert cache.get(URL) is None
+    cache.store('https://awx.example.com/api/v2/hosts/8/', {'id': 8}, None)
+
+    assert len(os.listdir(tmp_path / 'cache')) == 1
+    assert 'não pertence ao usuário atual' in capsys.readouterr().err
+
+
+@pytest.mark.skipif(not hasattr(os, 'symlink'), reason='sem links simbólicos')
+def test_symlinked_directory_is_not_used(tmp_path):
+    (tmp_path / 'real').mkdir()
+    os.symlink(tmp_path / 'real', tmp_path / 'cache')
+
+    cache = _cache(tmp_path)
+    cache.store(URL, {'id': 7}, None)
+
+    assert cache.get(URL) is None
+    assert os.listdir(tmp_path / 'real') == []
@@ -0,0 +1,115 @@
+"""Cache de endpoints REST do vCenter (VCenterEndpointCache): variantes que funcionam e cache negativo"""
+import json
+import time
+
+from conftest import load_plugin
+
+VCenterEndpointCache = load_plugin().VCenterEndpointCache
+
+REST = '/rest/com/vmware/cis/session'
+API = '/api/session'
+
+
+def _cache(tmp_path, version='7.0.3', ttl=3600):
+    return VCenterEndpointCache('vc1.example.com', version, cache_dir=str(tmp_path), ttl=ttl)
+
+
+def test_negative_confirmed_when_other_variant_works(tmp_path):
+    cache = _cache(tmp_path)
+    cache.mark_failed('auth', REST, 404)
+    # Ainda não confirmado: a variante continua sendo tentada
+    assert cache.ordered('auth', [REST, API]) == [REST, API]
+
+    cache.mark_working('auth', API)
+
+    assert cache.ordered('auth', [REST, API]) == [API]
+    cache.save()
+    assert _cache(tmp_path).ordered('auth', [REST, API]) == [API]
+
+
+def test_negative_not_confirmed_without_working_variant(tmp_path):
+    cache = _cache(tmp_path)
+    cache.mark_failed('vm_tags', 'list', 403)
+    cache.mark_failed('vm_tags', 'batch', 404)
+    cache.save()
+
+    assert cache.failed == {}
+    assert _cache(tmp_path).ordered('vm_tags', ['batch', 'list']) == ['batch', 'list']
+
+
+def test_only_403_and_404_are_cached(tmp_path):
+    cache = _cache(tmp_path)
+    cache.mark_failed('auth', REST, 500)
+    cache.mark_failed('auth', REST, 401)
+    cache.mark_working('auth', API)
+    assert cache.failed == {}
+
+
+def test_working_variant_is_never_cached_as_failed(tmp_path):
+    cache = _cache(tmp_path)
+    cache.mark_working('auth', API)
+    cache.mark_failed('auth', API, 404)
+    cache.mark_working('auth', API)
+    assert cache.ordered('auth', [REST, API]) == [API, REST]
+
+
+def test_object_detail_404_is_never_cached(tmp_path):
+    # 404 de uma tag removida, seguido de outra tag encontrada pela outra variante
+    cache = _cache(tmp_path)
+    cache.mark_failed('tag_detail', '/rest/tag/id:{id}', 404)
+    cache.mark_working('tag_detail', '/api/tag/{id}')
+
+    assert cache.failed == {}
+    assert cache.ordered('tag_detail', ['/rest/tag/id:{id}', '/api/tag/{id}']) == [
+        '/api/tag/{id}', '/rest/tag/id:{id}'
+    ]
+
+
+def test_object_detail_negatives_from_old_files_are_ignored(tmp_path):
+    cache = _cache(tmp_path)
+    now = time.time()
+    with open(cache.path, 'w') as f:
+        json.dump({'working': {}, 'failed': {'tag_detail': {'/rest/tag/id:{id}': now}, 'auth': {REST: now}}}, f)
+
+    loaded = _cache(tmp_path)
+
+    assert loaded.failed == {'auth': {REST: now}}
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    cache = _cache(tmp_path)
+    cache.mark_failed('auth', REST, 404)
+    cache.mark_working('auth', API)
+    cache.save()
+
+    assert _cache(tmp_path).ordered('auth', [REST, API]) == [API]
+
+    later = time.time() + 3601
+    monkeypatch.setattr(time, 'time', lambda: later)
+    expired = _cache(tmp_path)
+    assert expired.working == {}
+    assert not expired.failed.get('auth')
+    assert expired.ordered('auth', [REST, API]) == [REST, API]
+
+
+def test_keyed_by_vcenter_version(tmp_path):
+    cache = _cache(tmp_path, version='7.0.3')
+    cache.mark_failed('auth', REST, 404)
+    cache.mark_working('auth', API)
+    cache.save()
+
+    # Depois de um upgrade do vCenter as variantes são descobertas de novo
+    upgraded = _cache(tmp_path, version='8.0.2')
+    assert upgraded.path != cache.path
+    assert upgraded.ordered('auth', [REST, API]) == [REST, API]
+    assert _cache(tmp_path, version='7.0.3').ordered('auth', [REST, API]) == [API]
+
+
+def test_save_only_when_changed(tmp_path):
+    cache = _cache(tmp_path)
+    cache.save()
+    assert not tmp_path.joinpath('endpoints_vc1.example.com_7.0.3.json').exists()
+
+    cache.mark_working('auth', API)
+    cache.save()
+    assert tmp_path.joinpath('endpoints_vc1.example.com_7.0.3.json').exists()
@@ -0,0 +1,163 @@
+"""Repetição de requisições ao NetBox e janela de concorrência AIMD, sem rede"""
+import asyncio
+
+import pytest
+from urllib3.exceptions import ReadTimeoutError
+
+from conftest import sync_module
+
+AIMDLimiter = sync_module.AIMDLimiter
+
+
+def _limiter(max_limit=16):
+    limiter = AIMDLimiter(max_limit)
+    assert limiter.limit == max_limit // 2
+    return limiter
+
+
+def _run(limiter, releases):
+    """Cada (latência, sobrecarga) ocupa e libera uma vaga da janela"""
+    async def run():
+        for latency, overloaded in releases:
+            await limiter.acquire()
+            await limiter.release(latency, overloaded)
+    asyncio.run(run())
+
+
+def test_additive_increase_on_fast_responses():
+    limiter = _limiter()
+    # ~1 vaga a mais por janela completa de respostas rápidas
+    _run(limiter, [(0.01, False)] * 8)
+    assert limiter.limit == pytest.approx(9, abs=0.1)
+    _run(limiter, [(0.01, False)] * 1000)
+    assert limiter.limit == 16
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.parametrize('release', [(0.01, True), (1.0, False)], ids=['429/5xx', 'latencia'])
+def test_multiplicative_decrease(release):
+    limiter = _limiter()
+    _run(limiter, [(0.01, False)])
+    before = limiter.limit
+
+    _run(limiter, [release])
+
+    assert limiter.limit == pytest.approx(before / 2)
+
+
+def test_burst_of_errors_halves_once_per_interval():
+    limiter = _limiter()
+    _run(limiter, [(0.01, True)] * 5)
+    assert limiter.limit == 4
+
+    # Passado o intervalo, um novo erro reduz de novo; a janela nunca fica abaixo de 1
+    for _ in range(5):
+        limiter._last_decrease = 0.0
+        _run(limiter, [(0.01, True)])
+    assert limiter.limit == 1
+
+
+def test_spike_does_not_move_baseline():
+    limiter = _limiter()
+    _run(limiter, [(0.01, False)])
+    _run(limiter, [(5.0, False)])
+    assert limiter.baseline == pytest.approx(0.01)
+
+
+def _session_retry():
+    return sync_module._retrying_session(True).get_adapter('http://netbox.test').max_retries
+
+
+@pytest.mark.parametrize('method', sync_module.IDEMPOTENT_METHODS)
+def test_sync_retry_idempotent_methods_on_5xx(method):
+    retry = _session_retry()
+    assert retry.is_retry(method, 503)
+    assert retry.is_retry(method, 429)
+    assert not retry.is_retry(method, 400)
+
+
+def test_sync_retry_post_only_on_429():
+    retry = _session_retry()
+    assert retry.is_retry('POST', 429)
+    assert not retry.is_retry('POST', 502)
+    assert not retry.is_retry('POST', 503)
+
+
+def test_sync_retry_post_read_error_is_not_repeated():
+    retry = _session_retry()
+    error = ReadTimeoutError(None, '/api/', 'timeout')
+    assert retry.increment('GET', '/api/', error=error).total == retry.total - 1
+    with pytest.raises(ReadTimeoutError):
+        retry.increment('POST', '/api/', error=error)
+
+
+class _Response:
+    def __init__(self, status):
+        self.status = status
+        self.headers = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def read(self):
+        return b'{}' if self.status < 400 else b'erro'
+
+
+class _Session:
+    """Responde com os status de `statuses`, em ordem, e registra as requisições"""
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.methods = []
+
+    def request(self, method, url, params=None, data=None):
+        self.methods.append(method)
+        return _Response(self.statuses.pop(0))
+
+
+def _async_request(monkeypatch, method, statuses):
+    pytest.importorskip('aiohttp')
+
+    async def no_sleep(delay):
+        pass
+
+    monkeypatch.setattr(sync_module.asyncio, 'sleep', no_sleep)
+    client = sync_module.AsyncNetBoxClient('http://netbox.test', 'token', concurrency=4)
+    client.limiter = AIMDLimiter(client.concurrency)
+    client.session = _Session(statuses)
+
+    async def run():
+        return await client.request(method, 'virtualization/virtual-machines/', payload=[{}])
+    try:
+        return asyncio.run(run()), client
+    except sync_module.NetBoxAPIError as e:
+        return e, client
+
+
+def test_async_post_retried_on_429(monkeypatch):
+    result, client = _async_request(monkeypatch, 'POST', [429, 429, 201])
+    assert result == {}
+    assert client.session.methods == ['POST'] * 3
+
+
+@pytest.mark.parametrize('status', [502, 503, 504])
+def test_async_post_not_retried_on_5xx(monkeypatch, status):
+    result, client = _async_request(monkeypatch, 'POST', [status, 201])
+    assert isinstance(result, sync_module.NetBoxAPIError)
+    assert client.session.methods == ['POST']
+
+
+def test_async_patch_retried_on_5xx(monkeypatch):
+    result, client = _async_request(monkeypatch, 'PATCH', [503, 502, 200])
+    assert result == {}
+    assert client.session.methods == ['PATCH'] * 3
+
+
+def test_async_gives_up_after_retries(monkeypatch):
+    statuses = [503] * (sync_module.HTTP_RETRY_TOTAL + 1)
+    result, client = _async_request(monkeypatch, 'PATCH', statuses)
+    assert isinstance(result, sync_module.NetBoxAPIError)
+    assert len(client.session.methods) == sync_module.HTTP_RETRY_TOTAL + 1
@@ -0,0 +1,183 @@
+"""Journal por lote (SyncState) e retomada de uma execução interrompida (--resume/--restart)"""
+import pytest
+
+from conftest import InMemoryNetBoxClient, ListSource, make_config, sync_module, vm_host
+
+SyncState = sync_module.SyncState
+
+
+class Interrupted(Exception):
+    pass
+
+
+def _sync(netbox, hosts, state_file, **kwargs):
+    return sync_module.AWXToNetBoxSync(make_config(state_file=state_file), ListSource(hosts), netbox, **kwargs)
+
+
+def _interrupted_run(netbox, hosts, state_file, after_batch):
+    """Execução que morre logo depois de registrar o lote `after_batch` no journal"""
+    sync = _sync(netbox, hosts, state_file)
+    commit = sync.commit_batch
+
+    def commit_then_die(number, batch, created, ok=True):
+        commit(number, batch, created, ok)
+        if number == after_batch:
+            raise Interrupted()
+
+    sync.commit_batch = commit_then_die
+    with pytest.raises(Interrupted):
+        sync.run()
+    sync.state.close()
+
+
+def _journal(state_file, api_url):
+    state = SyncState(state_file, api_url)
+    try:
+        return state.journal()
+    finally:
+        state.close()
+
+
+def test_resume_skips_committed_batches(netbox, state_file):
+    hosts = [vm_host(i) for i in range(30)]
+    _interrupted_run(netbox, hosts, state_file, after_batch=1)
+    assert sorted(_journal(state_file, netbox.api_url)['batches']) == [0, 1]
+
+    stats = _sync(netbox, hosts, state_file, resume=True).run()
+
+    assert stats['resumed'] == 20
+    assert stats['created'] == 10
+    assert len(netbox.vms()) == 30
+    # Execução concluída: nada a retomar
+    assert _journal(state_file, netbox.api_url) is None
+
+
+def test_resume_reuses_journaled_references(netbox, state_file):
+    hosts = [vm_host(i) for i in range(30)]
+    _interrupted_run(netbox, hosts, state_file, after_batch=0)
+    netbox.calls.clear()
+
+    _sync(netbox, hosts, state_file, resume=True).run()
+
+    listed = {path for method, path in netbox.calls if method == 'GET'}
+    assert '/api/dcim/sites/' not in listed
+    assert '/api/virtualization/clusters/' not in listed
+
+
+def test_changed_batch_is_processed_again(netbox, state_file):
+    hosts = [vm_host(i) for i in range(30)]
+    _interrupted_run(netbox, hosts, state_file, after_batch=1)
+
+    # Outra ordem no lote 1: o digest não confere e só o lote 0 é pulado
+    reordered = hosts[:10] + hosts[10:20][::-1] + hosts[20:]
+    stats = _sync(netbox, reordered, state_file, resume=True).run()
+
+    assert stats['resumed'] == 10
+    assert stats['unchanged'] == 10
+    assert stats['created'] == 10
+    assert len(netbox.vms()) == 30
+
+
+def test_failed_batch_is_not_committed(state_file):
+    failing = {'vm015'}
+    netbox = InMemoryNetBoxClient(fail=lambda method, path, payload: (
+        method == 'POST' and path == sync_module.VIRTUAL_MACHINES
+        and any(vm.get('name') in failing for vm in payload or [])
+    ))
+    hosts = [vm_host(i) for i in range(30)]
+    _interrupted_run(netbox, hosts, state_file, after_batch=2)
+    assert sorted(_journal(state_file, netbox.api_url)['batches']) == [0, 2]
+
+    failing.clear()
+    stats = _sync(netbox, hosts, state_file, resume=True).run()
+
+    assert stats['resumed'] == 20
+    assert stats['created'] == 10
+    assert stats['failed'] == 0
+    assert len(netbox.vms()) == 30
+
+
+@pytest.mark.parametrize('change', ['source', 'netbox', 'mapping'])
+def test_other_sync_does_not_resume(netbox, state_file, change):
+    hosts = [vm_host(i) for i in range(30)]
+    _interrupted_run(netbox, hosts, state_file, after_batch=1)
+
+    config = make_config(state_file=state_file)
+    source = ListSource(hosts)
+    if change == 'source':
+        source.label = 'outra-origem'
+    elif change == 'netbox':
+        netbox.api_url = 'http://outro-netbox.test/api/'
+    else:
+        config['field_mappings']['vm_folder'] = 'comments'
+    sync = sync_module.AWXToNetBoxSync(config, source, netbox, resume=True)
+
+    assert sync._committed == {}
+    stats = sync.run()
+    assert stats['resumed'] == 0
+
+
+def test_restart_discards_journal(netbox, state_file):
+    hosts = [vm_host(i) for i in range(30)]
+    _interrupted_run(netbox, hosts, state_file, after_batch=1)
+
+    sync = _sync(netbox, hosts, state_file, restart=True)
+    assert sync._committed == {}
+    assert _journal(state_file, netbox.api_url)['batches'] == {}
+    assert sync.run()['resumed'] == 0
+
+
+def test_plain_run_starts_over(netbox, state_file):
+    hosts = [vm_host(i) for i in range(30)]
+    _interrupted_run(netbox, hosts, state_file, after_batch=1)
+
+    stats = _sync(netbox, hosts, state_file).run()
+
+    assert stats['resumed'] == 0
+    assert stats['created'] == 10
+
+
+def test_dry_run_does_not_touch_journal(netbox, state_file):
+    hosts = [vm_host(i) for i in range(30)]
+    _interrupted_run(netbox, hosts, state_file, after_batch=1)
+
+    sync = _sync(netbox, hosts, state_file, dry_run=True, resume=True)
+    assert sync._committed == {}
+    sync.run()
+    assert sorted(_journal(state_file, netbox.api_url)['batches']) == [0, 1]
+
+
+def test_sync_state_journal_roundtrip(tmp_path):
+    path = str(tmp_path / 'state.db')
+    state = SyncState(path, 'http://a/api/')
+    assert state.journal() is None
+
+    state.begin_journal('fp')
+    hosts = [vm_host(i) for i in range(3)]
+    state.commit_batch(0, SyncState.batch_digest(hosts), 3, {'vm000': 1}, {'dcim/sites/': {'DC1': 7}})
+    journal = state.journal()
+    assert journal['fingerprint'] == 'fp'
+    assert journal['batches'] == {0: SyncState.batch_digest(hosts)}
+    assert (journal['vms'], journal['created']) == (3, 1)
+    assert journal['references'] == {'dcim/sites/': {'DC1': 7}}
+
+    state.end_journal()
+    assert state.journal() is None
+    state.close()
+
+
+def test_batch_digest_depends_on_order_and_identity():
+    hosts = [vm_host(i) for i in range(3)]
+    assert SyncState.batch_digest(hosts) == SyncState.batch_digest(list(hosts))
+    assert SyncState.batch_digest(hosts) != SyncState.batch_digest(hosts[::-1])
+    # Sem vm_uuid, o nome do host identifica a VM
+    assert SyncState.batch_digest([('a', {})]) != SyncState.batch_digest([('b', {})])
+
+
+def test_other_netbox_discards_journal(tmp_path):
+    path = str(tmp_path / 'state.db')
+    state = SyncState(path, 'http://a/api/')
+    state.begin_journal('fp')
+    state.close()
+
+    assert _journal(path, 'http://b/api/') is None
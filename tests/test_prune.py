@@ -0,0 +1,167 @@
+"""Etapa de limpeza (prune): VMs gerenciadas que deixaram de vir da origem"""
+import sqlite3
+
+from conftest import ListSource, make_config, sync_module, vm_host
+
+PRUNE = {'prune_stale_vms': True, 'prune_max_fraction': 0.5}
+
+
+def _status(vm):
+    return sync_module._comparable('status', vm['status'])
+
+
+def test_offline_marks_only_missing_vms(netbox, run_sync):
+    hosts = [vm_host(i) for i in range(10)]
+    run_sync(hosts)
+
+    _, stats = run_sync(hosts[:8], **PRUNE)
+
+    vms = netbox.vms()
+    assert stats['stale'] == 2
+    assert stats['pruned_offline'] == 2
+    assert {name for name, vm in vms.items() if _status(vm) == 'offline'} == {'vm008', 'vm009'}
+    assert len(vms) == 10
+
+
+def test_template_hosts_still_count_as_live(netbox, run_sync):
+    hosts = [vm_host(i) for i in range(10)]
+    run_sync(hosts)
+
+    templated = hosts[:9] + [vm_host(9, vm_template=True)]
+    _, stats = run_sync(templated, **PRUNE)
+
+    assert stats['stale'] == 0
+    assert _status(netbox.vms()['vm009']) == 'active'
+
+
+def test_delete_waits_for_grace_period(netbox, run_sync, state_file):
+    hosts = [vm_host(i) for i in range(10)]
+    options = dict(PRUNE, prune_action='delete', prune_grace_period=3600, state_file=state_file)
+    run_sync(hosts, **options)
+
+    # Primeira ausência: apenas offline, e a carência começa a contar em stale_vms
+    _, stats = run_sync(hosts[:9], **options)
+    assert stats['pruned_offline'] == 1
+    assert stats['pruned_deleted'] == 0
+    with sqlite3.connect(state_file) as db:
+        assert [row[0] for row in db.execute('SELECT vm_uuid FROM stale_vms')] == ['uuid-009']
+        db.execute('UPDATE stale_vms SET missing_since = missing_since - 7200')
+
+    _, stats = run_sync(hosts[:9], **options)
+    assert stats['pruned_deleted'] == 1
+    assert 'vm009' not in netbox.vms()
+
+
+def test_returning_vm_leaves_stale_list(netbox, run_sync, state_file):
+    hosts = [vm_host(i) for i in range(10)]
+    options = dict(PRUNE, prune_action='delete', prune_grace_period=3600, state_file=state_file)
+    run_sync(hosts, **options)
+    run_sync(hosts[:9], **options)
+
+    _, stats = run_sync(hosts, **options)
+
+    assert stats['stale'] == 0
+    with sqlite3.connect(state_file) as db:
+        assert db.execute('SELECT COUNT(*) FROM stale_vms').fetchone()[0] == 0
+    # Sem hash (forget na limpeza), a VM que voltou é regravada como ativa
+    assert _status(netbox.vms()['vm009']) == 'active'
+
+
+def test_delete_without_state_requires_zero_grace(netbox, run_sync):
+    hosts = [vm_host(i) for i in range(10)]
+    run_sync(hosts)
+
+    _, stats = run_sync(hosts[:9], prune_action='delete', prune_grace_period=3600, **PRUNE)
+    assert (stats['pruned_offline'], stats['pruned_deleted']) == (1, 0)
+
+    _, stats = run_sync(hosts[:9], prune_action='delete', prune_grace_period=0, **PRUNE)
+    assert stats['pruned_deleted'] == 1
+    assert 'vm009' not in netbox.vms()
+
+
+def test_aborts_above_max_fraction(netbox, run_sync, state_file):
+    hosts = [vm_host(i) for i in range(20)]
+    run_sync(hosts, state_file=state_file)
+
+    _, stats = run_sync(hosts[:17], prune_stale_vms=True, prune_max_fraction=0.1, state_file=state_file)
+
+    assert stats['prune_aborted'] is True
+    assert stats['pruned_offline'] == 0
+    assert all(_status(vm) == 'active' for vm in netbox.vms().values())
+    # Uma limpeza abortada não começa a contar a carência
+    with sqlite3.connect(state_file) as db:
+        assert db.execute('SELECT COUNT(*) FROM stale_vms').fetchone()[0] == 0
+
+
+def test_already_offline_vms_do_not_count_against_max_fraction(netbox, run_sync):
+    hosts = [vm_host(i) for i in range(20)]
+    run_sync(hosts)
+    # 2 VMs já marcadas offline por uma limpeza anterior
+    run_sync(hosts[:18], prune_stale_vms=True, prune_max_fraction=0.1)
+
+    # 2 já offline + 2 novas ausências: só as 2 novas seriam alteradas (limite: 2)
+    _, stats = run_sync(hosts[:16], prune_stale_vms=True, prune_max_fraction=0.1)
+
+    assert stats['stale'] == 4
+    assert 'prune_aborted' not in stats
+    assert stats['pruned_offline'] == 2
+    assert sum(_status(vm) == 'offline' for vm in netbox.vms().values()) == 4
+
+
+def test_untagged_and_unidentified_vms_are_never_touched(netbox, run_sync):
+    hosts = [vm_host(i) for i in range(10)]
+    run_sync(hosts)
+    tag_id = next(iter(netbox.app.objects['extras/tags/']))
+    netbox.bulk_create(sync_module.VIRTUAL_MACHINES, [
+        # Criada fora do sync: sem a tag gerenciada
+        {'name': 'manual', 'status': 'active', 'comments': 'vm_uuid: uuid-manual'},
+        # Com a tag, mas sem UUID legível
+        {'name': 'sem-uuid', 'status': 'active', 'comments': 'criada à mão', 'tags': [{'id': tag_id}]},
+    ])
+
+    _, stats = run_sync(hosts, **PRUNE)
+
+    vms = netbox.vms()
+    assert stats['stale'] == 0
+    assert _status(vms['manual']) == 'active'
+    assert _status(vms['sem-uuid']) == 'active'
+
+
+def test_dry_run_changes_nothing(netbox, run_sync):
+    hosts = [vm_host(i) for i in range(10)]
+    run_sync(hosts)
+
+    _, stats = run_sync(hosts[:9], dry_run=True, **PRUNE)
+
+    assert stats['stale'] == 1
+    assert _status(netbox.vms()['vm009']) == 'active'
+
+
+def test_incomplete_source_skips_prune(netbox, run_sync):
+    hosts = [vm_host(i) for i in range(10)]
+    run_sync(hosts)
+
+    partial = [vm_host(i, vmware_dynamic_targets_failed=['vc2/DC2']) for i in range(5)]
+    _, stats = run_sync(partial, **PRUNE)
+
+    assert stats['prune_skipped'] == ['alvos com falha no inventário: vc2/DC2']
+    assert stats['pruned_offline'] == 0
+    assert all(_status(vm) == 'active' for vm in netbox.vms().values())
+
+
+def test_mark_incomplete_and_mark_live(netbox, run_sync):
+    hosts = [vm_host(i) for i in range(10)]
+    run_sync(hosts)
+
+    sync = sync_module.AWXToNetBoxSync(make_config(**PRUNE), ListSource(hosts[:8]), netbox)
+    for host_name, hostvars in hosts[:8]:
+        sync.accept_host(host_name, hostvars)
+    # VM com erro na coleta, mas com UUID lido: continua viva
+    sync.mark_live(['uuid-008', None])
+    sync.prune()
+    assert sync.stats['stale'] == 1
+
+    sync.mark_incomplete('vm_errors=1')
+    sync.mark_incomplete('vm_errors=1')
+    sync.prune()
+    assert sync.stats['prune_skipped'] == ['vm_errors=1']
@@ -0,0 +1,80 @@
+"""Comparação com o NetBox: diff_vm e identificação das VMs existentes por UUID"""
+from conftest import sync_module, vm_host
+
+diff_vm = sync_module.diff_vm
+
+
+def _vms_named(netbox, name):
+    return [vm for vm in netbox.app.objects[sync_module.VIRTUAL_MACHINES].values() if vm['name'] == name]
+
+
+def _existing(netbox, name, comments, **fields):
+    netbox.bulk_create(sync_module.VIRTUAL_MACHINES, [dict(
+        {'name': name, 'status': 'active', 'vcpus': 1, 'memory': 1024, 'comments': comments}, **fields
+    )])
+
+
+def test_diff_vm_compares_netbox_representation():
+    current = {
+        'name': 'vm', 'status': {'value': 'active', 'label': 'Active'}, 'site': {'id': 3, 'name': 'DC1'},
+        'vcpus': '2.00', 'memory': 2048,
+    }
+    assert diff_vm({'name': 'vm', 'status': 'active', 'site': 3, 'vcpus': 2, 'memory': 2048}, current) == {}
+    assert diff_vm({'status': 'offline', 'vcpus': 4, 'memory': 2048}, current) == {'status': 'offline', 'vcpus': 4}
+
+
+def test_diff_vm_only_adds_tags():
+    current = {'tags': [{'id': 1, 'name': 'manual'}, {'id': 2, 'name': 'awx-netbox-sync'}]}
+    assert diff_vm({'tags': [{'id': 2}]}, current) == {}
+    assert diff_vm({'tags': [{'id': 5}]}, current) == {'tags': [{'id': 1}, {'id': 2}, {'id': 5}]}
+
+
+def test_diff_vm_custom_fields_keep_others():
+    current = {'custom_fields': {'vm_uuid': 'a', 'owner': 'ops'}}
+    assert diff_vm({'custom_fields': {'vm_uuid': 'a'}}, current) == {}
+    assert diff_vm({'custom_fields': {'vm_uuid': 'b'}}, current) == {'custom_fields': {'vm_uuid': 'b'}}
+
+
+def test_renamed_vm_is_matched_by_uuid(netbox, run_sync):
+    run_sync([vm_host(1)])
+
+    _, stats = run_sync([vm_host(1, vm_name='app01-novo')])
+
+    assert (stats['created'], stats['updated']) == (0, 1)
+    assert set(netbox.vms()) == {'app01-novo'}
+
+
+def test_same_name_with_other_uuid_is_another_vm(netbox, run_sync):
+    _existing(netbox, 'vm001', 'vm_uuid: uuid-outro-vcenter')
+
+    _, stats = run_sync([vm_host(1)])
+
+    assert (stats['created'], stats['updated']) == (1, 0)
+    vms = _vms_named(netbox, 'vm001')
+    assert len(vms) == 2
+    assert any(vm['comments'] == 'vm_uuid: uuid-outro-vcenter' and vm['vcpus'] == 1 for vm in vms)
+
+
+def test_name_fallback_for_vm_without_uuid(netbox, run_sync):
+    _existing(netbox, 'vm001', 'criada à mão')
+
+    _, stats = run_sync([vm_host(1)])
+
+    assert (stats['created'], stats['updated']) == (0, 1)
+    [vm] = _vms_named(netbox, 'vm001')
+    assert 'vm_uuid: uuid-001' in vm['comments']
+    assert vm['vcpus'] == 2
+
+
+def test_uuid_custom_field(netbox, run_sync):
+    _existing(netbox, 'vm001', '', custom_fields={'vm_uuid': 'uuid-outro'})
+    _existing(netbox, 'antigo', '', custom_fields={'vm_uuid': 'uuid-002'})
+    options = {'uuid_custom_field': 'vm_uuid'}
+
+    _, stats = run_sync([vm_host(1), vm_host(2)], **options)
+
+    assert (stats['created'], stats['updated']) == (1, 1)
+    assert len(_vms_named(netbox, 'vm001')) == 2
+    assert _vms_named(netbox, 'antigo') == []
+    [vm] = _vms_named(netbox, 'vm002')
+    assert vm['custom_fields'] == {'vm_uuid': 'uuid-002'}
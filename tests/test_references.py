@@ -0,0 +1,99 @@
+"""Referências (sites e clusters) por ID: cache em disco e IDs recusados pelo NetBox"""
+import json
+
+from conftest import sync_module, vm_host
+
+ReferenceResolver = sync_module.ReferenceResolver
+
+SITES = ReferenceResolver.SITES
+CLUSTERS = ReferenceResolver.CLUSTERS
+
+
+def _id(netbox, path, name):
+    return next(obj['id'] for obj in netbox.app.objects[path].values() if obj['name'] == name)
+
+
+def _delete(netbox, path, name):
+    """Remove o objeto; como no NetBox, as VMs que apontavam para ele ficam sem a referência"""
+    object_id = _id(netbox, path, name)
+    del netbox.app.objects[path][object_id]
+    field = 'site' if path == SITES else 'cluster'
+    for vm in netbox.app.objects[sync_module.VIRTUAL_MACHINES].values():
+        if vm.get(field) == object_id:
+            vm[field] = None
+
+
+def _vm(netbox, name):
+    return netbox.app.objects[sync_module.VIRTUAL_MACHINES][netbox.vms()[name]['id']]
+
+
+def test_deleted_site_and_cluster_from_cache_are_resolved_again(netbox, run_sync, tmp_path):
+    cache_file = str(tmp_path / 'references.json')
+    run_sync([vm_host(0)], reference_cache_file=cache_file)
+    old_site = _id(netbox, SITES, 'DC1')
+    _delete(netbox, CLUSTERS, 'cluster1')
+    _delete(netbox, SITES, 'DC1')
+
+    # O cache ainda tem os IDs antigos: o POST é recusado, as referências são recriadas e o lote repetido
+    _, stats = run_sync([vm_host(0), vm_host(1)], reference_cache_file=cache_file)
+
+    # vm000 ficou sem site/cluster no NetBox: o PATCH montado com os IDs antigos também é refeito
+    assert (stats['created'], stats['updated'], stats['failed']) == (1, 1, 0)
+    site, cluster = _id(netbox, SITES, 'DC1'), _id(netbox, CLUSTERS, 'cluster1')
+    assert site != old_site
+    for name in ('vm000', 'vm001'):
+        assert (_vm(netbox, name)['site'], _vm(netbox, name)['cluster']) == (site, cluster)
+    assert netbox.app.objects[CLUSTERS][cluster]['site'] == site
+    with open(cache_file) as f:
+        assert json.load(f)['ids'][SITES] == {'DC1': site}
+
+
+def test_rejected_update_is_resolved_again(netbox, run_sync, tmp_path):
+    cache_file = str(tmp_path / 'references.json')
+    run_sync([vm_host(0), vm_host(1, vm_cluster='cluster2')], reference_cache_file=cache_file)
+    _delete(netbox, CLUSTERS, 'cluster2')
+
+    _, stats = run_sync([vm_host(0, vm_cluster='cluster2'), vm_host(1, vm_cluster='cluster2')],
+                        reference_cache_file=cache_file)
+
+    assert (stats['updated'], stats['failed']) == (2, 0)
+    cluster = _id(netbox, CLUSTERS, 'cluster2')
+    assert _vm(netbox, 'vm000')['cluster'] == cluster
+    assert _vm(netbox, 'vm001')['cluster'] == cluster
+
+
+def test_rejected_reference_is_retried_once(netbox, run_sync):
+    rejection = json.dumps([{'site': ['Related object not found using the provided numeric ID: 1']}])
+    netbox.fail = lambda method, path, payload: method == 'POST' and path == sync_module.VIRTUAL_MACHINES and rejection
+
+    _, stats = run_sync([vm_host(0)])
+
+    assert (stats['created'], stats['failed']) == (0, 1)
+    posts = [call for call in netbox.calls if call == ('POST', '/api/virtualization/virtual-machines/')]
+    assert len(posts) == 2
+
+
+def test_other_errors_are_not_retried(netbox, run_sync):
+    rejection = json.dumps([{'name': ['Virtual machine with this name already exists.']}])
+    netbox.fail = lambda method, path, payload: method == 'POST' and path == sync_module.VIRTUAL_MACHINES and rejection
+
+    _, stats = run_sync([vm_host(0)])
+
+    assert stats['failed'] == 1
+    posts = [call for call in netbox.calls if call == ('POST', '/api/virtualization/virtual-machines/')]
+    assert len(posts) == 1
+
+
+def test_invalidate_forces_new_listing(netbox):
+    resolver = ReferenceResolver(netbox)
+    resolver.prepare(['DC1', 'DC2'], {}, 'VMware vSphere')
+    dc1 = resolver.site_id('DC1')
+    netbox.calls.clear()
+
+    assert resolver.invalidate(SITES, [dc1, 999]) == {dc1: 'DC1'}
+    assert resolver.site_id('DC1') is None
+    assert resolver.site_id('DC2') is not None
+
+    resolver.prepare(['DC1'], {}, 'VMware vSphere')
+    assert resolver.site_id('DC1') == dc1
+    assert ('GET', '/api/dcim/sites/') in netbox.calls
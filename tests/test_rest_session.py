@@ -0,0 +1,51 @@
+"""Repetição das chamadas REST ao vCenter: só consultas, e POST apenas nas ações de tagging"""
+import pytest
+import requests
+
+from conftest import load_plugin
+
+vmware_dynamic = load_plugin()
+
+VCENTER = 'vc1.example.com'
+
+
+def _retry(url):
+    session = vmware_dynamic._configure_rest_pool(requests.Session(), VCENTER, 8)
+    return session.get_adapter(f"https://{VCENTER}{url}").max_retries
+
+
+@pytest.mark.parametrize('url', [
+    '/rest/com/vmware/cis/tagging/tag-association?~action=list-attached-objects-on-tags',
+    '/api/cis/tagging/tag-association?action=list-attached-tags-on-objects',
+])
+def test_tagging_actions_retry_post(url):
+    retry = _retry(url)
+    assert retry.is_retry('POST', 503)
+    assert retry.is_retry('GET', 429)
+
+
+@pytest.mark.parametrize('url', ['/rest/com/vmware/cis/session', '/api/session'])
+def test_session_create_and_delete_are_not_retried(url):
+    retry = _retry(url)
+    assert not retry.is_retry('POST', 503)
+    assert not retry.is_retry('POST', 429)
+    assert not retry.is_retry('DELETE', 503)
+
+
+def test_other_urls_retry_only_reads():
+    retry = _retry('/rest/vcenter/vm/vm-42/tags')
+    assert retry.is_retry('GET', 503)
+    assert not retry.is_retry('POST', 503)
+    assert not retry.is_retry('GET', 500)
+
+
+def test_tagging_prefix_is_per_vcenter():
+    session = vmware_dynamic._configure_rest_pool(requests.Session(), VCENTER, 8)
+    other = session.get_adapter('https://vc2.example.com/api/cis/tagging/tag').max_retries
+    assert not other.is_retry('POST', 503)
+
+
+def test_pool_sized_by_workers():
+    session = vmware_dynamic._configure_rest_pool(requests.Session(), VCENTER, 8)
+    assert session.get_adapter(f"https://{VCENTER}/api/session")._pool_maxsize == 8
+    assert session.get_adapter(f"https://{VCENTER}/api/cis/tagging/tag")._pool_maxsize == 8
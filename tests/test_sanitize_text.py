@@ -0,0 +1,32 @@
+"""Corpus de referência da sanitização de strings do vmware_dynamic.
+
+As saídas esperadas em data/sanitize_text_golden.json foram geradas pela implementação
+anterior (sequência de re.sub/str.replace); _sanitize_text deve reproduzi-las byte a byte.
+"""
+import json
+import os
+
+import pytest
+
+from conftest import ROOT, load_plugin
+
+GOLDEN_FILE = os.path.join(ROOT, 'tests', 'data', 'sanitize_text_golden.json')
+
+vmware_dynamic = load_plugin()
+
+with open(GOLDEN_FILE, encoding='utf-8') as f:
+    GOLDEN = json.load(f)
+
+
+@pytest.mark.parametrize('entry', GOLDEN, ids=[entry['case'] for entry in GOLDEN])
+def test_sanitize_text_matches_golden(entry):
+    assert vmware_dynamic._sanitize_text(entry['input']) == entry['expected']
+    # Segunda chamada vem do lru_cache
+    assert vmware_dynamic._sanitize_text(entry['input']) == entry['expected']
+
+
+def test_sanitize_string_keeps_non_strings():
+    plugin = vmware_dynamic.InventoryModule()
+    assert plugin._sanitize_string(None) is None
+    assert plugin._sanitize_string(4) == 4
+    assert plugin._sanitize_string(['a:b']) == ['a:b']
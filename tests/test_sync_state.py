@@ -0,0 +1,160 @@
+"""Estado local por vm_uuid (SyncState): VMs sem alteração são puladas sem chamadas ao NetBox"""
+import time
+
+from conftest import InMemoryNetBoxClient, sync_module, vm_host
+
+SyncState = sync_module.SyncState
+
+
+def _writes(netbox):
+    return [(method, path) for method, path in netbox.calls if method in ('POST', 'PATCH', 'DELETE')]
+
+
+def _hashes(state_file, api_url, uuids):
+    state = SyncState(state_file, api_url)
+    try:
+        return state.hashes(uuids)
+    finally:
+        state.close()
+
+
+def _meta(state_file, api_url, key):
+    state = SyncState(state_file, api_url)
+    try:
+        return state.get(key)
+    finally:
+        state.close()
+
+
+def _set_meta(state_file, api_url, key, value):
+    state = SyncState(state_file, api_url)
+    state.set(key, value)
+    state.close()
+
+
+def _edit_in_netbox(netbox, name, **fields):
+    netbox.vms()[name].update(fields)
+
+
+def test_unchanged_vms_are_skipped_by_hash(netbox, run_sync, state_file):
+    hosts = [vm_host(i) for i in range(20)]
+    _, stats = run_sync(hosts, state_file=state_file)
+    assert stats['created'] == 20
+    netbox.calls.clear()
+
+    changed = hosts[:19] + [vm_host(19, vm_cpu_count=8)]
+    _, stats = run_sync(changed, state_file=state_file)
+
+    assert stats['hash_matches'] == 19
+    assert stats['unchanged'] == 19
+    assert stats['updated'] == 1
+    assert _writes(netbox) == [('PATCH', '/api/virtualization/virtual-machines/')]
+    assert netbox.vms()['vm019']['vcpus'] == 8
+
+
+def test_hash_skip_ignores_edits_made_in_netbox(netbox, run_sync, state_file):
+    hosts = [vm_host(i) for i in range(5)]
+    run_sync(hosts, state_file=state_file)
+    _edit_in_netbox(netbox, 'vm003', vcpus=64)
+
+    _, stats = run_sync(hosts, state_file=state_file)
+    assert stats['hash_matches'] == 5
+    assert netbox.vms()['vm003']['vcpus'] == 64
+
+    # --full-verify compara tudo com o NetBox e desfaz a edição
+    _, stats = run_sync(hosts, state_file=state_file, full_verify=True)
+    assert stats['hash_matches'] == 0
+    assert stats['updated'] == 1
+    assert netbox.vms()['vm003']['vcpus'] == 2
+
+
+def test_full_verify_interval(netbox, run_sync, state_file):
+    hosts = [vm_host(i) for i in range(5)]
+    # Estado novo: a primeira execução já é uma verificação completa
+    sync, stats = run_sync(hosts, state_file=state_file, full_verify_interval=3600)
+    assert sync.full_verify is True
+    assert float(_meta(state_file, netbox.api_url, 'last_full_verify')) > time.time() - 60
+
+    sync, _ = run_sync(hosts, state_file=state_file, full_verify_interval=3600)
+    assert sync.full_verify is False
+
+    # Última verificação completa há mais de full_verify_interval segundos
+    _set_meta(state_file, netbox.api_url, 'last_full_verify', time.time() - 7200)
+    _edit_in_netbox(netbox, 'vm001', vcpus=64)
+    sync, stats = run_sync(hosts, state_file=state_file, full_verify_interval=3600)
+    assert sync.full_verify is True
+    assert stats['updated'] == 1
+
+    # full_verify_interval=0 desliga a verificação periódica
+    _set_meta(state_file, netbox.api_url, 'last_full_verify', 0)
+    sync, _ = run_sync(hosts, state_file=state_file, full_verify_interval=0)
+    assert sync.full_verify is False
+
+
+def test_failed_full_verify_is_not_recorded(run_sync, state_file):
+    hosts = [vm_host(i) for i in range(5)]
+    netbox = InMemoryNetBoxClient(fail=lambda method, path, payload: method == 'POST' and path == sync_module.VIRTUAL_MACHINES)
+
+    sync, stats = run_sync(hosts, client=netbox, state_file=state_file)
+
+    assert sync.full_verify is True
+    assert stats['failed'] == 5
+    assert _meta(state_file, netbox.api_url, 'last_full_verify') is None
+
+
+def test_other_netbox_discards_hashes(netbox, run_sync, state_file):
+    hosts = [vm_host(i) for i in range(5)]
+    run_sync(hosts, state_file=state_file)
+    uuids = [hostvars['vm_uuid'] for _, hostvars in hosts]
+    assert len(_hashes(state_file, netbox.api_url, uuids)) == 5
+
+    # Mesmo arquivo de estado apontado para outro NetBox (mesmo conteúdo, outra URL)
+    other = InMemoryNetBoxClient(app=netbox.app, netbox_url='http://outro-netbox.test')
+    _, stats = run_sync(hosts, client=other, state_file=state_file, full_verify_interval=0)
+
+    assert stats['hash_matches'] == 0
+    assert stats['unchanged'] == 5
+    # Os hashes agora valem para o novo NetBox
+    assert len(_hashes(state_file, other.api_url, uuids)) == 5
+
+
+def test_failed_update_drops_hash(netbox, run_sync, state_file):
+    hosts = [vm_host(i) for i in range(5)]
+    run_sync(hosts, state_file=state_file)
+    target = netbox.vms()['vm002']['id']
+    netbox.fail = lambda method, path, payload: (
+        method == 'PATCH' and any(update['id'] == target for update in payload or [])
+    )
+
+    # Lotes de uma VM: só o PATCH da vm002 falha
+    changed = [vm_host(i, vm_cpu_count=4) for i in range(5)]
+    _, stats = run_sync(changed, state_file=state_file, full_verify_interval=0, batch_size=1)
+    assert (stats['updated'], stats['failed']) == (4, 1)
+    assert set(_hashes(state_file, netbox.api_url, ['uuid-000', 'uuid-002'])) == {'uuid-000'}
+
+    # Sem hash, a VM que falhou é refeita na próxima execução mesmo sem mudança na origem
+    netbox.fail = None
+    _, stats = run_sync(changed, state_file=state_file, full_verify_interval=0)
+    assert (stats['hash_matches'], stats['updated']) == (4, 1)
+    assert netbox.vms()['vm002']['vcpus'] == 4
+    assert 'uuid-002' in _hashes(state_file, netbox.api_url, ['uuid-002'])
+
+
+def test_failed_create_leaves_no_hash(run_sync, state_file):
+    netbox = InMemoryNetBoxClient(fail=lambda method, path, payload: (
+        method == 'POST' and path == sync_module.VIRTUAL_MACHINES
+        and any(vm.get('name') == 'vm001' for vm in payload or [])
+    ))
+    hosts = [vm_host(i) for i in range(3)]
+    run_sync(hosts, client=netbox, state_file=state_file, batch_size=1)
+
+    assert set(_hashes(state_file, netbox.api_url, ['uuid-000', 'uuid-001', 'uuid-002'])) == {'uuid-000', 'uuid-002'}
+
+
+def test_content_hash_ignores_key_and_address_order():
+    payload = {'name': 'vm', 'vcpus': 2, 'memory': 2048}
+    reordered = {'memory': 2048, 'vcpus': 2, 'name': 'vm'}
+    assert SyncState.content_hash(payload, ['10.0.0.1', '10.0.0.2']) == \
+        SyncState.content_hash(reordered, ['10.0.0.2', '10.0.0.1'])
+    assert SyncState.content_hash(payload, ['10.0.0.1']) != SyncState.content_hash(payload, ['10.0.0.2'])
+
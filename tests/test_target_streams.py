@@ -0,0 +1,147 @@
+"""Coleta de vários alvos: _ordered_streams (geradores em paralelo, consumidos em ordem) e _target_merger"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import load_plugin
+
+vmware_dynamic = load_plugin()
+_ordered_streams = vmware_dynamic._ordered_streams
+
+
+def _factory(name, count, delay=0.0, closed=None, fail_at=None):
+    """Fábrica de um gerador com `count` itens; registra em `closed` quando o gerador é fechado"""
+    def generate():
+        try:
+            for index in range(count):
+                if index == fail_at:
+                    raise RuntimeError(f"{name} falhou")
+                time.sleep(delay)
+                yield f"{name}-{index}"
+        finally:
+            if closed is not None:
+                closed.add(name)
+    return generate
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_streams_follow_factory_order(workers):
+    # O último alvo é o mais rápido: mesmo assim sai por último
+    factories = [_factory('a', 5, delay=0.005), _factory('b', 3, delay=0.002), _factory('c', 4)]
+
+    items = [item for stream in _ordered_streams(factories, workers) for item in stream]
+
+    assert items == [f"a-{i}" for i in range(5)] + [f"b-{i}" for i in range(3)] + [f"c-{i}" for i in range(4)]
+
+
+def test_streams_run_in_parallel():
+    started = []
+    barrier = threading.Barrier(3, timeout=5)
+
+    def factory(name):
+        def generate():
+            started.append(name)
+            barrier.wait()  # só passa se os três geradores estiverem rodando ao mesmo tempo
+            yield name
+        return generate
+
+    streams = _ordered_streams([factory('a'), factory('b'), factory('c')], 3)
+    assert [item for stream in streams for item in stream] == ['a', 'b', 'c']
+    assert sorted(started) == ['a', 'b', 'c']
+
+
+def test_error_is_raised_in_its_own_stream():
+    factories = [_factory('a', 3), _factory('b', 3, fail_at=1), _factory('c', 2)]
+    results = []
+    for stream in _ordered_streams(factories, 3):
+        try:
+            results.extend(stream)
+        except RuntimeError as e:
+            results.append(str(e))
+
+    assert results == ['a-0', 'a-1', 'a-2', 'b-0', 'b falhou', 'c-0', 'c-1']
+
+
+def test_factory_error_is_raised_in_its_stream():
+    def broken():
+        raise ValueError('sem conexão')
+
+    streams = _ordered_streams([_factory('a', 2), broken], 2)
+    assert list(next(streams)) == ['a-0', 'a-1']
+    with pytest.raises(ValueError, match='sem conexão'):
+        list(next(streams))
+
+
+def test_early_stop_closes_every_generator():
+    closed = set()
+    factories = [_factory(name, 1000, delay=0.001, closed=closed) for name in 'abc']
+
+    streams = _ordered_streams(factories, 3)
+    first = next(streams)
+    assert [next(first) for _ in range(3)] == ['a-0', 'a-1', 'a-2']
+    streams.close()
+
+    # close() só retorna depois que os produtores pararam e fecharam seus geradores
+    assert closed == {'a', 'b', 'c'}
+
+
+def _merger(host, datacenter, owners):
+    plugin = vmware_dynamic.InventoryModule()
+    return plugin._target_merger({'host': host, 'datacenter': datacenter}, owners)
+
+
+def _merge(merge, name):
+    record = SimpleNamespace(inventory_hostname=name, source_groups=None)
+    merge(record)
+    return record
+
+
+def test_merger_keeps_unique_names_and_sets_groups():
+    record = _merge(_merger('VC1.example.com', 'DC-Sul', {}), 'web01')
+    assert record.inventory_hostname == 'web01'
+    assert record.source_groups == ('vcenter_vc1_example_com', 'datacenter_dc_sul')
+
+
+def test_merger_collision_suffixes():
+    owners = {}
+    merges = [
+        _merger('vc1.example.com', 'DC1', owners),
+        _merger('vc1.example.com', 'DC2', owners),
+        _merger('vc2.example.com', 'DC1', owners),
+        _merger('vc3.example.com', 'DC1', owners),
+    ]
+
+    names = [_merge(merge, 'web01').inventory_hostname for merge in merges]
+
+    # Primeiro o sufixo do datacenter; se também já tiver dono, vCenter e datacenter
+    assert names == ['web01', 'web01_dc2', 'web01_dc1', 'web01_vc3_example_com_dc1']
+    assert owners == {
+        'web01': ('vc1.example.com', 'DC1'),
+        'web01_dc2': ('vc1.example.com', 'DC2'),
+        'web01_dc1': ('vc2.example.com', 'DC1'),
+        'web01_vc3_example_com_dc1': ('vc3.example.com', 'DC1'),
+    }
+
+
+def test_merger_same_source_keeps_name():
+    owners = {}
+    merge = _merger('vc1.example.com', 'DC1', owners)
+    assert _merge(merge, 'web01').inventory_hostname == 'web01'
+    assert _merge(merge, 'web01').inventory_hostname == 'web01'
+
+
+def test_merger_result_follows_target_order_not_completion():
+    # Alvo 1 lento e alvo 2 rápido, com a mesma VM: o nome sem sufixo fica com o alvo 1
+    targets = [('vc1.example.com', 'DC1', 0.01), ('vc2.example.com', 'DC2', 0.0)]
+    owners = {}
+    factories = [_factory(host, 2, delay=delay) for host, _, delay in targets]
+
+    names = []
+    for (host, datacenter, _), stream in zip(targets, _ordered_streams(factories, 2)):
+        merge = _merger(host, datacenter, owners)
+        for item in stream:
+            names.append(_merge(merge, item.split('-')[-1]).inventory_hostname)
+
+    assert names == ['0', '1', '0_dc2', '1_dc2']